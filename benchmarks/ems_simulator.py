@@ -0,0 +1,231 @@
+"""
+Local stand-in for an EMS-ESP gateway: `GET /api/<device>/info` for the
+boiler, thermostat and mixer and `POST /api/<device>` commands, with
+configurable latency, limited concurrency like the ESP32, error injection
+and payload shapes.
+
+    python -m benchmarks.ems_simulator [--port 18080] [--latency 0.05] [--error-rate 0.1] [--shape flat]
+"""
+import asyncio
+import random
+from argparse import ArgumentParser
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import ujson
+from aiohttp import web
+
+# EMS-ESP 3.7 nests the DHW values under "dhw", older versions report them flat with a "dhw" prefix
+SHAPES = ("nested", "flat")
+
+
+class SimulatedGateway:
+    def __init__(
+        self,
+        access_token: Optional[str] = None,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        concurrency: int = 2,
+        error_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        trickle: float = 0.0,
+        shape: str = "nested",
+        extra_fields: int = 80,
+        missing_fields: tuple = (),
+        circuits: tuple = ("hc1", "hc2"),
+        seed: int = 0,
+    ):
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown payload shape {shape}, expected one of {SHAPES}")
+
+        # seconds per request, spent while holding one of the `concurrency` slots
+        self.latency = latency
+        self.jitter = jitter
+        self.concurrency = concurrency
+        # probability of a 500, of never answering and of closing the connection without a response
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.drop_rate = drop_rate
+        # seconds between the chunks of a response body sent a few bytes at a time, 0 sends it at once
+        self.trickle = trickle
+        self.access_token = access_token
+        self.shape = shape
+        # unrelated values the real gateway reports as well, they make up most of the payload
+        self.extra_fields = extra_fields
+        self.missing_fields = set(missing_fields)
+        self.circuits = circuits
+
+        self.outside_temperature = 5.0
+        self.selected_flow_temperature = 40
+        self.current_flow_temperature = 38.5
+        self.random = random.Random(seed)
+
+        self.requests: Counter = Counter()
+        self.writes: Dict[str, Any] = {}
+        self.active = 0
+        self.max_active = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._runner: Optional[web.AppRunner] = None
+
+    def reset_counters(self):
+        self.requests.clear()
+        self.max_active = self.active
+
+    def boiler_payload(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "heating active": "on",
+            "selected flow temperature": self.selected_flow_temperature,
+            "heating pump modulation": 60,
+            "outside temperature": round(self.outside_temperature, 1),
+            "current flow temperature": round(self.current_flow_temperature, 1),
+            "flame current": 4.2,
+            "heating pump": "on",
+            "service code number": 203,
+            "service code": "0H",
+            "maintenance message": "H00",
+        }
+        dhw = {
+            "selected temperature": 52,
+            "current intern temperature": 49.8,
+            "charging": "off",
+            "dhw active": "off",
+        }
+        if self.shape == "nested":
+            payload["dhw"] = dhw
+        else:
+            payload.update({f"dhw {key}": value for key, value in dhw.items()})
+        payload.update({f"value {index}": index * 0.5 for index in range(self.extra_fields)})
+        for field in self.missing_fields:
+            payload.pop(field, None)
+        return payload
+
+    def thermostat_payload(self) -> Dict[str, Any]:
+        return {
+            circuit: {"selected room temperature": 20.5, "current room temperature": 20.1, "mode": "auto"}
+            for circuit in self.circuits
+        }
+
+    def mixer_payload(self) -> Dict[str, Any]:
+        return {
+            circuit: {"flow temperature hc": self.current_flow_temperature - 4, "pump status": "on", "valve status": 40}
+            for circuit in self.circuits
+        }
+
+    def _step(self):
+        # slow weather drift, the flow follows the selected temperature
+        self.outside_temperature += self.random.uniform(-0.2, 0.2)
+        self.current_flow_temperature += (self.selected_flow_temperature - self.current_flow_temperature) * 0.3
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.requests[f"{request.method} {request.path}"] += 1
+        if self.access_token is not None and request.headers.get("Authorization") != f"Bearer {self.access_token}":
+            return web.json_response({"message": "Unauthorized"}, status=401)
+
+        async with self._slots:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                response = await self._respond(request)
+                if self.trickle > 0 and isinstance(response, web.Response) and response.body:
+                    return await self._send_slowly(request, response)
+                return response
+            finally:
+                self.active -= 1
+
+    async def _send_slowly(self, request: web.Request, response: web.Response) -> web.StreamResponse:
+        # every read sees new bytes within `trickle` seconds, only a limit on the whole request catches this
+        body = bytes(response.body)  # type: ignore
+        stream = web.StreamResponse(status=response.status, headers={"Content-Type": response.content_type})
+        stream.content_length = len(body)
+        await stream.prepare(request)
+        for start in range(0, len(body), 16):
+            await stream.write(body[start : start + 16])
+            await asyncio.sleep(self.trickle)
+        await stream.write_eof()
+        return stream
+
+    async def _respond(self, request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        fault = self.random.random()
+        if fault < self.hang_rate:
+            # the client has to time out
+            await asyncio.sleep(3600)
+        fault -= self.hang_rate
+        if fault < self.drop_rate:
+            request.transport.close()  # type: ignore
+            return web.Response()
+        fault -= self.drop_rate
+        if fault < self.error_rate:
+            return web.json_response({"message": "Internal Server Error"}, status=500)
+
+        device = request.match_info["device"]
+        if request.method == "POST":
+            command = await request.json(loads=ujson.loads)
+            self.writes[command["cmd"]] = command["data"]
+            if device == "boiler" and command["cmd"] == "selflowtemp":
+                self.selected_flow_temperature = command["data"]
+            return web.json_response({"message": "OK"})
+
+        self._step()
+        payloads = {"boiler": self.boiler_payload, "thermostat": self.thermostat_payload, "mixer": self.mixer_payload}
+        if device not in payloads:
+            return web.json_response({"message": f"Unknown device {device}"}, status=400)
+        return web.json_response(payloads[device](), dumps=ujson.dumps)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 18080) -> str:
+        app = web.Application()
+        app.router.add_get("/api/{device}/info", self._handle)
+        app.router.add_post("/api/{device}", self._handle)
+        self._runner = web.AppRunner(app, handle_signals=False)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        # port 0 picks a free one
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        return f"http://{host}:{port}/"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def serve(params):
+    gateway = SimulatedGateway(
+        access_token=params.access_token,
+        latency=params.latency,
+        concurrency=params.concurrency,
+        error_rate=params.error_rate,
+        hang_rate=params.hang_rate,
+        drop_rate=params.drop_rate,
+        trickle=params.trickle,
+        shape=params.shape,
+    )
+    url = await gateway.start(port=params.port)
+    print(f"Simulating an EMS-ESP gateway on {url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await gateway.stop()
+
+
+def add_arguments(parser: ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--concurrency", type=int, default=2, help="requests the gateway handles at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a 500 response")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="probability of never responding")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="probability of closing the connection")
+    parser.add_argument("--trickle", type=float, default=0.0, help="seconds between 16 byte chunks of a response")
+    parser.add_argument("--shape", choices=SHAPES, default="nested", help="DHW values nested or flat")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--access-token", default=None, help="require this bearer token")
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
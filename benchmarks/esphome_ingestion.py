@@ -0,0 +1,115 @@
+"""
+Connect `ESPHomeDevice`s to a simulated fleet (`benchmarks.esphome_simulator`,
+run in a subprocess so its CPU time is not counted) and report connect and
+reconnect times, ingestion throughput and CPU time per state update.
+
+    python -m benchmarks.esphome_ingestion [--devices 50] [--sensors 20] [--rate 50] [--duration 10]
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import List
+
+from benchmarks.esphome_simulator import add_arguments
+from src.integrations.esphome.utils.device import ESPHomeDevice
+from src.integrations.esphome.utils.entity_cache import EntityCache
+from src.integrations.esphome.utils.entity_table import EntityTable
+from src.integrations.esphome.utils.fanout import StateFanout
+from src.integrations.esphome.utils.fleet import DeviceFleet
+
+
+async def wait_connected(devices: List[ESPHomeDevice], timeout: float = 60.0) -> float:
+    start = time.perf_counter()
+    while not all(device.is_connected and device.is_initialized for device in devices):
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError(f"{sum(device.is_connected for device in devices)}/{len(devices)} devices connected")
+        await asyncio.sleep(0.005)
+    return time.perf_counter() - start
+
+
+async def main(params):
+    simulator = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "benchmarks.esphome_simulator",
+        *("--devices", str(params.devices), "--sensors", str(params.sensors)),
+        *("--switches", str(params.switches), "--rate", str(params.rate), "--base-port", str(params.base_port)),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    await simulator.stdout.readline()  # type: ignore
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.ERROR)
+    table = EntityTable()
+    fanout = StateFanout(logger)
+    delivered = 0
+
+    def count(entity_id: str, value: float, timestamp: float):
+        nonlocal delivered
+        delivered += 1
+
+    fanout.listeners.append(count)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        cache = EntityCache(data_dir)
+        await cache.initialize()
+        devices = [
+            ESPHomeDevice(
+                logger,
+                "127.0.0.1",
+                None,
+                port=params.base_port + index,
+                entity_cache=cache,
+                entity_table=table,
+                fanout=fanout,
+            )
+            for index in range(params.devices)
+        ]
+        fleet = DeviceFleet(devices, logger, max_concurrency=params.max_concurrency, reboot_delay=0.0)
+
+        try:
+            fleet.tick()
+            connect_time = await wait_connected(devices)
+            print(
+                f"connect    {params.devices} devices x {params.sensors + params.switches} entities "
+                f"in {connect_time * 1000:8.1f} ms (entities listed)"
+            )
+
+            await asyncio.sleep(0.5)
+            changes = int(table.changes[: len(table)].sum())
+            published, delivered = fanout.published, 0
+            cpu, wall = time.process_time(), time.perf_counter()
+            await asyncio.sleep(params.duration)
+            cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+            updates = int(table.changes[: len(table)].sum()) - changes
+            expected = params.devices * params.rate * wall
+            print(
+                f"ingest     {updates / wall:10.0f} updates/s ({updates / expected:.0%} of the simulated rate), "
+                f"{cpu / max(updates, 1) * 1e6:6.1f} µs CPU per update, "
+                f"{fanout.published - published} published, {delivered} delivered after coalescing"
+            )
+
+            # drop all connections at once, the fleet reconnects them through the disconnect callbacks
+            start = time.perf_counter()
+            await asyncio.gather(*(device.disconnect() for device in devices))
+            reconnect_time = await wait_connected(devices)
+            print(
+                f"reconnect  {params.devices} devices in {reconnect_time * 1000:8.1f} ms "
+                f"(entities from cache, {(time.perf_counter() - start) * 1000:.1f} ms including disconnect)"
+            )
+        finally:
+            await fleet.close()
+            simulator.terminate()
+            await simulator.wait()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--duration", type=float, default=10, help="seconds of ingestion to measure")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="concurrent connects of the fleet")
+    parser.set_defaults(devices=50, rate=50)
+    asyncio.run(main(parser.parse_args()))
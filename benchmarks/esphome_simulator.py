@@ -0,0 +1,263 @@
+"""
+Local stand-in for a fleet of ESPHome devices speaking the plaintext native
+API: handshake, device_info, entity listing, state streaming, pings and
+switch commands. Every device listens on its own port.
+
+    python -m benchmarks.esphome_simulator [--devices 10] [--sensors 20] [--switches 2] [--rate 10]
+"""
+import asyncio
+import random
+from argparse import ArgumentParser
+from typing import Dict, List, Optional, Set
+
+from aioesphomeapi import api_pb2
+from aioesphomeapi.core import MESSAGE_TYPE_TO_PROTO
+from google.protobuf import message
+
+MESSAGE_TYPES = {proto: message_type for message_type, proto in MESSAGE_TYPE_TO_PROTO.items()}
+API_VERSION = (1, 10)
+# states are sent in batches every tick, like the devices flush their send buffer
+TICK = 0.01
+
+
+def _varuint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def frame(msg: message.Message) -> bytes:
+    payload = msg.SerializeToString()
+    return b"\x00" + _varuint(len(payload)) + _varuint(MESSAGE_TYPES[type(msg)]) + payload
+
+
+class _Connection(asyncio.Protocol):
+    def __init__(self, device: "SimulatedDevice"):
+        self.device = device
+        self.transport: Optional[asyncio.Transport] = None
+        self.subscribed = False
+        self._buffer = bytearray()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore
+        self.device.connections.add(self)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.device.connections.discard(self)
+
+    def send(self, *messages: message.Message) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(b"".join(frame(msg) for msg in messages))
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        while True:
+            parsed = self._parse()
+            if parsed is None:
+                return
+            message_type, payload = parsed
+            proto = MESSAGE_TYPE_TO_PROTO.get(message_type)
+            if proto is not None:
+                msg = proto()
+                msg.ParseFromString(payload)
+                self.device.handle(self, msg)
+
+    def _parse(self):
+        position = 1
+        if not self._buffer:
+            return None
+        if self._buffer[0] != 0:
+            # encrypted clients are not supported
+            self.transport.close()  # type: ignore
+            return None
+
+        values = []
+        for _ in range(2):
+            value = shift = 0
+            while True:
+                if position >= len(self._buffer):
+                    return None
+                byte = self._buffer[position]
+                position += 1
+                value |= (byte & 0x7F) << shift
+                shift += 7
+                if not byte & 0x80:
+                    break
+            values.append(value)
+
+        length, message_type = values
+        if len(self._buffer) < position + length:
+            return None
+        payload = bytes(self._buffer[position : position + length])
+        del self._buffer[: position + length]
+        return message_type, payload
+
+
+class SimulatedDevice:
+    def __init__(
+        self,
+        name: str,
+        port: int,
+        sensors: int,
+        switches: int,
+        rate: float,
+        compilation_time: str = "Jan  1 2024, 00:00:00",
+        host: str = "127.0.0.1",
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.compilation_time = compilation_time
+        self.mac_address = ":".join(f"{b:02X}" for b in random.Random(name).randbytes(6))
+
+        self.sensor_keys = list(range(1, sensors + 1))
+        self.switch_keys = list(range(sensors + 1, sensors + switches + 1))
+        self.values: Dict[int, float] = {key: 20.0 + key % 10 for key in self.sensor_keys}
+        self.switch_states: Dict[int, bool] = {key: False for key in self.switch_keys}
+
+        self.connections: Set[_Connection] = set()
+        self.sent_states = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stream_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: _Connection(self), self.host, self.port)
+        self._stream_task = asyncio.create_task(self._stream())
+
+    async def stop(self):
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+        if self._server is not None:
+            self._server.close()
+        for connection in list(self.connections):
+            connection.transport.close()  # type: ignore
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    def drop_connections(self):
+        """
+        Close all client connections without a disconnect request, like a Wi-Fi blip.
+        """
+        for connection in list(self.connections):
+            connection.transport.abort()  # type: ignore
+
+    def handle(self, connection: _Connection, msg: message.Message) -> None:
+        if isinstance(msg, api_pb2.HelloRequest):
+            connection.send(
+                api_pb2.HelloResponse(
+                    api_version_major=API_VERSION[0],
+                    api_version_minor=API_VERSION[1],
+                    server_info="fourteen simulator",
+                    name=self.name,
+                )
+            )
+        elif isinstance(msg, api_pb2.DeviceInfoRequest):
+            connection.send(
+                api_pb2.DeviceInfoResponse(
+                    name=self.name,
+                    mac_address=self.mac_address,
+                    esphome_version="2024.1.0",
+                    compilation_time=self.compilation_time,
+                    model="simulator",
+                )
+            )
+        elif isinstance(msg, api_pb2.ListEntitiesRequest):
+            connection.send(
+                *[
+                    api_pb2.ListEntitiesSensorResponse(
+                        object_id=f"sensor_{key}", key=key, name=f"Sensor {key}", unit_of_measurement="°C"
+                    )
+                    for key in self.sensor_keys
+                ],
+                *[
+                    api_pb2.ListEntitiesSwitchResponse(object_id=f"switch_{key}", key=key, name=f"Switch {key}")
+                    for key in self.switch_keys
+                ],
+                api_pb2.ListEntitiesDoneResponse(),
+            )
+        elif isinstance(msg, api_pb2.SubscribeStatesRequest):
+            connection.subscribed = True
+            connection.send(
+                *[api_pb2.SensorStateResponse(key=key, state=value) for key, value in self.values.items()],
+                *[api_pb2.SwitchStateResponse(key=key, state=state) for key, state in self.switch_states.items()],
+            )
+        elif isinstance(msg, api_pb2.SwitchCommandRequest):
+            self.switch_states[msg.key] = msg.state
+            self._broadcast([api_pb2.SwitchStateResponse(key=msg.key, state=msg.state)])
+        elif isinstance(msg, api_pb2.PingRequest):
+            connection.send(api_pb2.PingResponse())
+        elif isinstance(msg, api_pb2.DisconnectRequest):
+            connection.send(api_pb2.DisconnectResponse())
+            connection.transport.close()  # type: ignore
+
+    def _broadcast(self, messages: List[message.Message]):
+        for connection in self.connections:
+            if connection.subscribed:
+                connection.send(*messages)
+
+    async def _stream(self):
+        # sensor updates per tick, the fractional part carries over
+        budget = 0.0
+        while True:
+            await asyncio.sleep(TICK)
+            if not self.sensor_keys or not any(connection.subscribed for connection in self.connections):
+                continue
+
+            budget += self.rate * TICK
+            count, budget = int(budget), budget - int(budget)
+            messages = []
+            for key in random.choices(self.sensor_keys, k=count):
+                # random walk so that every update is a change
+                self.values[key] += random.uniform(-0.05, 0.05) or 0.01
+                messages.append(api_pb2.SensorStateResponse(key=key, state=self.values[key]))
+            self.sent_states += len(messages)
+            self._broadcast(messages)
+
+
+async def start_fleet(
+    devices: int, sensors: int, switches: int, rate: float, base_port: int = 16053, host: str = "127.0.0.1"
+) -> List[SimulatedDevice]:
+    """
+    Start `devices` simulated devices on consecutive ports, each streaming
+    `rate` sensor updates per second spread over its sensors.
+    """
+    fleet = [
+        SimulatedDevice(f"sim-{index:03d}", base_port + index, sensors, switches, rate, host=host)
+        for index in range(devices)
+    ]
+    await asyncio.gather(*(device.start() for device in fleet))
+    return fleet
+
+
+async def serve(params):
+    fleet = await start_fleet(params.devices, params.sensors, params.switches, params.rate, params.base_port)
+    print(
+        f"Simulating {params.devices} devices on ports {params.base_port}-{params.base_port + params.devices - 1}",
+        flush=True,
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await asyncio.gather(*(device.stop() for device in fleet))
+
+
+def add_arguments(parser: ArgumentParser):
+    parser.add_argument("--devices", type=int, default=10, help="number of simulated devices")
+    parser.add_argument("--sensors", type=int, default=20, help="sensors per device")
+    parser.add_argument("--switches", type=int, default=2, help="switches per device")
+    parser.add_argument("--rate", type=float, default=10, help="sensor updates per second per device")
+    parser.add_argument("--base-port", type=int, default=16053, help="port of the first device")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
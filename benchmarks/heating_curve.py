@@ -0,0 +1,119 @@
+"""
+Replay a weather series through the heating curve with the vectorized
+simulator (`src.integrations.heating.utils.heating_curve`), compare it with a
+per-sample evaluation like `HeatingIntegration.calculate_supply_temperature`
+and report the evaluation time.
+
+    python -m benchmarks.heating_curve [--days 365] [--step 60] [--timezone Europe/Berlin]
+    python -m benchmarks.heating_curve --history-dir data/history [--entity boiler.outside_temperature]
+"""
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+from src.integrations.heating.integration import State
+from src.integrations.heating.utils.heating_curve import simulate, synthetic_weather
+from src.integrations.history.utils.query import resample, time_grid
+from src.integrations.history.utils.segments import SegmentStore
+
+DEFAULT_STATE = State(
+    heating_active=True,
+    heating_curve_inclination=1.1,
+    heating_curve_parallel_shift=0.0,
+    heating_curve_max_supply_temperature=50,
+    heating_curve_min_supply_temperature=30,
+    heating_curve_target_room_temperature=20.0,
+    heating_curve_target_night_room_temperature=17.5,
+    heating_curve_day_start_hour=6,
+    heating_curve_day_start_minute=0,
+    heating_curve_day_end_hour=22,
+    heating_curve_day_end_minute=0,
+)
+
+
+def reference(timestamp: float, outside_temperature: float, state: State, timezone) -> int:
+    # the scalar evaluation of the integration, one sample at a time
+    now = datetime.fromtimestamp(timestamp, timezone)
+    target_room_temperature = state.heating_curve_target_room_temperature
+    if (
+        now.hour < state.heating_curve_day_start_hour
+        or now.hour > state.heating_curve_day_end_hour
+        or (now.hour == state.heating_curve_day_start_hour and now.minute < state.heating_curve_day_start_minute)
+        or (now.hour == state.heating_curve_day_end_hour and now.minute > state.heating_curve_day_end_minute)
+    ):
+        target_room_temperature = state.heating_curve_target_night_room_temperature
+
+    dar = outside_temperature - target_room_temperature
+    supply_temperature = (
+        target_room_temperature
+        + state.heating_curve_parallel_shift
+        - state.heating_curve_inclination * dar * (1.4347 + 0.021 * dar + 247.9 * 10**-6 * dar**2)
+    )
+    if supply_temperature < state.heating_curve_min_supply_temperature:
+        return state.heating_curve_min_supply_temperature
+    if supply_temperature > state.heating_curve_max_supply_temperature:
+        return state.heating_curve_max_supply_temperature
+    return round(supply_temperature)
+
+
+def main(params):
+    timezone = pytz.timezone(params.timezone)
+
+    if params.history_dir is not None:
+        recorded_timestamps, recorded_values = SegmentStore(params.history_dir).entity(params.entity).window()
+        if len(recorded_timestamps) == 0:
+            raise SystemExit(f"No history recorded for {params.entity} in {params.history_dir}")
+        timestamps = time_grid(recorded_timestamps[0], recorded_timestamps[-1], params.step)
+        outside_temperature = resample(recorded_timestamps, recorded_values, timestamps, max_gap=params.max_gap)
+        print(f"replaying  {len(timestamps)} samples of {params.entity}, {np.isnan(outside_temperature).sum()} gaps")
+    else:
+        start = datetime(2023, 1, 1, tzinfo=pytz.utc).timestamp()
+        timestamps, outside_temperature = synthetic_weather(start, params.days, params.step)
+        print(f"synthetic  {len(timestamps)} samples, {params.days} days every {params.step:g} s")
+
+    # warm up numpy and the timezone lookups
+    simulate(timestamps[:1000], outside_temperature[:1000], DEFAULT_STATE, timezone)
+
+    runs = []
+    for _ in range(params.repeat):
+        start_time = time.perf_counter()
+        supply_temperature = simulate(timestamps, outside_temperature, DEFAULT_STATE, timezone)
+        runs.append(time.perf_counter() - start_time)
+    best = min(runs)
+    print(f"vectorized {best * 1000:8.1f} ms ({best / len(timestamps) * 1e9:5.1f} ns per sample, best of {len(runs)})")
+
+    rng = np.random.default_rng(0)
+    known = np.flatnonzero(~np.isnan(outside_temperature))
+    sample = rng.choice(known, size=min(params.compare, len(known)), replace=False)
+    start_time = time.perf_counter()
+    expected = np.array([reference(timestamps[i], outside_temperature[i], DEFAULT_STATE, timezone) for i in sample])
+    scalar = (time.perf_counter() - start_time) / max(len(sample), 1)
+    mismatches = int((expected != supply_temperature[sample]).sum())
+    print(
+        f"scalar     {scalar * len(timestamps) * 1000:8.1f} ms extrapolated ({scalar * 1e9:5.0f} ns per sample), "
+        f"{mismatches} of {len(sample)} compared samples differ"
+    )
+
+    hours = params.step / 3600
+    supplied = supply_temperature[~np.isnan(supply_temperature)]
+    print(
+        f"timeline   mean {supplied.mean():.1f}°C, "
+        f"{(supplied == DEFAULT_STATE.heating_curve_min_supply_temperature).sum() * hours:.0f} h at minimum, "
+        f"{(supplied == DEFAULT_STATE.heating_curve_max_supply_temperature).sum() * hours:.0f} h at maximum"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--days", type=float, default=365, help="days of synthetic weather")
+    parser.add_argument("--step", type=float, default=60, help="seconds between samples")
+    parser.add_argument("--timezone", default="Europe/Berlin")
+    parser.add_argument("--history-dir", help="replay a recorded series from this history directory instead")
+    parser.add_argument("--entity", default="boiler.outside_temperature", help="recorded outside temperature")
+    parser.add_argument("--max-gap", type=float, default=3600, help="seconds without samples treated as a gap")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", type=int, default=20000, help="samples to compare with the scalar evaluation")
+    main(parser.parse_args())
@@ -0,0 +1,130 @@
+"""
+Search heating curve parameters on a recorded (or synthetic) season with a
+process pool, print the Pareto front and propose the most balanced candidate
+as `state_overrides` for the heating integration.
+
+    python -m benchmarks.heating_curve_sweep [--search random] [--count 2000] [--objective energy --objective underheat]
+    python -m benchmarks.heating_curve_sweep --history-dir data/history [--reference boiler.current_flow_temperature]
+
+Without a history directory the reference is the curve of a hidden state plus
+noise, the front should contain candidates close to it.
+"""
+import dataclasses
+import os
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+import numpy as np
+import pytz
+import yaml
+
+from benchmarks.heating_curve import DEFAULT_STATE
+from src.integrations.heating.utils.curve_sweep import OBJECTIVES, PARAMETERS, grid, random_candidates, sweep
+from src.integrations.heating.utils.heating_curve import simulate, synthetic_weather, target_room_temperatures
+from src.integrations.history.utils.query import resample, time_grid
+from src.integrations.history.utils.segments import SegmentStore
+
+BOUNDS = {
+    "heating_curve_inclination": (0.4, 2.0),
+    "heating_curve_parallel_shift": (-5.0, 5.0),
+    "heating_curve_min_supply_temperature": (20, 35),
+    "heating_curve_max_supply_temperature": (40, 60),
+}
+GRID = {
+    "heating_curve_inclination": np.round(np.arange(0.4, 2.01, 0.1), 2),
+    "heating_curve_parallel_shift": np.arange(-5.0, 5.01, 1.0),
+    "heating_curve_min_supply_temperature": [20, 25, 30, 35],
+    "heating_curve_max_supply_temperature": [40, 45, 50, 55, 60],
+}
+HIDDEN_STATE = dataclasses.replace(
+    DEFAULT_STATE,
+    heating_curve_inclination=0.9,
+    heating_curve_parallel_shift=2.0,
+    heating_curve_min_supply_temperature=28,
+    heating_curve_max_supply_temperature=48,
+)
+
+
+def load_inputs(params, timezone):
+    if params.history_dir is not None:
+        store = SegmentStore(params.history_dir)
+        timestamps, values = store.entity(params.entity).window()
+        if len(timestamps) == 0:
+            raise SystemExit(f"No history recorded for {params.entity} in {params.history_dir}")
+        grid_timestamps = time_grid(timestamps[0], timestamps[-1], params.step)
+        outside_temperature = resample(timestamps, values, grid_timestamps, max_gap=params.max_gap)
+        reference_timestamps, reference_values = store.entity(params.reference).window()
+        reference = resample(reference_timestamps, reference_values, grid_timestamps, max_gap=params.max_gap)
+        if np.isnan(reference).all():
+            reference = None
+        timestamps = grid_timestamps
+    else:
+        start = datetime(2023, 1, 1, tzinfo=pytz.utc).timestamp()
+        timestamps, outside_temperature = synthetic_weather(start, params.days, params.step)
+        reference = simulate(timestamps, outside_temperature, HIDDEN_STATE, timezone)
+        reference += np.random.default_rng(1).normal(0, 1.0, len(reference))
+
+    return {
+        "timestamps": timestamps,
+        "outside_temperature": outside_temperature,
+        # the schedule is not swept, it comes from the current state
+        "target_room_temperature": target_room_temperatures(timestamps, DEFAULT_STATE, timezone).astype(np.float64),
+        "reference": reference,
+    }
+
+
+def main(params):
+    timezone = pytz.timezone(params.timezone)
+    inputs = load_inputs(params, timezone)
+    objectives = params.objective or (["energy", "underheat"] if inputs["reference"] is not None else ["energy"])
+
+    if params.search == "grid":
+        candidates = grid(GRID)
+    else:
+        candidates = random_candidates(BOUNDS, params.count, seed=params.seed)
+
+    workers = params.workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    result = sweep(candidates, inputs, objectives, workers=workers)
+    duration = time.perf_counter() - start_time
+    print(
+        f"sweep      {len(candidates)} candidates x {len(inputs['timestamps'])} samples on {workers} workers "
+        f"in {duration:.2f} s ({len(candidates) / duration:.0f} candidates/s)"
+    )
+
+    front = result.front[np.argsort(result.scores[result.front, 0])]
+    print(f"front      {len(front)} of {len(candidates)} candidates")
+    header = ["incl", "shift", "min", "max"] + result.objectives
+    print("  ".join(f"{column:>10}" for column in header))
+    for index in front[: params.show]:
+        print("  ".join(f"{value:>10.3g}" for value in [*result.candidates[index], *result.scores[index]]))
+
+    # most balanced candidate: smallest sum of the objectives normalized to the front's range
+    scores = result.scores[front]
+    spread = np.ptp(scores, axis=0)
+    normalized = (scores - scores.min(axis=0)) / np.where(spread > 0, spread, 1)
+    proposal = front[np.argmin(normalized.sum(axis=1))]
+    print("proposed   " + ", ".join(f"{name} {result.scores[proposal, i]:.3g}" for i, name in enumerate(objectives)))
+    print(yaml.dump({"state_overrides": result.parameters(proposal)}, sort_keys=False), end="")
+    if params.history_dir is None:
+        hidden = {parameter: getattr(HIDDEN_STATE, parameter) for parameter in PARAMETERS}
+        print(f"hidden     {hidden}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--search", choices=("grid", "random"), default="random")
+    parser.add_argument("--count", type=int, default=2000, help="candidates of a random search")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--objective", action="append", choices=list(OBJECTIVES), help="repeat for several")
+    parser.add_argument("--workers", type=int, default=None, help="processes, default all cores")
+    parser.add_argument("--show", type=int, default=20, help="front rows to print")
+    parser.add_argument("--days", type=float, default=180, help="days of synthetic weather")
+    parser.add_argument("--step", type=float, default=300, help="seconds between samples")
+    parser.add_argument("--timezone", default="Europe/Berlin")
+    parser.add_argument("--history-dir", help="sweep on recorded series from this history directory")
+    parser.add_argument("--entity", default="boiler.outside_temperature", help="recorded outside temperature")
+    parser.add_argument("--reference", default="boiler.current_flow_temperature", help="recorded reference series")
+    parser.add_argument("--max-gap", type=float, default=3600, help="seconds without samples treated as a gap")
+    main(parser.parse_args())
@@ -0,0 +1,150 @@
+"""
+Feed boiler values to `HeatingIntegration` over MQTT (`benchmarks.mqtt_broker`
+with EMS-ESP style `boiler_data` messages) and writes to the simulated
+gateway (`benchmarks.ems_simulator`). Reports message latency, how often the
+supply temperature was recalculated and the HTTP requests, next to what
+polling every 30 seconds would cost.
+
+    python -m benchmarks.heating_mqtt [--messages 500] [--change-every 10] [--interval 0.01]
+"""
+import asyncio
+import logging
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import ujson
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from benchmarks.ems_simulator import SimulatedGateway
+from benchmarks.mqtt_broker import Broker
+from src.integrations.heating import EmsClient, EmsMqttClient, HeatingIntegration
+
+# EMS-ESP publishes boiler_data every 10 seconds by default
+EMS_PUBLISH_INTERVAL = 10
+POLL_INTERVAL = 30
+
+
+def boiler_data(outside_temperature: float, selected_flow_temperature: int) -> bytes:
+    return ujson.dumps(
+        {
+            "heatingactive": "on",
+            "tapwateractive": "off",
+            "selflowtemp": selected_flow_temperature,
+            "heatingpumpmod": 60,
+            "outdoortemp": outside_temperature,
+            "curflowtemp": selected_flow_temperature - 1.5,
+            "flamecurr": 4.2,
+            "heatingpump": "on",
+            "servicecode": "0H",
+            "servicecodenumber": 203,
+            "maintenancemessage": "H00",
+            "dhw": {"seltemp": 52, "curtemp": 49.8, "charging": "off", "active": "off"},
+        }
+    ).encode()
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("MQTT message was not received in time")
+        await asyncio.sleep(0)
+
+
+async def main(params):
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.CRITICAL)
+    rng = random.Random(0)
+
+    broker = Broker()
+    await broker.start(port=params.mqtt_port)
+    gateway = SimulatedGateway(access_token="token", latency=params.latency)
+    url = await gateway.start(port=params.http_port)
+
+    boiler = EmsClient(url, "token", "boiler", logger)
+    mqtt = EmsMqttClient("127.0.0.1", logger, port=params.mqtt_port, read_dhw=True)
+    with tempfile.TemporaryDirectory() as data_dir:
+        integration = HeatingIntegration(
+            OmegaConf.create({"data_dir": data_dir}),
+            AsyncIOScheduler(),
+            [],
+            logger,
+            None,
+            boiler,
+            OmegaConf.create({"heating_active": True}),
+            mqtt=mqtt,
+        )
+        calculations = 0
+        apply_supply_temperature = integration.apply_supply_temperature
+
+        def count_calculation(*args, **kwargs):
+            nonlocal calculations
+            calculations += 1
+            apply_supply_temperature(*args, **kwargs)
+
+        integration.apply_supply_temperature = count_calculation  # type: ignore
+
+        try:
+            await integration.initialize()
+            await wait_for(lambda: mqtt.is_connected and broker.subscriptions)
+
+            outside_temperature, changes = 5.0, 0
+            latencies = []
+            for index in range(params.messages):
+                if index % params.change_every == 0:
+                    outside_temperature = round(outside_temperature + rng.choice((-0.5, -0.2, 0.2, 0.5)), 1)
+                    changes += 1
+                received = mqtt.messages
+                start = time.perf_counter()
+                payload = boiler_data(outside_temperature, gateway.selected_flow_temperature)
+                broker.publish("ems-esp/boiler_data", payload)
+                await wait_for(lambda: mqtt.messages > received)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(params.interval)
+
+            if boiler._write_task is not None:
+                await asyncio.wait([boiler._write_task])
+
+            millis = np.array(latencies) * 1000
+            gets = sum(count for request, count in gateway.requests.items() if request.startswith("GET"))
+            posts = sum(count for request, count in gateway.requests.items() if request.startswith("POST"))
+            print(
+                f"mqtt       {params.messages} messages, latency p50 {np.percentile(millis, 50):.2f} ms "
+                f"p99 {np.percentile(millis, 99):.2f} ms, outside temperature changed {changes} times"
+            )
+            print(
+                f"heating    {calculations} recalculations, {boiler.write_stats.sent} writes sent, "
+                f"{boiler.write_stats.suppressed} skipped | HTTP {gets} GET {posts} POST"
+            )
+            hours = params.messages * EMS_PUBLISH_INTERVAL / 3600
+            print(
+                f"polling    {hours * 3600 / POLL_INTERVAL:.0f} GET and {hours * 3600 / POLL_INTERVAL:.0f} "
+                f"recalculations for the same {hours:.1f} h at one message every {EMS_PUBLISH_INTERVAL} s, "
+                f"values up to {POLL_INTERVAL} s old instead of {np.percentile(millis, 99):.1f} ms"
+            )
+
+            # the client reconnects and resubscribes after the broker drops it
+            broker.drop_connections()
+            start = time.perf_counter()
+            await wait_for(lambda: not mqtt.is_connected)
+            await wait_for(lambda: mqtt.is_connected and broker.subscriptions, timeout=30)
+            print(f"reconnect  {(time.perf_counter() - start) * 1000:.0f} ms after the broker dropped the connection")
+        finally:
+            await integration.shutdown()
+            await gateway.stop()
+            await broker.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500, help="boiler_data messages to publish")
+    parser.add_argument("--change-every", type=int, default=10, help="messages until the outside temperature changes")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between messages")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per gateway request")
+    parser.add_argument("--mqtt-port", type=int, default=18830)
+    parser.add_argument("--http-port", type=int, default=18081)
+    asyncio.run(main(parser.parse_args()))
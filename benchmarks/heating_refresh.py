@@ -0,0 +1,127 @@
+"""
+Run `HeatingIntegration.refresh` against the simulated EMS-ESP gateway
+(`benchmarks.ems_simulator`) through phases of a healthy, a flaky and a
+slow gateway and its recovery. Reports refresh latency, requests per cycle
+and what the circuit breaker does.
+
+    python -m benchmarks.heating_refresh [--cycles 20] [--latency 0.05] [--read-timeout 1] [--thermostat]
+"""
+import asyncio
+import logging
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import List
+
+import numpy as np
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from benchmarks.ems_simulator import SimulatedGateway, add_arguments
+from src.integrations.heating import EmsClient, HeatingIntegration
+
+
+async def run_phase(name: str, integration: HeatingIntegration, gateway: SimulatedGateway, cycles: int):
+    boiler = integration.boiler
+    gateway.reset_counters()
+    writes_sent, writes_suppressed = boiler.write_stats.sent, boiler.write_stats.suppressed
+    latencies: List[float] = []
+    failed = rejected = 0
+
+    for _ in range(cycles):
+        breaker_open = boiler.breaker.state == "open"
+        start = time.perf_counter()
+        await integration.refresh()
+        latencies.append(time.perf_counter() - start)
+        # the write is queued by refresh, wait for it so that it is counted in this phase
+        if boiler._write_task is not None:
+            await asyncio.wait([boiler._write_task])
+        if integration.last_ems_error is not None:
+            failed += 1
+            rejected += breaker_open
+
+    millis = np.array(latencies) * 1000
+    gets = sum(count for request, count in gateway.requests.items() if request.startswith("GET"))
+    posts = sum(count for request, count in gateway.requests.items() if request.startswith("POST"))
+    print(
+        f"{name:<9} refresh p50 {np.percentile(millis, 50):7.1f} ms  p95 {np.percentile(millis, 95):7.1f} ms  "
+        f"max {millis.max():7.1f} ms | {gets / cycles:4.1f} GET {posts / cycles:4.2f} POST per cycle, "
+        f"{gateway.max_active} concurrent | {failed}/{cycles} failed ({rejected} by the open breaker), "
+        f"writes {boiler.write_stats.sent - writes_sent} sent {boiler.write_stats.suppressed - writes_suppressed} "
+        f"skipped, breaker {boiler.breaker.state}"
+    )
+
+
+async def main(params):
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.CRITICAL)
+
+    gateway = SimulatedGateway(
+        access_token="token",
+        latency=params.latency,
+        concurrency=params.concurrency,
+        hang_rate=params.hang_rate,
+        drop_rate=params.drop_rate,
+        shape=params.shape,
+    )
+    url = await gateway.start(port=params.port)
+
+    boiler = EmsClient(
+        url,
+        "token",
+        "boiler",
+        logger,
+        read_timeout=params.read_timeout,
+        retries=params.retries,
+        retry_backoff=0.05,
+        failure_threshold=params.failure_threshold,
+        reset_timeout=params.reset_timeout,
+        thermostat_circuit="hc1" if params.thermostat else None,
+        mixer_circuits=["hc2"] if params.thermostat else None,
+        read_dhw=True,
+    )
+    # never started, the benchmark calls refresh itself
+    scheduler = AsyncIOScheduler()
+    with tempfile.TemporaryDirectory() as data_dir:
+        integration = HeatingIntegration(
+            OmegaConf.create({"data_dir": data_dir}),
+            scheduler,
+            [],
+            logger,
+            None,
+            boiler,
+            OmegaConf.create({"heating_active": True}),
+        )
+        await integration.initialize()
+
+        try:
+            await run_phase("healthy", integration, gateway, params.cycles)
+
+            gateway.error_rate = params.error_rate
+            await run_phase("flaky", integration, gateway, params.cycles)
+
+            gateway.error_rate = 0.0
+            gateway.latency = params.read_timeout * 1.5
+            await run_phase("slow", integration, gateway, params.cycles)
+
+            gateway.latency = params.latency
+            # the breaker lets a trial request through once the reset timeout has passed
+            await asyncio.sleep(params.reset_timeout)
+            await run_phase("recovered", integration, gateway, params.cycles)
+        finally:
+            await integration.shutdown()
+            await gateway.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--cycles", type=int, default=20, help="refreshes per phase")
+    parser.add_argument("--thermostat", action="store_true", help="poll a thermostat and a mixer circuit as well")
+    parser.add_argument("--read-timeout", type=float, default=1.0, help="client read timeout in seconds")
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--reset-timeout", type=float, default=2.0, help="seconds the breaker stays open")
+    parser.set_defaults(error_rate=0.3)
+    asyncio.run(main(parser.parse_args()))
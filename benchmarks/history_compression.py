@@ -0,0 +1,87 @@
+"""
+Compression ratio and decode throughput of the Gorilla encoding used for
+sealed history segments, on a synthetic week of house sensors.
+
+    python -m benchmarks.history_compression [--days 7] [--interval 10]
+"""
+import time
+from argparse import ArgumentParser
+from typing import Dict, Tuple
+
+import numpy as np
+
+from src.integrations.history.utils import gorilla
+from src.integrations.history.utils.segments import HEADER, TIMESTAMP_DTYPE, VALUE_DTYPE
+
+
+def house(days: int, interval: float, seed: int = 0) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Sensors as ESPHome reports them: float32 values with the sensor's
+    accuracy, sampled every `interval` seconds with a bit of jitter.
+    """
+    rng = np.random.default_rng(seed)
+    count = int(days * 24 * 60 * 60 / interval)
+    start = 1_700_000_000.0
+    timestamps = start + np.arange(count) * interval + rng.normal(0, 0.05, count)
+    day = 2 * np.pi * (timestamps - start) / (24 * 60 * 60)
+
+    def sensor(values: np.ndarray, accuracy: float) -> np.ndarray:
+        return (np.round(values / accuracy) * accuracy).astype(np.float32)
+
+    # slow drift plus a sensor that only reports changes of its accuracy
+    room = 20.5 + 1.5 * np.sin(day) + np.cumsum(rng.normal(0, 0.002, count))
+    outside = 5 + 6 * np.sin(day - 1) + np.cumsum(rng.normal(0, 0.005, count))
+    humidity = 55 + 8 * np.sin(day + 2) + np.cumsum(rng.normal(0, 0.01, count))
+    # the heat pump switches between standby and a few load levels
+    load = rng.choice([3.0, 3.0, 3.0, 850.0, 1200.0, 1650.0], size=count // 360 + 1).repeat(360)[:count]
+    power = load + rng.normal(0, 4, count) * (load > 3)
+    supply = 30 + 15 * (load > 3) + rng.normal(0, 0.2, count)
+    window_open = (rng.random(count // 90 + 1) < 0.05).repeat(90)[:count].astype(np.float64)
+
+    return {
+        "room_temperature": (timestamps, sensor(room, 0.1)),
+        "outside_temperature": (timestamps, sensor(outside, 0.1)),
+        "humidity": (timestamps, sensor(humidity, 1.0)),
+        "power": (timestamps, sensor(power, 1.0)),
+        "supply_temperature": (timestamps, sensor(supply, 0.5)),
+        "window_contact": (timestamps, window_open.astype(np.float32)),
+    }
+
+
+def measure(name: str, timestamps: np.ndarray, values: np.ndarray):
+    start = time.perf_counter()
+    count, data = gorilla.encode(timestamps.tolist(), values.tolist())
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = list(gorilla.decode(count, data))
+    decode_time = time.perf_counter() - start
+    assert len(decoded) == count
+    # timestamps are stored as whole milliseconds, values bit exact
+    decoded_timestamps, decoded_values = np.array(decoded).T
+    assert np.array_equal(decoded_timestamps, np.round(timestamps * 1000) / 1000), f"{name}: timestamps differ"
+    assert np.array_equal(decoded_values, values.astype(np.float64)), f"{name}: values differ"
+
+    raw = count * 16
+    segment = HEADER.size + count * (TIMESTAMP_DTYPE.itemsize + VALUE_DTYPE.itemsize)
+    print(
+        f"  {name:<20} {count:8d} samples  {len(data) * 8 / count:6.2f} bits/sample"
+        f"  ratio {raw / len(data):6.1f}x (vs segment {segment / len(data):5.1f}x)"
+        f"  encode {count / encode_time / 1e3:7.1f} k/s  decode {count / decode_time / 1e3:7.1f} k/s"
+    )
+    return count, len(data)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--days", type=int, default=7, help="days of synthetic history")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between samples")
+    params = parser.parse_args()
+
+    print(f"{params.days} days every {params.interval:g}s, ratio against float64 timestamp + float64 value:")
+    total_count = total_size = 0
+    for name, (timestamps, values) in house(params.days, params.interval).items():
+        count, size = measure(name, timestamps, values)
+        total_count += count
+        total_size += size
+    print(f"  {'total':<20} {total_count:8d} samples  {total_size * 8 / total_count:6.2f} bits/sample")
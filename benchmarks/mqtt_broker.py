@@ -0,0 +1,182 @@
+"""
+Minimal MQTT 3.1.1 broker to run the heating MQTT ingest against without a
+real one: connect, subscribe with `+`/`#` wildcards, retained messages,
+QoS 0 delivery (QoS 1 publishes are acknowledged) and pings.
+
+    python -m benchmarks.mqtt_broker [--port 18830]
+"""
+import asyncio
+import struct
+from argparse import ArgumentParser
+from typing import Dict, List, Optional, Set
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def packet(packet_type: int, body: bytes, flags: int = 0) -> bytes:
+    length = len(body)
+    header = bytearray([packet_type << 4 | flags])
+    while True:
+        byte, length = length & 0x7F, length >> 7
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(header) + body
+
+
+def utf8(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def matches(pattern: str, topic: str) -> bool:
+    pattern_levels, topic_levels = pattern.split("/"), topic.split("/")
+    for index, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels) or (level != "+" and level != topic_levels[index]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class _Session:
+    def __init__(self, broker: "Broker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.subscriptions: Set[str] = set()
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    async def _read_packet(self):
+        first = (await self.reader.readexactly(1))[0]
+        length = shift = 0
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, await self.reader.readexactly(length)
+
+    async def run(self):
+        try:
+            while True:
+                packet_type, flags, body = await self._read_packet()
+                if packet_type == CONNECT:
+                    self.send(packet(CONNACK, b"\x00\x00"))
+                elif packet_type == PUBLISH:
+                    self._publish(flags, body)
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    position = 2
+                    while position < len(body):
+                        (length,) = struct.unpack_from("!H", body, position)
+                        self.subscriptions.discard(body[position + 2 : position + 2 + length].decode())
+                        position += 2 + length
+                    self.send(packet(UNSUBACK, body[:2]))
+                elif packet_type == PINGREQ:
+                    self.send(packet(PINGRESP, b""))
+                elif packet_type == DISCONNECT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.broker.sessions.discard(self)
+            self.writer.close()
+
+    def _publish(self, flags: int, body: bytes):
+        (length,) = struct.unpack_from("!H", body)
+        topic = body[2 : 2 + length].decode()
+        position = 2 + length
+        qos = (flags >> 1) & 0x03
+        if qos:
+            # QoS 2 is acknowledged like QoS 1, good enough for a stand-in
+            self.send(packet(PUBACK, body[position : position + 2]))
+            position += 2
+        self.broker.publish(topic, body[position:], retain=bool(flags & 0x01))
+
+    def _subscribe(self, body: bytes):
+        packet_id, position, granted, topics = body[:2], 2, bytearray(), []
+        while position < len(body):
+            (length,) = struct.unpack_from("!H", body, position)
+            topics.append(body[position + 2 : position + 2 + length].decode())
+            position += 3 + length
+            granted.append(0)
+        self.subscriptions.update(topics)
+        self.send(packet(SUBACK, packet_id + bytes(granted)))
+        for topic, payload in self.broker.retained.items():
+            if any(matches(pattern, topic) for pattern in topics):
+                self.send(packet(PUBLISH, utf8(topic) + payload, flags=0x01))
+
+
+class Broker:
+    def __init__(self):
+        self.sessions: Set[_Session] = set()
+        self.retained: Dict[str, bytes] = {}
+        self.published = 0
+        self.delivered = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False):
+        self.published += 1
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+
+        data = packet(PUBLISH, utf8(topic) + payload)
+        for session in list(self.sessions):
+            if any(matches(pattern, topic) for pattern in session.subscriptions):
+                session.send(data)
+                self.delivered += 1
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = _Session(self, reader, writer)
+        self.sessions.add(session)
+        await session.run()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 18830):
+        self._server = await asyncio.start_server(self._accept, host, port)
+
+    def drop_connections(self):
+        """
+        Close all client connections, e.g. to exercise reconnects.
+        """
+        for session in list(self.sessions):
+            session.writer.transport.abort()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+        self.drop_connections()
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    @property
+    def subscriptions(self) -> List[str]:
+        return sorted({pattern for session in self.sessions for pattern in session.subscriptions})
+
+
+async def serve(params):
+    broker = Broker()
+    await broker.start(port=params.port)
+    print(f"MQTT broker listening on 127.0.0.1:{params.port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.stop()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=18830)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
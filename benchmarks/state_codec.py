@@ -0,0 +1,76 @@
+"""
+Compare `StateCodec` against the previous pickle based persistence.
+
+    python -m benchmarks.state_codec [--persons 30] [--number 10000]
+"""
+import pickle
+import timeit
+from argparse import ArgumentParser
+from datetime import datetime
+
+import pytz
+
+from src.integrations.heating.integration import State as HeatingState
+from src.integrations.presence.integration import State as PresenceState
+from src.utils.state_codec import StateCodec
+
+
+def heating_state() -> HeatingState:
+    return HeatingState(
+        heating_active=True,
+        heating_curve_inclination=1.1,
+        heating_curve_parallel_shift=0.0,
+        heating_curve_max_supply_temperature=50,
+        heating_curve_min_supply_temperature=30,
+        heating_curve_target_room_temperature=20.0,
+        heating_curve_target_night_room_temperature=17.5,
+        heating_curve_day_start_hour=6,
+        heating_curve_day_start_minute=0,
+        heating_curve_day_end_hour=22,
+        heating_curve_day_end_minute=0,
+    )
+
+
+def presence_state(persons: int) -> PresenceState:
+    now = datetime.now(pytz.timezone("Europe/Berlin"))
+    return PresenceState(
+        vacation_mode=False,
+        persons=[PresenceState.Person(name=f"person {i}", present=i % 2 == 0, last_seen=now) for i in range(persons)],
+    )
+
+
+def measure(name: str, obj, number: int):
+    codec = StateCodec(type(obj))
+    pickled = pickle.dumps(obj)
+    encoded = codec.encode(obj)
+    assert codec.decode(encoded) == obj
+
+    results = {
+        "pickle": (
+            timeit.timeit(lambda: pickle.dumps(obj), number=number),
+            timeit.timeit(lambda: pickle.loads(pickled), number=number),
+            len(pickled),
+        ),
+        "codec": (
+            timeit.timeit(lambda: codec.encode(obj), number=number),
+            timeit.timeit(lambda: codec.decode(encoded), number=number),
+            len(encoded),
+        ),
+    }
+
+    print(f"{name}:")
+    for method, (store, load, size) in results.items():
+        print(
+            f"  {method:<8} store {store / number * 1e6:8.2f} µs"
+            f"  load {load / number * 1e6:8.2f} µs  size {size:6d} bytes"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--persons", type=int, default=30, help="number of persons in the presence state")
+    parser.add_argument("--number", type=int, default=10000, help="iterations per measurement")
+    params = parser.parse_args()
+
+    measure("heating.State", heating_state(), params.number)
+    measure(f"presence.State ({params.persons} persons)", presence_state(params.persons), params.number)
@@ -40,8 +40,19 @@ async def main(config: ListConfig | DictConfig, logger: Logger) -> None:
     #         for sig in (signal.SIGTERM, signal.SIGINT):  # signal.SIGHUP,
     #             running_loop.add_signal_handler(sig, shutdown, sig)
 
-    while True:
-        await asyncio.sleep(1)
+    try:
+        while True:
+            await asyncio.sleep(1)
+    finally:
+        # flushes pending persistent state among other things
+        for integration in integrations:
+            try:
+                await integration.shutdown()
+            except Exception:
+                logger.exception(f"Failed to shut down {type(integration).__name__}")
+
+        if config.get("state_backend") is not None:
+            await config.state_backend.close()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,3 @@
 # isort: skip_file
 from src.integrations.base.telegram_handler import TelegramHandler  # noqa: F401
-from src.integrations.base.integration import BaseIntegration, Integration  # noqa: F401
+from src.integrations.base.integration import BaseIntegration, Integration, StateListener  # noqa: F401
@@ -8,6 +8,9 @@ from telegram.ext import Application
 
 from src.integrations.base import TelegramHandler
 
+# entity_id, value, timestamp
+StateListener = Callable[[str, float, float], None]
+
 
 class BaseIntegration(TelegramHandler, ABC):
     def __init__(self):
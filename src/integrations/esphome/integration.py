@@ -5,9 +5,14 @@ from typing import Callable, List, Optional
 from apscheduler.schedulers.base import BaseScheduler
 from omegaconf import DictConfig, ListConfig
 
-from src.integrations.base.integration import BaseIntegration, Integration
+from src.integrations.base.integration import BaseIntegration, Integration, StateListener
 from src.integrations.base.telegram_handler import TelegramHandler
+from src.integrations.esphome.utils.commands import CommandStats
 from src.integrations.esphome.utils.device import ESPHomeDevice
+from src.integrations.esphome.utils.entity_cache import EntityCache
+from src.integrations.esphome.utils.entity_table import EntitySnapshot, EntityTable
+from src.integrations.esphome.utils.fanout import StateFanout
+from src.integrations.esphome.utils.fleet import DeviceFleet
 
 
 class ESPHomeIntegration(Integration):
@@ -20,6 +25,10 @@ class ESPHomeIntegration(Integration):
         telegram_handler: Optional[Callable[..., TelegramHandler]],
         state_overrides: DictConfig,
         devices: ListConfig,
+        max_concurrency: int = 16,
+        operation_timeout: float = 10.0,
+        fanout_interval: float = 0.1,
+        command_timeout: float = 5.0,
     ):
         super().__init__(
             config=config,
@@ -31,16 +40,38 @@ class ESPHomeIntegration(Integration):
 
         self.state_overrides = state_overrides
         self.devices: List[ESPHomeDevice] = []
+        # entities per device build, so reconnects of unchanged devices skip listing them
+        self.entity_cache = EntityCache(config.data_dir, backend=config.get("state_backend"))
+        # current state of the entities of all devices
+        self.entity_table = EntityTable()
+        # filtered updates of all devices, delivered to the state listeners once per tick
+        self.fanout = StateFanout(logger, tick=fanout_interval)
+        # outcome and latency of switch commands across all devices
+        self.command_stats = CommandStats()
 
         for device in devices:
             self.devices.append(
                 ESPHomeDevice(
                     logger=logger,
                     host=device.host,
-                    encryption_key=device.encryption_key,
+                    encryption_key=device.get("encryption_key"),
+                    port=device.get("port", 6053),
+                    entity_cache=self.entity_cache,
+                    entity_table=self.entity_table,
+                    fanout=self.fanout,
+                    filters=device.get("filters"),
+                    command_timeout=command_timeout,
+                    command_stats=self.command_stats,
                 )
             )
 
+        self.fleet = DeviceFleet(
+            devices=self.devices,
+            logger=logger,
+            max_concurrency=max_concurrency,
+            operation_timeout=operation_timeout,
+        )
+
         scheduler.add_job(
             self.initialize_devices,
             "interval",
@@ -49,12 +80,24 @@ class ESPHomeIntegration(Integration):
         )
 
     async def initialize_devices(self):
+        await self.entity_cache.initialize()
+        # (re)connects disconnected devices in the background, connected ones are left alone
+        self.fleet.tick()
+
+    def snapshot(self) -> EntitySnapshot:
+        return self.entity_table.snapshot()
+
+    def set_switch(self, entity_id: str, state: bool) -> bool:
         for device in self.devices:
-            if not device.is_initialized:
-                # return value is the state of the device
-                self.scheduler.add_job(device.initialize)
-            else:
-                self.scheduler.add_job(device.heartbeat)
+            if device.has_entity(entity_id):
+                return device.set_switch(entity_id, state)
+        return False
+
+    def add_state_listener(self, listener: StateListener):
+        self.fanout.listeners.append(listener)
 
     async def shutdown(self):
+        await self.fleet.close()
+        self.fanout.flush()
+        await self.entity_cache.close()
         return await super().shutdown()
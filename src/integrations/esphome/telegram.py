@@ -1,9 +1,17 @@
+import time
 from logging import Logger
+from typing import List
 
-from telegram.ext import Application
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+)
 
 from src.integrations.base import TelegramHandler
 from src.integrations.esphome import ESPHomeIntegration
+from src.integrations.esphome.utils.entity_table import KINDS
 
 
 class ESPHomeTelegramHandler(TelegramHandler[ESPHomeIntegration]):
@@ -11,5 +19,39 @@ class ESPHomeTelegramHandler(TelegramHandler[ESPHomeIntegration]):
         self.logger = logger
         self.integration = integration
 
+    async def command_sensors(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        snapshot = self.integration.snapshot()
+        now = time.time()
+
+        lines: List[str] = []
+        for row in sorted(range(len(snapshot)), key=lambda row: snapshot.entity_ids[row]):
+            value = snapshot.values[row]
+            if value != value:
+                state = "unknown"
+            elif KINDS[snapshot.kinds[row]] == "sensor":
+                state = f"{value:.1f}"
+            else:
+                state = "on" if value else "off"
+            age = f" ({now - snapshot.updated[row]:.0f}s ago)" if snapshot.updated[row] else ""
+            lines.append(f"🔌 {snapshot.entity_ids[row]}: {state}{age}")
+
+        await update.message.reply_text("\n".join(lines) if lines else "No ESPHome entities known yet!")  # type: ignore
+
+    async def command_switch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # /switch <entity_id> on|off, without arguments shows the command statistics
+        if not context.args or len(context.args) != 2 or context.args[1] not in ("on", "off"):
+            await update.message.reply_text(  # type: ignore
+                f"Usage: /switch <entity_id> on|off\n{self.integration.command_stats}"
+            )
+            return
+
+        entity_id, state = context.args
+        if self.integration.set_switch(entity_id, state == "on"):
+            await update.message.reply_text(f"🔌 Switching {entity_id} {state}")  # type: ignore
+        else:
+            await update.message.reply_text(f"Could not switch {entity_id}, unknown or disconnected")  # type: ignore
+
     async def register_telegram_commands(self, application: Application) -> None:
+        application.add_handler(CommandHandler("sensors", self.command_sensors))
+        application.add_handler(CommandHandler("switch", self.command_switch))
         await super().register_telegram_commands(application=application)
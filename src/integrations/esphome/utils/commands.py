@@ -0,0 +1,52 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Optional
+
+import numpy as np
+
+
+# compared by identity, two commands can have the same fields
+@dataclass(eq=False)
+class PendingCommand:
+    key: int
+    state: bool
+    # value in the entity table before the optimistic update, restored if the command fails
+    previous: float
+    # loop time the command was sent at, None while it waits for the batch
+    sent_at: Optional[float] = None
+    timeout: Optional[asyncio.TimerHandle] = None
+    # last state the device pushed since the command was sent, if it matched no pending command
+    reported: Optional[bool] = None
+
+
+class CommandStats:
+    """
+    Outcome counters and the command-to-confirmation latency of the most
+    recent `window` confirmed commands.
+    """
+
+    def __init__(self, window: int = 256):
+        self.sent = 0
+        self.confirmed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.failed = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def record_confirmation(self, latency: float):
+        self.confirmed += 1
+        self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+    def __str__(self) -> str:
+        p50, p95 = self.percentile(50), self.percentile(95)
+        latency = f"p50 {p50 * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms" if p50 is not None and p95 is not None else "n/a"
+        return (
+            f"sent {self.sent}, confirmed {self.confirmed}, rejected {self.rejected}, "
+            f"timed out {self.timed_out}, failed {self.failed}, latency {latency}"
+        )
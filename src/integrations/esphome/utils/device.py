@@ -1,49 +1,69 @@
-from dataclasses import dataclass
+import asyncio
+import inspect
+import math
+import time
 from logging import Logger
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import numpy as np
 from aioesphomeapi.client import APIClient
 from aioesphomeapi.core import APIConnectionError
-from aioesphomeapi import BinarySensorInfo, DeviceInfo, SensorInfo, SwitchInfo
-
-
-@dataclass
-class Sensor:
-    name: str
-    key: int
-    state: Optional[float]
-    unit_of_measurement: str
-
+from aioesphomeapi import DeviceInfo
 
-@dataclass
-class BinarySensor:
-    name: str
-    key: int
-    state: Optional[bool]
-
-
-@dataclass
-class Switch:
-    name: str
-    key: int
-    state: Optional[bool]
+from src.integrations.esphome.utils.commands import CommandStats, PendingCommand
+from src.integrations.esphome.utils.entity_cache import EntityCache, EntityDescription
+from src.integrations.esphome.utils.entity_table import KINDS, EntityTable
+from src.integrations.esphome.utils.fanout import StateFanout
 
 
 class ESPHomeDevice:
-    def __init__(self, logger: Logger, host: str, encryption_key: str):
+    def __init__(
+        self,
+        logger: Logger,
+        host: str,
+        encryption_key: Optional[str],
+        entity_cache: Optional[EntityCache] = None,
+        keepalive: float = 20.0,
+        entity_table: Optional[EntityTable] = None,
+        fanout: Optional[StateFanout] = None,
+        filters: Optional[Mapping[str, Any]] = None,
+        command_timeout: float = 5.0,
+        command_stats: Optional[CommandStats] = None,
+        port: int = 6053,
+    ):
         self.logger = logger
         self.host = host
         self.encryption_key = encryption_key
+        self.entity_cache = entity_cache
+        # usually shared by all devices of the integration
+        self.entity_table = entity_table if entity_table is not None else EntityTable()
+        self.fanout = fanout if fanout is not None else StateFanout(logger)
+        # object_id -> {deadband, min_interval}, limits which updates reach the listeners
+        self.filters = filters if filters is not None else {}
+        # seconds to wait for the state push confirming a command before the optimistic state is reverted
+        self.command_timeout = command_timeout
+        self.command_stats = command_stats if command_stats is not None else CommandStats()
+        # key -> commands sent but not confirmed yet, oldest first, the last one may wait for the next batch
+        self._commands: Dict[int, List[PendingCommand]] = {}
+        self._batch_handle: Optional[asyncio.Handle] = None
+        # publishes held back updates once they are due, see `EntityTable.should_publish`
+        self._held_handle: Optional[asyncio.TimerHandle] = None
+        self._held_due: Optional[float] = None
 
         self.api_client = APIClient(
             host,
-            6053,
+            port,
             None,
             noise_psk=encryption_key,
+            # liveness comes from the native API ping, a missing pong closes the connection and calls on_stop
+            keepalive=keepalive,
         )
 
         self.is_connected = False
         self.is_expected_disconnect = False
         self.is_initialized = False
+        # called with the device and whether the disconnect was expected (e.g. a reboot after an OTA update)
+        self.disconnect_listeners: List[Callable[["ESPHomeDevice", bool], None]] = []
 
         self._reset_state()
 
@@ -52,12 +72,14 @@ class ESPHomeDevice:
         self._mac_address: Optional[str] = None
         self._last_compilation_time: Optional[str] = None
 
-        self.sensors: List[Sensor] = []
-        self.binary_sensors: List[BinarySensor] = []
-        self.switches: List[Switch] = []
-        # key -> sensor
-        # used to map the state changes to the correct sensor
-        self._mappings: Dict[int, Any] = {}
+        self.entities: List[EntityDescription] = []
+        # key -> row in the entity table
+        # used to map the state changes to the correct entity
+        self._rows: Dict[int, int] = {}
+        # key -> "<device name>.<object_id>", used to identify entities across devices
+        self._entity_ids: Dict[int, str] = {}
+        # "<device name>.<object_id>" -> key
+        self._keys: Dict[str, int] = {}
 
     async def on_disconnect(self, expected_disconnect: bool):
         self.is_connected = False
@@ -65,6 +87,12 @@ class ESPHomeDevice:
         self.logger.warning(
             f"Disconnected from ESPHome device {self.host}. Disconnect was expected: {expected_disconnect}"
         )
+        for commands in list(self._commands.values()):
+            self.command_stats.failed += len(commands)
+            self._revert(commands[0].key)
+
+        for listener in self.disconnect_listeners:
+            listener(self, expected_disconnect)
 
     async def connect(self) -> Optional[DeviceInfo]:
         try:
@@ -82,21 +110,24 @@ class ESPHomeDevice:
             self.logger.exception(f"Could not connect to ESPHome device {self.host}")
             return None
 
-    async def heartbeat(self):
+    async def disconnect(self):
+        try:
+            await self.api_client.disconnect(force=True)
+        except Exception:
+            self.logger.debug(f"Could not cleanly disconnect from ESPHome device {self.host}", exc_info=True)
+        self.is_connected = False
+
+    async def heartbeat(self) -> bool:
+        # a connected device is alive, the API keepalive reports dead connections through on_disconnect.
+        # new builds are flashed via OTA, which reboots the device with an expected disconnect,
+        # so a changed compilation_time is picked up by the reconnect in initialize
         if self.is_connected:
-            device_info = await self.api_client.device_info()
-            # TODO: Check whether we have a new build and reset all entities
-            # WIP: This is actually not needed, devices will disconnect with expected_disconnect=True
-            if device_info.compilation_time != self._last_compilation_time:
-                self.logger.info(
-                    f"ESPHome device {self.host} has a new build. Resetting all entities"
-                )
-                await self.initialize(device_info)
+            return True
         else:
             self.logger.info(
                 f"ESPHome device {self.host} is not connected. Reconnecting"
             )
-            await self.initialize()
+            return await self.initialize()
 
     async def initialize(self, device_info: Optional[DeviceInfo] = None) -> bool:
         if not device_info:
@@ -105,56 +136,227 @@ class ESPHomeDevice:
             if device_info is None:
                 return False
 
+        if self._last_compilation_time is not None and device_info.compilation_time != self._last_compilation_time:
+            self.logger.info(f"ESPHome device {self.host} has a new build. Resetting all entities")
+
         self._reset_state()
         self._name = device_info.name
         self._mac_address = device_info.mac_address
         self._last_compilation_time = device_info.compilation_time
 
+        self.entities = await self.list_entities(device_info)
+        for entity in self.entities:
+            entity_id = f"{self._name}.{entity.object_id}"
+            self._entity_ids[entity.key] = entity_id
+            self._keys[entity_id] = entity.key
+            row = self.entity_table.register(entity_id, entity.kind, entity.unit_of_measurement)
+            self._rows[entity.key] = row
+
+            entity_filter = self.filters.get(entity.object_id, {})
+            self.entity_table.set_filter(
+                row,
+                deadband=entity_filter.get("deadband", 0.0),
+                min_interval=entity_filter.get("min_interval", 0.0),
+            )
+
+        # subscribe to the state changes, only a coroutine in older aioesphomeapi releases
+        subscribed = self.api_client.subscribe_states(self.handle_state_change)
+        if inspect.isawaitable(subscribed):
+            await subscribed
+
+        self.is_initialized = True
+
+        return True
+
+    async def list_entities(self, device_info: DeviceInfo) -> List[EntityDescription]:
+        if self.entity_cache is not None:
+            entities = await self.entity_cache.get(device_info.mac_address, device_info.compilation_time)
+            if entities is not None:
+                self.logger.debug(f"Using cached entities of ESPHome device {self.host}")
+                return entities
+
         entity_services = await self.api_client.list_entities_services()
         # flatten the list of lists return by list_entities_services
         entity_services = [item for sublist in entity_services for item in sublist]
 
-        for entity_service in entity_services:
-            if isinstance(entity_service, BinarySensorInfo):
-                sensor = BinarySensor(
-                    name=entity_service.object_id,
-                    key=entity_service.key,
-                    state=None,
-                )
-                self.binary_sensors.append(sensor)
-                self._mappings[entity_service.key] = sensor
-
-            if isinstance(entity_service, SensorInfo):
-                sensor = Sensor(
-                    name=entity_service.object_id,
-                    key=entity_service.key,
-                    state=None,
-                    unit_of_measurement=entity_service.unit_of_measurement,
-                )
-                self.sensors.append(sensor)
-                self._mappings[entity_service.key] = sensor
-
-            if isinstance(entity_service, SwitchInfo):
-                switch = Switch(
-                    name=entity_service.object_id,
-                    key=entity_service.key,
-                    state=None,
-                )
-                self.switches.append(switch)
-                self._mappings[entity_service.key] = switch
-
-        # subscribe to the state changes
-        await self.api_client.subscribe_states(
-            lambda state: self.handle_state_change(state)
-        )
+        entities = [
+            entity
+            for entity in map(EntityDescription.from_info, entity_services)
+            if entity is not None
+        ]
+        if self.entity_cache is not None:
+            await self.entity_cache.set(device_info.mac_address, device_info.compilation_time, entities)
+        return entities
 
-        self.is_initialized = True
+    def has_entity(self, entity_id: str) -> bool:
+        return entity_id in self._keys
+
+    def set_switch(self, entity_id: str, state: bool) -> bool:
+        """
+        Switch an entity on or off. The entity table reflects the new state
+        right away and is reconciled with the state pushed by the device.
+        Commands issued in the same loop iteration are sent as one batch, a
+        later command to the same switch replaces an unsent one. Sent commands
+        wait for their confirmation independently of later ones.
+        """
+        key = self._keys.get(entity_id)
+        if key is None or not self.is_connected:
+            return False
+        row = self._rows[key]
+        if KINDS[self.entity_table.kinds[row]] != "switch":
+            return False
 
+        commands = self._commands.setdefault(key, [])
+        if commands and commands[-1].sent_at is None:
+            commands[-1].state = state
+        else:
+            previous = commands[0].previous if commands else self.entity_table.values[row]
+            commands.append(PendingCommand(key=key, state=state, previous=previous))
+
+        # optimistic update
+        self.entity_table.update(row, float(state), time.time())
+
+        if self._batch_handle is None:
+            self._batch_handle = asyncio.get_running_loop().call_soon(self._send_batch)
         return True
 
-    def handle_state_change(self, state):
-        sensor = self._mappings[state.key]
-        sensor.state = state.state
-        self.logger.debug(
-            f"ESPHome device: {self._name} - State of {sensor.name} is {sensor.state}"
+    def _send_batch(self):
+        self._batch_handle = None
+        loop = asyncio.get_running_loop()
+
+        for command in [commands[-1] for commands in self._commands.values()]:
+            if command.sent_at is not None:
+                continue
+
+            command.sent_at = loop.time()
+            command.timeout = loop.call_later(self.command_timeout, self._command_timed_out, command)
+            try:
+                self.api_client.switch_command(command.key, command.state)
+            except Exception:
+                self.logger.warning(f"Could not send command to ESPHome device {self.host}", exc_info=True)
+                self.command_stats.failed += 1
+                self._remove(command)
+            else:
+                self.command_stats.sent += 1
+
+    def _command_timed_out(self, command: PendingCommand):
+        if command not in self._commands.get(command.key, []):
+            return
+        if command.reported is not None:
+            # the device kept reporting another state
+            self.command_stats.rejected += 1
+            self.logger.warning(
+                f"ESPHome device {self.host} reported {self._entity_ids.get(command.key)} as {command.reported} "
+                f"after it was commanded to {command.state}, reverting"
+            )
+        else:
+            self.command_stats.timed_out += 1
+            self.logger.warning(
+                f"ESPHome device {self.host} did not confirm {self._entity_ids.get(command.key)}, reverting"
+            )
+        self._remove(command)
+
+    def _remove(self, command: PendingCommand):
+        """
+        Drop a failed command, the table is reverted once no other command
+        for the switch is pending.
+        """
+        commands = self._commands.get(command.key, [])
+        if command in commands:
+            commands.remove(command)
+        if command.timeout is not None:
+            command.timeout.cancel()
+
+        row = self._rows.get(command.key)
+        if commands:
+            # the latest pending command stays the optimistic state
+            if row is not None:
+                self.entity_table.update(row, float(commands[-1].state), time.time())
+            return
+        self._commands.pop(command.key, None)
+        if row is not None:
+            reverted = command.previous if command.reported is None else float(command.reported)
+            self.entity_table.update(row, reverted, time.time())
+
+    def _revert(self, key: int):
+        commands = self._commands.pop(key, [])
+        for command in commands:
+            if command.timeout is not None:
+                command.timeout.cancel()
+
+        row = self._rows.get(key)
+        if row is not None and commands:
+            self.entity_table.update(row, commands[0].previous, time.time())
+
+    def _reconcile(self, key: int, state: bool):
+        """
+        Match a pushed state against the sent commands of the switch, in
+        order. It confirms the oldest command with that state and settles the
+        ones sent before it. A state matching none of them (e.g. pushed before
+        the device processed the command) is only a rejection if the command
+        is still not confirmed when it times out.
+        """
+        commands = self._commands[key]
+        matched = next(
+            (index for index, command in enumerate(commands) if command.sent_at is not None and command.state == state),
+            None,
         )
+        if matched is None:
+            for command in commands:
+                if command.sent_at is not None:
+                    command.reported = state
+            return
+
+        confirmed = commands[matched]
+        self.command_stats.record_confirmation(asyncio.get_running_loop().time() - confirmed.sent_at)  # type: ignore
+        for command in commands[: matched + 1]:
+            if command.timeout is not None:
+                command.timeout.cancel()
+        del commands[: matched + 1]
+
+        # later commands revert to the confirmed state if they fail
+        for command in commands:
+            command.previous = float(state)
+            command.reported = None
+        if not commands:
+            del self._commands[key]
+
+    def handle_state_change(self, state):
+        row = self._rows.get(state.key)
+        if row is None:
+            return
+
+        missing_state = getattr(state, "missing_state", False)
+
+        if state.key in self._commands and not missing_state:
+            self._reconcile(state.key, bool(state.state))
+            if state.key in self._commands:
+                # other commands are still on their way, the table keeps the latest commanded state
+                return
+        value = math.nan if missing_state else float(state.state)
+        timestamp = time.time()
+        self.entity_table.update(row, value, timestamp)
+
+        if missing_state:
+            return
+        if self.entity_table.should_publish(row, value, timestamp):
+            self.fanout.publish(self._entity_ids[state.key], value, timestamp)
+        else:
+            self._schedule_held()
+
+    def _schedule_held(self):
+        due = self.entity_table.next_held(np.fromiter(self._rows.values(), dtype=np.int64))
+        if due is None or (self._held_handle is not None and self._held_due is not None and self._held_due <= due):
+            return
+        if self._held_handle is not None:
+            self._held_handle.cancel()
+        self._held_due = due
+        self._held_handle = asyncio.get_running_loop().call_later(max(0.0, due - time.time()), self._publish_held)
+
+    def _publish_held(self):
+        self._held_handle, self._held_due = None, None
+        table = self.entity_table
+        for row in table.release_held(np.fromiter(self._rows.values(), dtype=np.int64), time.time()).tolist():
+            # with the time of the last update, not of the release
+            self.fanout.publish(table.entity_ids[row], float(table.values[row]), float(table.updated[row]))
+        self._schedule_held()
@@ -0,0 +1,72 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from aioesphomeapi import BinarySensorInfo, SensorInfo, SwitchInfo
+
+from src.utils.persistant_state import PersistentState, StateBackend
+
+
+@dataclass
+class EntityDescription:
+    # "sensor", "binary_sensor" or "switch"
+    kind: str
+    key: int
+    object_id: str
+    unit_of_measurement: Optional[str] = None
+
+    @staticmethod
+    def from_info(info: Any) -> Optional["EntityDescription"]:
+        if isinstance(info, BinarySensorInfo):
+            return EntityDescription(kind="binary_sensor", key=info.key, object_id=info.object_id)
+        if isinstance(info, SensorInfo):
+            return EntityDescription(
+                kind="sensor",
+                key=info.key,
+                object_id=info.object_id,
+                unit_of_measurement=info.unit_of_measurement,
+            )
+        if isinstance(info, SwitchInfo):
+            return EntityDescription(kind="switch", key=info.key, object_id=info.object_id)
+        return None
+
+
+@dataclass
+class CachedDevice:
+    compilation_time: str
+    entities: List[EntityDescription]
+
+
+@dataclass
+class State:
+    # mac address -> entities of the build that was running when they were listed
+    devices: Dict[str, CachedDevice] = field(default_factory=dict)
+
+
+class EntityCache:
+    """
+    Entity metadata of every device, keyed by MAC address and only valid for
+    the firmware build (`compilation_time`) it was listed from. Lets devices
+    reconnect without enumerating their entities again.
+    """
+
+    def __init__(self, path: str, backend: Optional[StateBackend] = None):
+        self.persistent_state: PersistentState[State] = PersistentState("esphome_entities", path, backend=backend)
+
+    async def initialize(self):
+        if not self.persistent_state.initialized:
+            await self.persistent_state.initialize(State())
+
+    async def get(self, mac_address: str, compilation_time: str) -> Optional[List[EntityDescription]]:
+        state = await self.persistent_state.get()
+        cached = state.devices.get(mac_address)
+        if cached is None or cached.compilation_time != compilation_time:
+            return None
+        return cached.entities
+
+    async def set(self, mac_address: str, compilation_time: str, entities: List[EntityDescription]):
+        state = await self.persistent_state.get()
+        state.devices[mac_address] = CachedDevice(compilation_time=compilation_time, entities=entities)
+        await self.persistent_state.update(devices=state.devices)
+
+    async def close(self):
+        await self.persistent_state.close()
@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+KINDS = ("sensor", "binary_sensor", "switch")
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
+
+@dataclass
+class EntitySnapshot:
+    # row i of every array belongs to entity_ids[i]
+    entity_ids: Sequence[str]
+    kinds: np.ndarray
+    values: np.ndarray
+    updated: np.ndarray
+    changes: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    def value(self, entity_id: str) -> Optional[float]:
+        try:
+            value = self.values[self.entity_ids.index(entity_id)]
+        except ValueError:
+            return None
+        return None if np.isnan(value) else float(value)
+
+
+class EntityTable:
+    """
+    State of all ESPHome entities across devices as a struct of arrays. Every
+    entity gets a dense row on registration, its value (NaN while unknown,
+    0/1 for binary sensors and switches), the time of the last update and the
+    number of value changes live in preallocated arrays that double when full.
+
+    Each row also has an optional filter deciding which updates are published
+    to listeners: changes smaller than `deadband` and updates less than
+    `min_interval` seconds after the last published one are held back. The
+    latest held back value is published once `min_interval` has passed, or
+    for changes within the deadband `max_hold` seconds after the last
+    published value, unless a later update is published first.
+    """
+
+    def __init__(self, capacity: int = 64, max_hold: float = 60.0):
+        self.entity_ids: List[str] = []
+        self.units: List[Optional[str]] = []
+        # entity id -> row
+        self.rows: Dict[str, int] = {}
+
+        self.kinds = np.zeros(capacity, dtype=np.int8)
+        self.values = np.full(capacity, np.nan, dtype=np.float64)
+        self.updated = np.zeros(capacity, dtype=np.float64)
+        self.changes = np.zeros(capacity, dtype=np.uint32)
+
+        self.deadband = np.zeros(capacity, dtype=np.float64)
+        self.min_interval = np.zeros(capacity, dtype=np.float64)
+        # last value passed on to listeners and when
+        self.published = np.full(capacity, np.nan, dtype=np.float64)
+        self.published_at = np.zeros(capacity, dtype=np.float64)
+        # when the held back latest value is due, NaN if nothing is held back
+        self.held_until = np.full(capacity, np.nan, dtype=np.float64)
+        self.max_hold = max_hold
+
+    def __len__(self) -> int:
+        return len(self.entity_ids)
+
+    def register(self, entity_id: str, kind: str, unit_of_measurement: Optional[str] = None) -> int:
+        """
+        Return the row of the entity, adding it if it is new. Rows are stable
+        across reconnects and keep their last known value.
+        """
+        row = self.rows.get(entity_id)
+        if row is not None:
+            self.kinds[row] = KIND_CODES[kind]
+            self.units[row] = unit_of_measurement
+            return row
+
+        row = len(self.entity_ids)
+        if row == len(self.values):
+            self._grow(2 * len(self.values))
+
+        self.entity_ids.append(entity_id)
+        self.units.append(unit_of_measurement)
+        self.rows[entity_id] = row
+        self.kinds[row] = KIND_CODES[kind]
+        return row
+
+    def _grow(self, capacity: int):
+        for name, fill in (
+            ("kinds", 0),
+            ("values", np.nan),
+            ("updated", 0.0),
+            ("changes", 0),
+            ("deadband", 0.0),
+            ("min_interval", 0.0),
+            ("published", np.nan),
+            ("published_at", 0.0),
+            ("held_until", np.nan),
+        ):
+            current = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=current.dtype)
+            grown[: len(current)] = current
+            setattr(self, name, grown)
+
+    def update(self, row: int, value: float, timestamp: float) -> bool:
+        """
+        Store a new value, returns whether it differs from the previous one.
+        """
+        self.updated[row] = timestamp
+        previous = self.values[row]
+        if previous == value or (value != value and previous != previous):
+            return False
+
+        self.values[row] = value
+        self.changes[row] += 1
+        return True
+
+    def set_filter(self, row: int, deadband: float = 0.0, min_interval: float = 0.0):
+        self.deadband[row] = deadband
+        self.min_interval[row] = min_interval
+
+    def should_publish(self, row: int, value: float, timestamp: float) -> bool:
+        """
+        Apply the filter of the row to an update, marks it as published if it
+        passes and holds it back until `held_until` otherwise.
+        """
+        published = self.published[row]
+        if published == published:
+            deadband = self.deadband[row]
+            if deadband > 0 and abs(value - published) < deadband:
+                due = self.published_at[row] + max(self.min_interval[row], self.max_hold)
+            else:
+                due = self.published_at[row] + self.min_interval[row]
+            if timestamp < due:
+                self.held_until[row] = np.nan if value == published else due
+                return False
+
+        self.published[row] = value
+        self.published_at[row] = timestamp
+        self.held_until[row] = np.nan
+        return True
+
+    def next_held(self, rows: np.ndarray) -> Optional[float]:
+        """
+        Earliest time a held back value of one of `rows` is due, None if none is held back.
+        """
+        held = self.held_until[rows]
+        held = held[~np.isnan(held)]
+        return float(held.min()) if len(held) > 0 else None
+
+    def release_held(self, rows: np.ndarray, timestamp: float) -> np.ndarray:
+        """
+        Mark the held back values of `rows` that are due as published and
+        return their rows, the values to publish are in `values`.
+        """
+        due = rows[self.held_until[rows] <= timestamp]
+        self.held_until[due] = np.nan
+        # e.g. the entity became unavailable in the meantime
+        due = due[~np.isnan(self.values[due])]
+        self.published[due] = self.values[due]
+        self.published_at[due] = timestamp
+        return due
+
+    def value(self, entity_id: str) -> Optional[float]:
+        row = self.rows.get(entity_id)
+        if row is None or np.isnan(self.values[row]):
+            return None
+        return float(self.values[row])
+
+    def rows_of_kind(self, kind: str) -> np.ndarray:
+        return np.flatnonzero(self.kinds[: len(self)] == KIND_CODES[kind])
+
+    def snapshot(self) -> EntitySnapshot:
+        count = len(self)
+        return EntitySnapshot(
+            entity_ids=tuple(self.entity_ids),
+            kinds=self.kinds[:count].copy(),
+            values=self.values[:count].copy(),
+            updated=self.updated[:count].copy(),
+            changes=self.changes[:count].copy(),
+        )
@@ -0,0 +1,50 @@
+import asyncio
+from logging import Logger
+from typing import Dict, List, Optional, Tuple
+
+from src.integrations.base.integration import StateListener
+
+
+class StateFanout:
+    """
+    Collects state updates and delivers them to the listeners once per tick.
+    Within a tick only the latest value of every entity is kept, so listeners
+    see at most one update per entity and tick regardless of the packet rate.
+    """
+
+    def __init__(self, logger: Logger, tick: float = 0.1):
+        self.logger = logger
+        self.tick = tick
+        self.listeners: List[StateListener] = []
+
+        # updates received / delivered to the listeners, the difference was coalesced away
+        self.published = 0
+        self.delivered = 0
+
+        # entity id -> (value, timestamp) of the current tick
+        self._pending: Dict[str, Tuple[float, float]] = {}
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def publish(self, entity_id: str, value: float, timestamp: float):
+        if not self.listeners:
+            return
+
+        self.published += 1
+        self._pending[entity_id] = (value, timestamp)
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.tick, self.flush)
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        pending, self._pending = self._pending, {}
+        self.delivered += len(pending)
+        for listener in self.listeners:
+            for entity_id, (value, timestamp) in pending.items():
+                # a failing update must not keep the other entities of the tick from the listener
+                try:
+                    listener(entity_id, value, timestamp)
+                except Exception:
+                    self.logger.exception(f"State listener {listener} failed for {entity_id}")
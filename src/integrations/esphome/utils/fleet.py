@@ -0,0 +1,127 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import Dict, List, Optional
+
+from src.integrations.esphome.utils.device import ESPHomeDevice
+
+
+@dataclass
+class DeviceSchedule:
+    consecutive_failures: int = 0
+    next_attempt_at: float = 0.0
+    # the one operation (initialize or heartbeat) currently running for the device
+    task: Optional[asyncio.Task] = None
+
+
+class DeviceFleet:
+    """
+    Connects and heartbeats ESPHome devices concurrently. At most
+    `max_concurrency` operations run at the same time, each device has at most
+    one operation in flight, and devices that fail are retried with
+    exponential backoff and jitter instead of on every tick.
+
+    Connected devices are not polled, a disconnect reported by the device
+    schedules its reconnect right away (after `reboot_delay` if the device
+    announced it, e.g. while applying an OTA update).
+    """
+
+    def __init__(
+        self,
+        devices: List[ESPHomeDevice],
+        logger: Logger,
+        max_concurrency: int = 16,
+        operation_timeout: float = 10.0,
+        backoff_initial: float = 30.0,
+        backoff_max: float = 15 * 60.0,
+        reboot_delay: float = 5.0,
+    ):
+        self.devices = devices
+        self.logger = logger
+        self.operation_timeout = operation_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.reboot_delay = reboot_delay
+        self._closing = False
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._schedules: Dict[ESPHomeDevice, DeviceSchedule] = {device: DeviceSchedule() for device in devices}
+        for device in devices:
+            device.disconnect_listeners.append(self.on_disconnect)
+
+    def on_disconnect(self, device: ESPHomeDevice, expected_disconnect: bool):
+        schedule = self._schedules[device]
+        if self._closing or (schedule.task is not None and not schedule.task.done()):
+            # shutting down or disconnected by a running attempt, which handles the retry itself
+            return
+
+        delay = self.reboot_delay if expected_disconnect else 0.0
+        schedule.task = asyncio.create_task(self._run(device, schedule, delay))
+
+    def tick(self) -> int:
+        """
+        Start an operation for every disconnected device that is idle and not backing off.
+        Returns immediately, the operations run as tasks. Returns the number
+        of started operations.
+        """
+        now = time.monotonic()
+        started = 0
+        for device in self.devices:
+            if device.is_connected:
+                continue
+            schedule = self._schedules[device]
+            if schedule.task is not None and not schedule.task.done():
+                continue
+            if now < schedule.next_attempt_at:
+                continue
+
+            schedule.task = asyncio.create_task(self._run(device, schedule))
+            started += 1
+        return started
+
+    async def _run(self, device: ESPHomeDevice, schedule: DeviceSchedule, delay: float = 0.0):
+        delay = max(delay, schedule.next_attempt_at - time.monotonic())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        async with self._semaphore:
+            operation = device.heartbeat if device.is_initialized else device.initialize
+            try:
+                success = await asyncio.wait_for(operation(), timeout=self.operation_timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(f"Timed out waiting for ESPHome device {device.host}")
+                success = False
+            except Exception:
+                self.logger.exception(f"Operation on ESPHome device {device.host} failed")
+                success = False
+
+            if not success:
+                # drop a half open connection so that the next attempt starts clean
+                await device.disconnect()
+
+        if success:
+            schedule.consecutive_failures = 0
+            schedule.next_attempt_at = 0.0
+            return
+
+        schedule.consecutive_failures += 1
+        delay = min(self.backoff_max, self.backoff_initial * 2 ** (schedule.consecutive_failures - 1))
+        # add jitter so that devices that dropped together do not retry in lockstep
+        delay *= random.uniform(0.5, 1.0)
+        schedule.next_attempt_at = time.monotonic() + delay
+        self.logger.info(f"Retrying ESPHome device {device.host} in {delay:.0f} seconds")
+
+    async def wait(self):
+        tasks = [schedule.task for schedule in self._schedules.values() if schedule.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self):
+        self._closing = True
+        for schedule in self._schedules.values():
+            if schedule.task is not None:
+                schedule.task.cancel()
+        await self.wait()
+        await asyncio.gather(*(device.disconnect() for device in self.devices))
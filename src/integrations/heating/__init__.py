@@ -1,3 +1,5 @@
 from .integration import HeatingIntegration  # noqa: F401
 from .telegram import HeatingTelegramHandler  # noqa: F401
-from .utils.ems_client import EmsClient  # noqa: F401
+from .utils.ems_client import EmsClient, EmsUnavailable  # noqa: F401
+from .utils.ems_devices import BoilerInfo, EmsState  # noqa: F401
+from .utils.ems_mqtt import EmsMqttClient  # noqa: F401
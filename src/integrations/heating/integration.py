@@ -1,15 +1,22 @@
+import asyncio
+import dataclasses
+import time
 from dataclasses import dataclass
 from datetime import datetime
 from logging import Logger
-from typing import Callable, List, Optional
+from typing import Any, Callable, List, Optional
 
+import numpy as np
 import ujson
 import yaml
 from apscheduler.schedulers.base import BaseScheduler
 from omegaconf import DictConfig
 
-from src.integrations.base import BaseIntegration, Integration, TelegramHandler
-from src.integrations.heating.utils.ems_client import BoilerInfo, EmsClient
+from src.integrations.base import BaseIntegration, Integration, StateListener, TelegramHandler
+from src.integrations.heating.utils.ems_client import EmsClient, EmsUnavailable
+from src.integrations.heating.utils.ems_devices import BoilerInfo, EmsState
+from src.integrations.heating.utils.ems_mqtt import EmsMqttClient
+from src.integrations.heating.utils.heating_curve import curve, is_night
 from src.utils.persistant_state import PersistentState
 
 
@@ -38,6 +45,8 @@ class HeatingIntegration(Integration):
         telegram_handler: Optional[Callable[..., TelegramHandler]],
         boiler: EmsClient,
         state_overrides: DictConfig,
+        mqtt: Optional[EmsMqttClient] = None,
+        recalculate_interval: float = 60,
     ):
         super().__init__(
             config=config,
@@ -47,22 +56,41 @@ class HeatingIntegration(Integration):
             telegram_handler=telegram_handler,
         )
 
+        if mqtt is not None and not mqtt.is_available():
+            logger.error("MQTT mode needs the aiomqtt package, polling the boiler over HTTP instead")
+            mqtt = None
+
         self.boiler = boiler
+        # if set, boiler values are pushed over MQTT instead of being polled, writes still go over HTTP
+        self.mqtt = mqtt
         self.state_overrides = state_overrides
         self.last_boiler_info = None
+        # boiler and, if configured, DHW, thermostat and mixer circuits
+        self.last_ems_state: Optional[EmsState] = None
         self.target_supply_temperature: int = 0
+        self.state_listeners: List[StateListener] = []
+        # outside temperature, state and room target the target supply temperature was last applied for,
+        # only set once the boiler accepted the write
+        self.last_calculated_for: Optional[Any] = None
+        # queued write of the target supply temperature and the inputs it was calculated for
+        self.supply_temperature_write: Optional[asyncio.Future] = None
+        self.supply_temperature_write_for: Optional[Any] = None
 
         scheduler.add_job(self.initialize)
-        scheduler.add_job(
-            self.refresh,
-            "interval",
-            seconds=30,
-            next_run_time=datetime.now(scheduler.timezone),
-        )
+        if mqtt is None:
+            scheduler.add_job(
+                self.refresh,
+                "interval",
+                seconds=30,
+                next_run_time=datetime.now(scheduler.timezone),
+            )
+        else:
+            # catches day/night transitions and state edits between boiler messages
+            scheduler.add_job(self.recalculate, "interval", seconds=recalculate_interval)
 
     async def initialize(self):
         self.persistent_state: PersistentState[State] = PersistentState(
-            "heating", self.config.data_dir
+            "heating", self.config.data_dir, backend=self.config.get("state_backend"), logger=self.logger
         )
 
         # default values for heating state
@@ -89,6 +117,23 @@ class HeatingIntegration(Integration):
 
         self.logger.info(f"Initialized heating integration with state: {self.state}")
 
+        if self.mqtt is not None:
+            self.mqtt.listeners.append(self.on_ems_state)
+            self.mqtt.start()
+
+    def target_room_temperature(self) -> float:
+        now = datetime.now(tz=self.scheduler.timezone)
+        # check if we are in the night time (hours and minutes)
+        if is_night(
+            np.int64(now.hour * 60 + now.minute),
+            self.state.heating_curve_day_start_hour,
+            self.state.heating_curve_day_start_minute,
+            self.state.heating_curve_day_end_hour,
+            self.state.heating_curve_day_end_minute,
+        ):
+            return self.state.heating_curve_target_night_room_temperature
+        return self.state.heating_curve_target_room_temperature
+
     def calculate_supply_temperature(self) -> int:
         if self.state.heating_active is False:
             return 0
@@ -99,59 +144,80 @@ class HeatingIntegration(Integration):
             )
             return 0
 
-        target_room_temperature = self.state.heating_curve_target_room_temperature
-        now = datetime.now(tz=self.scheduler.timezone)
-        # check if we are in the night time (hours and minutes)
-        if (
-            now.hour < self.state.heating_curve_day_start_hour
-            or now.hour > self.state.heating_curve_day_end_hour
-            or (
-                now.hour == self.state.heating_curve_day_start_hour
-                and now.minute < self.state.heating_curve_day_start_minute
-            )
-            or (
-                now.hour == self.state.heating_curve_day_end_hour
-                and now.minute > self.state.heating_curve_day_end_minute
+        # same formula as the simulator in utils.heating_curve
+        return int(
+            curve(
+                self.last_boiler_info.outside_temperature,
+                self.target_room_temperature(),
+                self.state.heating_curve_inclination,
+                self.state.heating_curve_parallel_shift,
+                self.state.heating_curve_min_supply_temperature,
+                self.state.heating_curve_max_supply_temperature,
             )
-        ):
-            target_room_temperature = (
-                self.state.heating_curve_target_night_room_temperature
-            )
-
-        outside_temperature = self.last_boiler_info.outside_temperature
-        dar = outside_temperature - target_room_temperature
-        target_supply_temperature = (
-            target_room_temperature
-            + self.state.heating_curve_parallel_shift
-            - self.state.heating_curve_inclination
-            * dar
-            * (1.4347 + 0.021 * dar + 247.9 * 10**-6 * dar**2)
         )
 
-        if target_supply_temperature < self.state.heating_curve_min_supply_temperature:
-            return self.state.heating_curve_min_supply_temperature
-        elif (
-            target_supply_temperature > self.state.heating_curve_max_supply_temperature
-        ):
-            return self.state.heating_curve_max_supply_temperature
-        else:
-            return round(target_supply_temperature)
-
     async def refresh(self):
         self.logger.info("Refreshing heating integration")
 
+        boiler_info: Optional[BoilerInfo] = None
         try:
-            boiler_info: BoilerInfo = await self.boiler.info()
+            ems_state = await self.boiler.poll()
+            boiler_info = ems_state.boiler
+            self.last_ems_state = ems_state
             self.last_boiler_info = boiler_info
             # Only used for informational purposes!
             self.last_boiler_info_timestamp = datetime.now()
             self.last_ems_error = None
             self.logger.info("Retrieved boiler_info {}".format(yaml.dump(boiler_info)))
+            self.publish_ems_state(ems_state)
+        except EmsUnavailable as e:
+            self.last_ems_error = e
+            self.logger.warning(f"Failed to retrieve boiler_info: {e}")
         except Exception as e:
             self.last_ems_error = e
             self.logger.exception("Failed to retrieve boiler_info")
             # TODO: Notify user
 
+        self.apply_supply_temperature(
+            observed=boiler_info.selected_flow_temperature if boiler_info is not None else None
+        )
+
+    def on_ems_state(self, ems_state: EmsState):
+        self.last_ems_state = ems_state
+        self.last_boiler_info = ems_state.boiler
+        self.last_boiler_info_timestamp = datetime.now()
+        self.last_ems_error = None
+        self.publish_ems_state(ems_state)
+        self.recalculate_if_changed()
+
+    async def recalculate(self):
+        self.recalculate_if_changed()
+
+    def recalculate_if_changed(self):
+        """
+        Recalculate and write the target supply temperature if the outside
+        temperature, the state or the room target (day/night) changed since
+        it was last applied, or if the boiler reports a different one. Used
+        with MQTT, where boiler values arrive far more often than they change.
+        """
+        if self.last_boiler_info is None:
+            return
+
+        inputs = (
+            self.last_boiler_info.outside_temperature,
+            dataclasses.astuple(self.state),
+            self.target_room_temperature(),
+        )
+        observed = self.last_boiler_info.selected_flow_temperature
+        if self.supply_temperature_write is not None and not self.supply_temperature_write.done():
+            # the boiler reports the old value until the queued write is sent
+            if inputs == self.supply_temperature_write_for:
+                return
+        elif inputs == self.last_calculated_for and self.target_supply_temperature in (0, observed):
+            return
+        self.apply_supply_temperature(observed=observed, inputs=inputs)
+
+    def apply_supply_temperature(self, observed: Optional[int] = None, inputs: Optional[Any] = None):
         self.target_supply_temperature = self.calculate_supply_temperature()
         self.logger.info(
             f"Calculated target supply temperature: {self.target_supply_temperature}"
@@ -159,20 +225,61 @@ class HeatingIntegration(Integration):
 
         if self.target_supply_temperature == 0:
             self.logger.info("Target supply temperature is 0, not setting it!")
+            self.last_calculated_for = inputs
             return
 
-        response = await self.boiler.set_variable(
-            "selflowtemp", self.target_supply_temperature
-        )
-
-        self.logger.info(
-            f"Set target supply temperature, response: {ujson.dumps(response)}"
-        )
+        # skipped if the boiler already runs with this temperature, otherwise queued and
+        # sent once the minimum write interval of selflowtemp has passed
+        write = self.boiler.write("selflowtemp", self.target_supply_temperature, observed=observed)
+        if write.done() and write.result() is None:
+            self.logger.info("Target supply temperature is unchanged, not setting it")
+            self.last_calculated_for = inputs
+            return
+        self.supply_temperature_write, self.supply_temperature_write_for = write, inputs
+        write.add_done_callback(self.on_supply_temperature_written)
 
-        if response["message"] != "OK":
-            self.logger.error("Failed to set target supply temperature")
+    def on_supply_temperature_written(self, write: "asyncio.Future"):
+        if write.cancelled():
+            return
+        if write.exception() is not None:
+            # already logged by the client, retried with the next boiler values
             # TODO: Notify user
+            return
+
+        response = write.result()
+        if response is not None:
+            self.logger.info(f"Set target supply temperature, response: {ujson.dumps(response)}")
+            if response.get("message") != "OK":
+                return
+        if write is self.supply_temperature_write:
+            self.last_calculated_for = self.supply_temperature_write_for
+
+    def add_state_listener(self, listener: StateListener):
+        self.state_listeners.append(listener)
+
+    def publish_ems_state(self, ems_state: EmsState):
+        timestamp = time.time()
+        devices = [
+            (self.boiler.device_name, ems_state.boiler),
+            ("dhw", ems_state.dhw),
+            ("thermostat", ems_state.thermostat),
+        ]
+        devices += [(f"mixer_{mixer.circuit}", mixer) for mixer in ems_state.mixers]
+
+        for device, info in devices:
+            if info is None:
+                continue
+            for field in dataclasses.fields(info):
+                value = getattr(info, field.name)
+                # bools are ints as well, strings (service codes) and missing values are not recorded
+                if isinstance(value, (int, float)):
+                    entity_id = f"{device}.{field.name}"
+                    for listener in self.state_listeners:
+                        listener(entity_id, float(value), timestamp)
 
     async def shutdown(self):
+        if self.mqtt is not None:
+            await self.mqtt.close()
+        await self.persistent_state.close()
         await self.boiler.close()
         return await super().shutdown()
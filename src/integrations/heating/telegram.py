@@ -143,7 +143,7 @@ class HeatingTelegramHandler(TelegramHandler[HeatingIntegration]):
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ) -> int:
         value: str = update.message.text  # type: ignore
-        old_value = getattr(self.state, context.user_data["key"])  # type: ignore
+        old_value = getattr(self.integration.state, context.user_data["key"])  # type: ignore
 
         key = context.user_data["key"]  # type: ignore
 
@@ -164,8 +164,7 @@ class HeatingTelegramHandler(TelegramHandler[HeatingIntegration]):
                 f"Failed to convert {value} to {type(old_value)}"
             )
         else:
-            setattr(self.integration.state, key, new_value)
-            await self.integration.persistent_state.set(self.integration.state)
+            await self.integration.persistent_state.update(**{key: new_value})
 
             await update.message.reply_text(  # type: ignore
                 f"Ok, setting {key} from {old_value} to {value}..."
@@ -191,10 +190,9 @@ class HeatingTelegramHandler(TelegramHandler[HeatingIntegration]):
     ) -> int:
         query = update.callback_query
         await query.answer()  # type: ignore
-        self.integration.state.heating_active = (
-            not self.integration.state.heating_active
+        await self.integration.persistent_state.update(
+            heating_active=not self.integration.state.heating_active
         )
-        await self.integration.persistent_state.set(self.integration.state)
         self.logger.info(
             f"Set heating_active to {self.integration.state.heating_active}"
         )
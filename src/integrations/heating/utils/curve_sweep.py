@@ -0,0 +1,201 @@
+import dataclasses
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import numpy as np
+
+from src.integrations.heating.utils.heating_curve import curve
+
+S = TypeVar("S")
+
+# swept `heating.State` fields, the columns of a candidate
+PARAMETERS = (
+    "heating_curve_inclination",
+    "heating_curve_parallel_shift",
+    "heating_curve_min_supply_temperature",
+    "heating_curve_max_supply_temperature",
+)
+INTEGER_PARAMETERS = ("heating_curve_min_supply_temperature", "heating_curve_max_supply_temperature")
+# input series, `reference` is optional
+SERIES = ("timestamps", "outside_temperature", "target_room_temperature", "reference")
+
+# supply temperatures of one candidate and the input series -> score, lower is better
+Objective = Callable[[np.ndarray, Dict[str, np.ndarray]], float]
+
+
+def energy(supply_temperature: np.ndarray, inputs: Dict[str, np.ndarray]) -> float:
+    # mean supply temperature above the room, roughly proportional to the radiator output
+    return float(np.nanmean(np.maximum(supply_temperature - inputs["target_room_temperature"], 0)))
+
+
+def underheat(supply_temperature: np.ndarray, inputs: Dict[str, np.ndarray]) -> float:
+    # mean shortfall against the reference, e.g. the flow temperature that kept the house warm
+    return float(np.nanmean(np.maximum(inputs["reference"] - supply_temperature, 0)))
+
+
+def tracking(supply_temperature: np.ndarray, inputs: Dict[str, np.ndarray]) -> float:
+    return float(np.sqrt(np.nanmean((supply_temperature - inputs["reference"]) ** 2)))
+
+
+def changes(supply_temperature: np.ndarray, inputs: Dict[str, np.ndarray]) -> float:
+    # target changes per day, every change is a write to the boiler
+    days = (inputs["timestamps"][-1] - inputs["timestamps"][0]) / 86400
+    return float(np.count_nonzero(np.abs(np.diff(supply_temperature)) > 0) / max(days, 1 / 24))
+
+
+OBJECTIVES: Dict[str, Objective] = {
+    "energy": energy,
+    "underheat": underheat,
+    "tracking": tracking,
+    "changes": changes,
+}
+REFERENCE_OBJECTIVES = ("underheat", "tracking")
+
+
+def grid(space: Dict[str, Sequence[float]]) -> np.ndarray:
+    """
+    All combinations of the values given for every parameter in PARAMETERS,
+    one candidate per row.
+    """
+    candidates = np.array(list(itertools.product(*(space[parameter] for parameter in PARAMETERS))), dtype=np.float64)
+    return _valid(candidates)
+
+
+def random_candidates(bounds: Dict[str, Tuple[float, float]], count: int, seed: int = 0) -> np.ndarray:
+    """
+    `count` candidates drawn uniformly from `(low, high)` per parameter,
+    supply temperatures are whole degrees.
+    """
+    rng = np.random.default_rng(seed)
+    candidates = np.column_stack([rng.uniform(*bounds[parameter], size=count) for parameter in PARAMETERS])
+    for parameter in INTEGER_PARAMETERS:
+        column = PARAMETERS.index(parameter)
+        candidates[:, column] = np.round(candidates[:, column])
+    return _valid(candidates)
+
+
+def _valid(candidates: np.ndarray) -> np.ndarray:
+    minimum, maximum = PARAMETERS.index(INTEGER_PARAMETERS[0]), PARAMETERS.index(INTEGER_PARAMETERS[1])
+    return candidates[candidates[:, minimum] < candidates[:, maximum]]
+
+
+def pareto_front(scores: np.ndarray) -> np.ndarray:
+    """
+    Indices of the rows not dominated by any other row (all objectives minimized).
+    """
+    # NaN scores (e.g. an objective without data) never dominate and are never on the front
+    scores = np.where(np.isnan(scores), np.inf, scores)
+    front = np.ones(len(scores), dtype=bool)
+    for index, row in enumerate(scores):
+        if not front[index]:
+            continue
+        dominated = np.all(row <= scores, axis=1) & np.any(row < scores, axis=1)
+        front &= ~dominated
+    return np.flatnonzero(front & np.all(np.isfinite(scores), axis=1))
+
+
+@dataclass
+class SweepResult:
+    objectives: List[str]
+    # one row per candidate, columns in the order of PARAMETERS and `objectives`
+    candidates: np.ndarray
+    scores: np.ndarray
+    front: np.ndarray
+
+    def parameters(self, index: int) -> Dict[str, Union[int, float]]:
+        return {
+            parameter: int(value) if parameter in INTEGER_PARAMETERS else round(float(value), 3)
+            for parameter, value in zip(PARAMETERS, self.candidates[index])
+        }
+
+    def propose(self, state: S, index: int) -> S:
+        """
+        A copy of `state` (a `heating.State`) with the curve parameters of candidate `index`.
+        """
+        return dataclasses.replace(state, **self.parameters(index))  # type: ignore
+
+
+# input series of the worker processes, views into shared memory
+_inputs: Dict[str, np.ndarray] = {}
+_shared: Optional[shared_memory.SharedMemory] = None
+
+
+def _attach(name: str, rows: List[str], length: int) -> None:
+    global _shared
+    _shared = shared_memory.SharedMemory(name=name)
+    block = np.ndarray((len(rows), length), dtype=np.float64, buffer=_shared.buf)
+    _inputs.clear()
+    _inputs.update(zip(rows, block))
+
+
+def _evaluate(
+    candidates: np.ndarray, objectives: Sequence[Union[str, Objective]], inputs: Optional[Dict[str, np.ndarray]] = None
+) -> np.ndarray:
+    inputs = inputs if inputs is not None else _inputs
+    functions = [OBJECTIVES[objective] if isinstance(objective, str) else objective for objective in objectives]
+    scores = np.empty((len(candidates), len(functions)))
+    for row, (inclination, parallel_shift, min_supply, max_supply) in enumerate(candidates):
+        supply_temperature = curve(
+            inputs["outside_temperature"],
+            inputs["target_room_temperature"],
+            inclination,
+            parallel_shift,
+            min_supply,
+            max_supply,
+        )
+        scores[row] = [function(supply_temperature, inputs) for function in functions]
+    return scores
+
+
+def sweep(
+    candidates: np.ndarray,
+    inputs: Dict[str, np.ndarray],
+    objectives: Sequence[Union[str, Objective]] = ("energy", "underheat"),
+    workers: Optional[int] = None,
+    chunk_size: int = 16,
+) -> SweepResult:
+    """
+    Score every candidate on the input series (see SERIES, all of the same
+    length) across `workers` processes, default all cores. The series are
+    shared with the workers through shared memory instead of being pickled
+    per task. Custom objectives must be picklable (module level functions).
+    """
+    for objective in objectives:
+        if isinstance(objective, str) and objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective {objective}, expected one of {list(OBJECTIVES)}")
+        if objective in REFERENCE_OBJECTIVES and inputs.get("reference") is None:
+            raise ValueError(f"Objective {objective} needs a reference series")
+
+    names = [objective if isinstance(objective, str) else objective.__name__ for objective in objectives]
+    rows = [name for name in SERIES if inputs.get(name) is not None]
+    length = len(inputs["timestamps"])
+    chunks = [candidates[start : start + chunk_size] for start in range(0, len(candidates), chunk_size)]
+    workers = workers if workers is not None else os.cpu_count() or 1
+
+    if workers <= 1 or len(chunks) <= 1:
+        series = {name: np.asarray(inputs[name], dtype=np.float64) for name in rows}
+        results = [_evaluate(chunk, objectives, series) for chunk in chunks]
+    else:
+        shared = shared_memory.SharedMemory(create=True, size=len(rows) * length * 8)
+        try:
+            block = np.ndarray((len(rows), length), dtype=np.float64, buffer=shared.buf)
+            try:
+                for row, name in enumerate(rows):
+                    block[row] = inputs[name]
+            finally:
+                # close() raises BufferError while a view of the buffer exists
+                del block
+            with ProcessPoolExecutor(workers, initializer=_attach, initargs=(shared.name, rows, length)) as executor:
+                results = list(executor.map(_evaluate, chunks, itertools.repeat(objectives)))
+        finally:
+            try:
+                shared.close()
+            finally:
+                shared.unlink()
+
+    scores = np.concatenate(results) if results else np.empty((0, len(objectives)))
+    return SweepResult(names, candidates, scores, pareto_front(scores))
@@ -1,27 +1,73 @@
+import asyncio
+import random
+import time
 from dataclasses import dataclass
 from logging import Logger
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 import aiohttp
 import ujson
 
+from src.integrations.heating.utils.ems_devices import (
+    BoilerInfo,
+    DhwInfo,
+    EmsState,
+    MixerInfo,
+    ThermostatInfo,
+    from_ems,
+)
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+class EmsUnavailable(Exception):
+    pass
+
 
 @dataclass
-class BoilerInfo:
-    heating_active: bool
-    selected_flow_temperature: int
-    heating_pump_modulation: int
-    outside_temperature: float
-    current_flow_temperature: float
-    flame_current: float
-    heating_pump: bool
-    service_code_number: int
-    service_code: str
-    maintenance_message: str
+class WriteStats:
+    # writes sent to the gateway
+    sent: int = 0
+    # writes skipped because the gateway already has the value
+    suppressed: int = 0
+    # writes replaced by a newer value for the same variable before they were sent
+    merged: int = 0
+    failed: int = 0
 
 
 class EmsClient:
-    def __init__(self, host: str, access_token: str, device_name: str, logger: Logger):
+    """
+    Writes go through a queue: a write is skipped if the value equals the
+    last acknowledged (or the observed) value of the variable, writes to the
+    same variable are at least `min_write_interval` seconds apart and a newer
+    value replaces a queued one instead of being sent after it.
+
+    Requests time out, are retried a bounded number of times with jittered
+    backoff and fail fast with `EmsUnavailable` while the circuit breaker is
+    open, so a single call takes at most about
+    `(retries + 1) * (connect_timeout + read_timeout)` plus the backoff.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        access_token: str,
+        device_name: str,
+        logger: Logger,
+        min_write_interval: float = 0.0,
+        min_write_intervals: Optional[Dict[str, float]] = None,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 5.0,
+        retries: int = 1,
+        retry_backoff: float = 0.5,
+        failure_threshold: int = 3,
+        reset_timeout: float = 60.0,
+        # the gateway is a single ESP32: a few connections (one per polled device), dropped before it does
+        connection_limit: int = 3,
+        keepalive_timeout: float = 10.0,
+        thermostat_circuit: Optional[str] = None,
+        mixer_circuits: Optional[List[str]] = None,
+        read_dhw: bool = False,
+    ):
         self.host = host
         self.access_token = access_token
         self.device_name = device_name
@@ -32,40 +78,214 @@ class EmsClient:
         }
 
         self.session: Optional[aiohttp.ClientSession] = None
+        # sock_read only limits the gap between two reads, total bounds an attempt against a trickling gateway
+        self.timeout = aiohttp.ClientTimeout(
+            total=connect_timeout + read_timeout, connect=connect_timeout, sock_read=read_timeout
+        )
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.connection_limit = connection_limit
+        self.keepalive_timeout = keepalive_timeout
+        # additional EMS devices polled next to the boiler
+        self.thermostat_circuit = thermostat_circuit
+        self.mixer_circuits = list(mixer_circuits) if mixer_circuits else []
+        self.read_dhw = read_dhw
+        self.breaker = CircuitBreaker(f"EMS-ESP gateway {host}", failure_threshold, reset_timeout)
+
+        # default and per variable minimum seconds between two writes
+        self.min_write_interval = min_write_interval
+        self.min_write_intervals = dict(min_write_intervals) if min_write_intervals else {}
+        self.write_stats = WriteStats()
+        # last value per variable the gateway answered with OK to
+        self.acknowledged: Dict[str, Any] = {}
+        self._written_at: Dict[str, float] = {}
+        # variable -> latest value and the futures of every write it replaced
+        self._pending: Dict[str, Any] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+        self._write_task: Optional[asyncio.Task] = None
 
     async def create_session_if_necessary(self):
         if self.session is None:
             self.session = aiohttp.ClientSession(
-                self.host, headers=self.headers, json_serialize=ujson.dumps
+                self.host,
+                headers=self.headers,
+                json_serialize=ujson.dumps,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=self.connection_limit, keepalive_timeout=self.keepalive_timeout
+                ),
             )
 
-    def url(self, path: Optional[str] = None) -> str:
-        return f"/api/{self.device_name}/{path}" if path else f"/api/{self.device_name}"
+    def url(self, path: Optional[str] = None, device: Optional[str] = None) -> str:
+        device = device or self.device_name
+        return f"/api/{device}/{path}" if path else f"/api/{device}"
 
-    async def set_variable(self, variable: str, value: Any):
+    async def request(self, method: str, path: str, json: Any = None) -> Any:
+        try:
+            trial = self.breaker.before_call()
+        except CircuitOpen as e:
+            raise EmsUnavailable(str(e)) from e
+
+        try:
+            return await self._request(method, path, json)
+        except BaseException:
+            # outcomes are recorded by _request, but a cancelled half-open trial must not block all later calls
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+    async def _request(self, method: str, path: str, json: Any = None) -> Any:
         await self.create_session_if_necessary()
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session.request(method, path, json=json) as response:  # type: ignore
+                    response.raise_for_status()
+                    result = await response.json(loads=ujson.loads, content_type=None)
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500:
+                    # the gateway is up but rejects the request (e.g. a wrong access token), retrying will not help
+                    self.breaker.record_success()
+                    raise
+                error: Exception = e
+            except Exception as e:
+                # connection errors, timeouts, but also e.g. a response body that is not JSON
+                error = e
+            else:
+                self.breaker.record_success()
+                return result
+
+            if attempt < self.retries:
+                delay = self.retry_backoff * 2**attempt * random.uniform(0.5, 1.0)
+                self.logger.debug(f"Request to {path} failed ({error!r}), retrying in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+
+        self.breaker.record_failure()
+        raise EmsUnavailable(f"Request to {path} failed after {self.retries + 1} attempts: {error!r}") from error
+
+    async def post_variable(self, variable: str, value: Any):
+        return await self.request("POST", self.url(), json={"cmd": variable, "data": value})
+
+    async def set_variable(self, variable: str, value: Any, observed: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Write a variable and wait for the gateway response, None if the write was skipped.
+        """
+        return await self.write(variable, value, observed)
 
-        async with self.session.post(self.url(), json={"cmd": variable, "data": value}) as response:  # type: ignore
-            return await response.json()
+    def write(self, variable: str, value: Any, observed: Any = None) -> "asyncio.Future[Optional[Dict[str, Any]]]":
+        """
+        Queue a write without waiting for it. `observed` is the value the
+        gateway currently reports for the variable, if known; it takes
+        precedence over the last acknowledged value, e.g. after a gateway reboot.
+        """
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        current = observed if observed is not None else self.acknowledged.get(variable)
+        if variable not in self._pending and current == value:
+            self.write_stats.suppressed += 1
+            future.set_result(None)
+            return future
+
+        if variable in self._pending:
+            self.write_stats.merged += 1
+        self._pending[variable] = value
+        self._waiters.setdefault(variable, []).append(future)
+        if observed is not None:
+            # the gateway lost or changed the value, the acknowledgement is stale
+            if self.acknowledged.get(variable) != observed:
+                self.acknowledged.pop(variable, None)
+
+        if self._write_task is None or self._write_task.done():
+            self._write_task = asyncio.create_task(self._write_loop())
+        self._wakeup.set()
+        return future
+
+    def _due_at(self, variable: str) -> float:
+        interval = self.min_write_intervals.get(variable, self.min_write_interval)
+        return self._written_at.get(variable, -interval) + interval
+
+    async def _write_loop(self):
+        while self._pending:
+            variable = min(self._pending, key=self._due_at)
+            delay = self._due_at(variable) - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    # a new write may be due earlier
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            value = self._pending.pop(variable)
+            waiters = self._waiters.pop(variable, [])
+            try:
+                if self.acknowledged.get(variable) == value:
+                    self.write_stats.suppressed += 1
+                    response = None
+                else:
+                    response = await self.post_variable(variable, value)
+                    self.write_stats.sent += 1
+                    self._written_at[variable] = time.monotonic()
+                    if response.get("message") == "OK":
+                        self.acknowledged[variable] = value
+                    else:
+                        self.write_stats.failed += 1
+                        self.logger.error(f"Failed to set {variable} to {value}: {response}")
+            except Exception as e:
+                self.write_stats.failed += 1
+                if isinstance(e, EmsUnavailable):
+                    self.logger.warning(f"Failed to set {variable} to {value}: {e}")
+                else:
+                    self.logger.exception(f"Failed to set {variable} to {value}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(response)
 
     async def info(self) -> BoilerInfo:
-        await self.create_session_if_necessary()
+        return from_ems(BoilerInfo, await self.request("GET", self.url("info")))
 
-        async with self.session.get(self.url("info")) as response:  # type: ignore
-            json = await response.json()
-
-            return BoilerInfo(
-                heating_active=json["heating active"] == "on",
-                selected_flow_temperature=json["selected flow temperature"],
-                heating_pump_modulation=json["heating pump modulation"],
-                outside_temperature=json["outside temperature"],
-                current_flow_temperature=json["current flow temperature"],
-                flame_current=json["flame current"],
-                heating_pump=json["heating pump"] == "on",
-                service_code_number=json["service code number"],
-                service_code=json["service code"],
-                maintenance_message=json["maintenance message"],
-            )
+    async def poll(self) -> EmsState:
+        """
+        Fetch the boiler and the configured thermostat and mixer circuits
+        concurrently. Only a failing boiler request fails the poll, the other
+        devices are left empty.
+        """
+        devices = [self.device_name]
+        if self.thermostat_circuit is not None:
+            devices.append("thermostat")
+        if self.mixer_circuits:
+            devices.append("mixer")
+
+        responses = await asyncio.gather(
+            *(self.request("GET", self.url("info", device)) for device in devices), return_exceptions=True
+        )
+        infos: Dict[str, Any] = {}
+        for device, response in zip(devices, responses):
+            if isinstance(response, BaseException):
+                if device == self.device_name:
+                    raise response
+                self.logger.warning(f"Failed to retrieve {device} info: {response!r}")
+            else:
+                infos[device] = response
+
+        boiler = infos[self.device_name]
+        state = EmsState(boiler=from_ems(BoilerInfo, boiler))
+        if self.read_dhw:
+            state.dhw = from_ems(DhwInfo, boiler)
+        if "thermostat" in infos:
+            state.thermostat = from_ems(ThermostatInfo, infos["thermostat"], circuit=self.thermostat_circuit)
+        if "mixer" in infos:
+            state.mixers = [from_ems(MixerInfo, infos["mixer"], circuit=circuit) for circuit in self.mixer_circuits]
+        return state
 
     async def close(self):
-        await self.session.close()  # type: ignore
+        if self._write_task is not None:
+            self._write_task.cancel()
+        if self.session is not None:
+            await self.session.close()
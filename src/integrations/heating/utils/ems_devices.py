@@ -0,0 +1,103 @@
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union
+
+T = TypeVar("T")
+
+
+def on_off(value: Any) -> bool:
+    return value in ("on", True, 1)
+
+
+def ems_field(
+    *path: str,
+    mqtt: Union[str, Tuple[str, ...], None] = None,
+    convert: Optional[Callable[[Any], Any]] = None,
+    required: bool = False,
+) -> Any:
+    """
+    Declare where a dataclass field comes from in the EMS-ESP `info` JSON and,
+    with its short value names, in the JSON published over MQTT. Path parts may
+    contain placeholders (e.g. `{circuit}`) filled in by `from_ems`. Optional
+    fields default to None if the gateway does not report them.
+    """
+    mqtt_path = (mqtt,) if isinstance(mqtt, str) else mqtt
+    metadata = {"ems_path": path, "ems_mqtt_path": mqtt_path, "ems_convert": convert, "ems_required": required}
+    if required:
+        return field(metadata=metadata)
+    return field(default=None, metadata=metadata)
+
+
+def from_ems(cls: Type[T], json: Dict[str, Any], mqtt: bool = False, **placeholders: str) -> T:
+    kwargs = {}
+    for dataclass_field in dataclasses.fields(cls):  # type: ignore
+        path = dataclass_field.metadata.get("ems_mqtt_path" if mqtt else "ems_path")
+        if path is None:
+            # e.g. the circuit a mixer info belongs to
+            if dataclass_field.name in placeholders:
+                kwargs[dataclass_field.name] = placeholders[dataclass_field.name]
+            continue
+
+        value: Any = json
+        for part in path:
+            part = part.format(**placeholders)
+            if not isinstance(value, dict) or part not in value:
+                if dataclass_field.metadata["ems_required"]:
+                    raise KeyError(f"EMS-ESP did not report {'/'.join(path)} for {cls.__name__}")
+                value = None
+                break
+            value = value[part]
+
+        convert = dataclass_field.metadata["ems_convert"]
+        kwargs[dataclass_field.name] = convert(value) if convert is not None and value is not None else value
+    return cls(**kwargs)
+
+
+@dataclass
+class BoilerInfo:
+    heating_active: bool = ems_field("heating active", mqtt="heatingactive", convert=on_off, required=True)
+    selected_flow_temperature: int = ems_field("selected flow temperature", mqtt="selflowtemp", required=True)
+    heating_pump_modulation: int = ems_field("heating pump modulation", mqtt="heatingpumpmod", required=True)
+    outside_temperature: float = ems_field("outside temperature", mqtt="outdoortemp", required=True)
+    current_flow_temperature: float = ems_field("current flow temperature", mqtt="curflowtemp", required=True)
+    flame_current: float = ems_field("flame current", mqtt="flamecurr", required=True)
+    heating_pump: bool = ems_field("heating pump", mqtt="heatingpump", convert=on_off, required=True)
+    service_code_number: int = ems_field("service code number", mqtt="servicecodenumber", required=True)
+    service_code: str = ems_field("service code", mqtt="servicecode", required=True)
+    maintenance_message: str = ems_field("maintenance message", mqtt="maintenancemessage", required=True)
+
+
+@dataclass
+class DhwInfo:
+    # part of the boiler info (and the MQTT boiler_data), nested under "dhw" since EMS-ESP 3.7
+    selected_temperature: Optional[float] = ems_field("dhw", "selected temperature", mqtt=("dhw", "seltemp"))
+    current_temperature: Optional[float] = ems_field("dhw", "current intern temperature", mqtt=("dhw", "curtemp"))
+    charging: Optional[bool] = ems_field("dhw", "charging", mqtt=("dhw", "charging"), convert=on_off)
+    active: Optional[bool] = ems_field("dhw", "dhw active", mqtt=("dhw", "active"), convert=on_off)
+
+
+@dataclass
+class ThermostatInfo:
+    selected_room_temperature: Optional[float] = ems_field(
+        "{circuit}", "selected room temperature", mqtt=("{circuit}", "seltemp")
+    )
+    current_room_temperature: Optional[float] = ems_field(
+        "{circuit}", "current room temperature", mqtt=("{circuit}", "currtemp")
+    )
+    mode: Optional[str] = ems_field("{circuit}", "mode", mqtt=("{circuit}", "mode"))
+
+
+@dataclass
+class MixerInfo:
+    circuit: str
+    flow_temperature: Optional[float] = ems_field("{circuit}", "flow temperature hc", mqtt=("{circuit}", "flowtemphc"))
+    pump: Optional[bool] = ems_field("{circuit}", "pump status", mqtt=("{circuit}", "pumpstatus"), convert=on_off)
+    valve: Optional[int] = ems_field("{circuit}", "valve status", mqtt=("{circuit}", "valvestatus"))
+
+
+@dataclass
+class EmsState:
+    boiler: BoilerInfo
+    dhw: Optional[DhwInfo] = None
+    thermostat: Optional[ThermostatInfo] = None
+    mixers: List[MixerInfo] = field(default_factory=list)
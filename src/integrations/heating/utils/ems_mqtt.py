@@ -0,0 +1,188 @@
+import asyncio
+import importlib.util
+import random
+from logging import Logger
+from typing import Any, Callable, Dict, List, Optional
+
+import ujson
+
+from src.integrations.heating.utils.ems_devices import (
+    BoilerInfo,
+    DhwInfo,
+    EmsState,
+    MixerInfo,
+    ThermostatInfo,
+    from_ems,
+)
+
+EmsStateListener = Callable[[EmsState], None]
+
+
+def merge(target: Dict[str, Any], update: Dict[str, Any]) -> None:
+    # EMS-ESP may publish only the changed values of a device
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+class EmsMqttClient:
+    """
+    Receives the values EMS-ESP publishes to `<base_topic>/<device>_data`
+    (nested format) and calls the listeners with a new `EmsState` for every
+    boiler message, thermostat and mixer messages only update the values
+    included in the next one. Needs the optional `aiomqtt` package.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        logger: Logger,
+        port: int = 1883,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        base_topic: str = "ems-esp",
+        device_name: str = "boiler",
+        thermostat_circuit: Optional[str] = None,
+        mixer_circuits: Optional[List[str]] = None,
+        read_dhw: bool = False,
+        keepalive: int = 60,
+        reconnect_interval: float = 5.0,
+        reconnect_interval_max: float = 300.0,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.logger = logger
+        self.base_topic = base_topic.rstrip("/")
+        self.device_name = device_name
+        self.thermostat_circuit = thermostat_circuit
+        self.mixer_circuits = list(mixer_circuits) if mixer_circuits else []
+        self.read_dhw = read_dhw
+        self.keepalive = keepalive
+        self.reconnect_interval = reconnect_interval
+        self.reconnect_interval_max = reconnect_interval_max
+
+        self.listeners: List[EmsStateListener] = []
+        self.is_connected = False
+        self.messages = 0
+        # last values per device, merged from all messages since the start
+        self.payloads: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def is_available() -> bool:
+        return importlib.util.find_spec("aiomqtt") is not None
+
+    def topic(self, device: str) -> str:
+        return f"{self.base_topic}/{device}_data"
+
+    @property
+    def devices(self) -> List[str]:
+        devices = [self.device_name]
+        if self.thermostat_circuit is not None:
+            devices.append("thermostat")
+        if self.mixer_circuits:
+            devices.append("mixer")
+        return devices
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # imported here so that the heating integration works without aiomqtt when polling over HTTP
+        try:
+            import aiomqtt
+        except ImportError:
+            self.logger.error("Receiving EMS-ESP values over MQTT needs the aiomqtt package")
+            return
+
+        topics = {self.topic(device): device for device in self.devices}
+        failures = 0
+        while True:
+            try:
+                async with aiomqtt.Client(
+                    self.host,
+                    self.port,
+                    username=self.username,
+                    password=self.password,
+                    keepalive=self.keepalive,
+                ) as client:
+                    for topic in topics:
+                        await client.subscribe(topic)
+                    self.is_connected = True
+                    failures = 0
+                    self.logger.info(f"Subscribed to EMS-ESP values on {self.host}:{self.port} ({', '.join(topics)})")
+
+                    async for message in client.messages:
+                        device = topics.get(message.topic.value)
+                        if device is not None:
+                            self.handle(device, message.payload)  # type: ignore
+            except Exception as e:
+                # anything else would end the task and no boiler values would arrive anymore
+                self.is_connected = False
+                failures += 1
+                delay = min(self.reconnect_interval * 2 ** (failures - 1), self.reconnect_interval_max)
+                delay *= random.uniform(0.8, 1.2)
+                if isinstance(e, aiomqtt.MqttError):
+                    self.logger.warning(
+                        f"MQTT connection to {self.host}:{self.port} lost ({e}), retrying in {delay:.0f}s"
+                    )
+                else:
+                    self.logger.exception(f"Receiving EMS-ESP values over MQTT failed, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+
+    def handle(self, device: str, payload: bytes):
+        try:
+            values = ujson.loads(payload)
+        except ValueError:
+            self.logger.warning(f"Ignoring malformed {device} message: {payload[:100]!r}")
+            return
+        if not isinstance(values, dict):
+            return
+
+        self.messages += 1
+        merge(self.payloads.setdefault(device, {}), values)
+        if device != self.device_name:
+            return
+
+        try:
+            state = self.ems_state()
+        except KeyError as e:
+            # e.g. only a part of the values has been published so far
+            self.logger.debug(f"Incomplete boiler values: {e}")
+            return
+
+        for listener in self.listeners:
+            try:
+                listener(state)
+            except Exception:
+                self.logger.exception("EMS state listener failed")
+
+    def ems_state(self) -> EmsState:
+        boiler = self.payloads[self.device_name]
+        state = EmsState(boiler=from_ems(BoilerInfo, boiler, mqtt=True))
+        if self.read_dhw:
+            state.dhw = from_ems(DhwInfo, boiler, mqtt=True)
+        if "thermostat" in self.payloads:
+            state.thermostat = from_ems(
+                ThermostatInfo, self.payloads["thermostat"], mqtt=True, circuit=self.thermostat_circuit
+            )
+        if "mixer" in self.payloads:
+            state.mixers = [
+                from_ems(MixerInfo, self.payloads["mixer"], mqtt=True, circuit=circuit)
+                for circuit in self.mixer_circuits
+            ]
+        return state
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.is_connected = False
@@ -0,0 +1,114 @@
+from datetime import datetime, tzinfo
+from typing import Any, Tuple
+
+import numpy as np
+
+ArrayLike = Any
+
+
+def curve(
+    outside_temperature: ArrayLike,
+    target_room_temperature: ArrayLike,
+    inclination: ArrayLike,
+    parallel_shift: ArrayLike,
+    min_supply_temperature: ArrayLike,
+    max_supply_temperature: ArrayLike,
+) -> np.ndarray:
+    """
+    Supply temperature of the heating curve, rounded to whole degrees and
+    clamped to the min/max supply temperature. All arguments broadcast, so
+    one call can evaluate a whole weather series or many parameter sets.
+    Missing outside temperatures (NaN) stay NaN.
+    """
+    dar = np.subtract(outside_temperature, target_room_temperature)
+    supply_temperature = (
+        target_room_temperature
+        + np.asarray(parallel_shift)
+        - np.asarray(inclination) * dar * (1.4347 + 0.021 * dar + 247.9 * 10**-6 * dar**2)
+    )
+    return np.clip(np.round(supply_temperature), min_supply_temperature, max_supply_temperature)
+
+
+def local_minutes(timestamps: np.ndarray, timezone: tzinfo) -> np.ndarray:
+    """
+    Minutes since local midnight for POSIX timestamps. The UTC offset is looked
+    up once per hour in the series, DST transitions happen on full UTC hours.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    hours, index = np.unique(timestamps // 3600, return_inverse=True)
+    offsets = np.fromiter(
+        (
+            datetime.fromtimestamp(hour * 3600, timezone).utcoffset().total_seconds()  # type: ignore
+            for hour in hours
+        ),
+        dtype=np.float64,
+        count=len(hours),
+    )
+    local = timestamps + offsets[index.reshape(-1)]
+    return ((local % 86400) // 60).astype(np.int64)
+
+
+def is_night(
+    minutes: np.ndarray, day_start_hour: int, day_start_minute: int, day_end_hour: int, day_end_minute: int
+) -> np.ndarray:
+    hour, minute = minutes // 60, minutes % 60
+    # same conditions as HeatingIntegration.calculate_supply_temperature
+    return (
+        (hour < day_start_hour)
+        | (hour > day_end_hour)
+        | ((hour == day_start_hour) & (minute < day_start_minute))
+        | ((hour == day_end_hour) & (minute > day_end_minute))
+    )
+
+
+def target_room_temperatures(timestamps: np.ndarray, state: Any, timezone: tzinfo) -> np.ndarray:
+    night = is_night(
+        local_minutes(timestamps, timezone),
+        state.heating_curve_day_start_hour,
+        state.heating_curve_day_start_minute,
+        state.heating_curve_day_end_hour,
+        state.heating_curve_day_end_minute,
+    )
+    return np.where(
+        night,
+        state.heating_curve_target_night_room_temperature,
+        state.heating_curve_target_room_temperature,
+    )
+
+
+def simulate(timestamps: np.ndarray, outside_temperature: np.ndarray, state: Any, timezone: tzinfo) -> np.ndarray:
+    """
+    Replay an outside temperature series through the heating curve of a
+    `heating.State`, returns the supply temperature for every sample (0 while
+    heating is inactive, like the integration).
+    """
+    if not state.heating_active:
+        return np.zeros(len(timestamps))
+
+    return curve(
+        outside_temperature,
+        target_room_temperatures(timestamps, state, timezone),
+        state.heating_curve_inclination,
+        state.heating_curve_parallel_shift,
+        state.heating_curve_min_supply_temperature,
+        state.heating_curve_max_supply_temperature,
+    )
+
+
+def synthetic_weather(
+    start: float, days: float, step: float = 60, mean: float = 8.0, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Outside temperatures with a seasonal and a daily cycle plus weather noise,
+    roughly central European.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = start + np.arange(int(days * 86400 / step)) * step
+    day = timestamps / 86400
+    # coldest in mid January, warmest in the afternoon
+    seasonal = -9.0 * np.cos(2 * np.pi * (day - 15) / 365.25)
+    daily = -3.5 * np.cos(2 * np.pi * (day % 1 - 0.125))
+    # weather fronts as a smoothed random walk
+    fronts = np.cumsum(rng.normal(0, 0.05 * np.sqrt(step / 60), len(timestamps)))
+    fronts -= np.linspace(fronts[0], fronts[-1], len(fronts))
+    return timestamps, mean + seasonal + daily + fronts
@@ -1 +1,2 @@
 from .integration import HistoryIntegration  # noqa: F401
+from .telegram import HistoryTelegramHandler  # noqa: F401
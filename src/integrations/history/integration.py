@@ -1,6 +1,11 @@
+import asyncio
+import math
+import os
+import time
 from logging import Logger
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 from apscheduler.schedulers.base import BaseScheduler
 from omegaconf import DictConfig
 from telegram.ext import (
@@ -8,6 +13,12 @@ from telegram.ext import (
 )
 
 from src.integrations.base import BaseIntegration, Integration, TelegramHandler
+from src.integrations.esphome import ESPHomeIntegration
+from src.integrations.heating import HeatingIntegration
+from src.integrations.history.utils.query import join, resample, time_grid
+from src.integrations.history.utils.ring_buffer import RingBuffer
+from src.integrations.history.utils.rollups import Aggregates, Rollups, aggregate, combine
+from src.integrations.history.utils.segments import SegmentStore
 
 
 class HistoryIntegration(Integration):
@@ -18,6 +29,11 @@ class HistoryIntegration(Integration):
         integrations: List[BaseIntegration],
         logger: Logger,
         telegram_handler: Optional[Callable[..., TelegramHandler]],
+        retention: int = 24 * 60 * 60,
+        sample_interval: float = 10,
+        entities: Optional[DictConfig] = None,
+        segment_interval: int = 60 * 60,
+        compress_after: Optional[int] = 7 * 24 * 60 * 60,
     ):
         super().__init__(
             config=config,
@@ -27,10 +43,187 @@ class HistoryIntegration(Integration):
             telegram_handler=telegram_handler,
         )
 
-        # scheduler.add_job(self.start)
+        # defaults, can be overridden per entity id in `entities`
+        self.retention = retention
+        self.sample_interval = sample_interval
+        self.entity_config = entities if entities is not None else {}
+
+        self.buffers: Dict[str, RingBuffer] = {}
+        self.rollups: Dict[str, Rollups] = {}
+        # samples older than the in-memory window are rolled into segment files,
+        # `retention` must cover at least `segment_interval` to not lose samples
+        self.store = SegmentStore(os.path.join(config.data_dir, "history"))
+        # segments older than this many seconds are Gorilla compressed, None keeps them raw
+        self.compress_after = compress_after
+
+        scheduler.add_job(self.start)
+        scheduler.add_job(self.roll, "interval", seconds=segment_interval)
+
+    async def start(self):
+        for integration in self.integrations:
+            if isinstance(integration, (ESPHomeIntegration, HeatingIntegration)):
+                integration.add_state_listener(self.record)
+
+    def retention_of(self, entity_id: str) -> Tuple[int, float]:
+        entity_config = self.entity_config.get(entity_id, {})
+        return (
+            entity_config.get("retention", self.retention),
+            entity_config.get("sample_interval", self.sample_interval),
+        )
+
+    def buffer(self, entity_id: str) -> RingBuffer:
+        buffer = self.buffers.get(entity_id)
+        if buffer is None:
+            retention, sample_interval = self.retention_of(entity_id)
+            buffer = RingBuffer(math.ceil(retention / sample_interval))
+            self.buffers[entity_id] = buffer
+            self.logger.info(f"Recording history of {entity_id} ({buffer.capacity} samples)")
+        return buffer
+
+    def rollups_of(self, entity_id: str) -> Rollups:
+        rollups = self.rollups.get(entity_id)
+        if rollups is None:
+            rollups = Rollups()
+            rollups.load(self.rollups_file_name(entity_id))
+            self.rollups[entity_id] = rollups
+        return rollups
+
+    def rollups_file_name(self, entity_id: str) -> str:
+        return os.path.join(self.store.entity(entity_id).directory, "rollups.npz")
+
+    def record(self, entity_id: str, value: float, timestamp: Optional[float] = None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.buffer(entity_id).append(timestamp, value)
+        self.rollups_of(entity_id).add(timestamp, value)
+
+    async def roll(self):
+        for entity_id, buffer in list(self.buffers.items()):
+            segments = self.store.entity(entity_id)
+            timestamps, values = buffer.ordered()
+            if segments.end is not None:
+                rolled = timestamps > segments.end
+                timestamps, values = timestamps[rolled], values[rolled]
+
+            if len(timestamps) > 0:
+                await asyncio.to_thread(segments.append, timestamps, values)
+                self.logger.debug(f"Rolled {len(timestamps)} samples of {entity_id} into a segment")
+
+        if self.compress_after is not None:
+            before = time.time() - self.compress_after
+            for name, segments in list(self.store.entities.items()):
+                compressed = await asyncio.to_thread(segments.compress, before)
+                if compressed:
+                    self.logger.debug(f"Compressed {compressed} segments of {name}")
+
+        for entity_id, rollups in list(self.rollups.items()):
+            await asyncio.to_thread(rollups.save, self.rollups_file_name(entity_id))
+
+    def window(
+        self, entity_id: str, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the samples with `start <= timestamp < end` from the segment
+        files and the in-memory buffer, oldest first. Values only found in
+        segments are float32 views of the memory-mapped files, not copies;
+        `aggregate` and `resample` return float64.
+        """
+        timestamps_parts: List[np.ndarray] = []
+        values_parts: List[np.ndarray] = []
+
+        segments = self.store.get(entity_id)
+        rolled_until = segments.end if segments is not None else None
+        if segments is not None and rolled_until is not None and (start is None or rolled_until >= start):
+            timestamps, values = segments.window(start, end)
+            timestamps_parts.append(timestamps)
+            values_parts.append(values)
+
+        buffer = self.buffers.get(entity_id)
+        if buffer is not None:
+            timestamps, values = buffer.window(start, end)
+            if rolled_until is not None:
+                recent = timestamps > rolled_until
+                timestamps, values = timestamps[recent], values[recent]
+            timestamps_parts.append(timestamps)
+            values_parts.append(values)
+
+        if not timestamps_parts:
+            return np.empty(0), np.empty(0)
+        if len(timestamps_parts) == 1:
+            return timestamps_parts[0], values_parts[0]
+        return np.concatenate(timestamps_parts), np.concatenate(values_parts)
+
+    def aggregate(self, entity_id: str, start: float, end: float, resolution: int) -> Aggregates:
+        """
+        Return min/max/mean/count/last per `resolution` seconds between `start`
+        and `end`, served from the coarsest rollup that fits the resolution and
+        only computed from raw samples if no rollup reaches back to `start`.
+        """
+        rollup = self.rollups_of(entity_id).select(start, resolution)
+        if rollup is not None:
+            return combine(rollup.query(start, end), resolution)
+
+        timestamps, values = self.window(entity_id, start, end)
+        return aggregate(timestamps, values, resolution)
+
+    def resample(
+        self,
+        entity_id: str,
+        start: float,
+        end: float,
+        step: float,
+        method: str = "linear",
+        max_gap: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the series resampled onto the grid `start, start + step, ...`,
+        see `utils.query.resample` for the methods.
+        """
+        grid = time_grid(start, end, step)
+
+        if method == "mean" and float(step).is_integer() and start % step == 0:
+            # grid buckets line up with the rollup buckets, no need to touch raw samples
+            aggregates = self.aggregate(entity_id, start, end, int(step))
+            values = np.full(len(grid), np.nan)
+            index = ((aggregates.start - start) // step).astype(np.int64)
+            inside = (index >= 0) & (index < len(grid))
+            values[index[inside]] = aggregates.mean[inside]
+            return grid, values
+
+        # look back a bit so that the first grid points have a previous sample
+        lookback = max_gap if max_gap is not None else step
+        timestamps, values = self.window(entity_id, start - lookback, end + step)
+        return grid, resample(timestamps, values, grid, method=method, max_gap=max_gap)
+
+    def join(
+        self,
+        entity_ids: Sequence[str],
+        start: float,
+        end: float,
+        step: float,
+        method: str = "linear",
+        max_gap: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Align several entities on a common grid, e.g. the outside temperature
+        reported by the boiler against room temperatures. Returns the grid and
+        a `(len(grid), len(entity_ids))` matrix.
+        """
+        grid = time_grid(start, end, step)
+        if method == "mean":
+            matrix = np.empty((len(grid), len(entity_ids)))
+            for column, entity_id in enumerate(entity_ids):
+                _, matrix[:, column] = self.resample(entity_id, start, end, step, method, max_gap)
+            return grid, matrix
+
+        lookback = max_gap if max_gap is not None else step
+        series = {entity_id: self.window(entity_id, start - lookback, end + step) for entity_id in entity_ids}
+        _, matrix = join(series, grid, method=method, max_gap=max_gap)
+        return grid, matrix
 
     async def register_telegram_commands(self, application: Application) -> None:
         await super().register_telegram_commands(application=application)
 
     async def shutdown(self):
+        await self.roll()
         return await super().shutdown()
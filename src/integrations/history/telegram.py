@@ -0,0 +1,53 @@
+import time
+from logging import Logger
+from typing import List
+
+import numpy as np
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+)
+
+from src.integrations.base import TelegramHandler
+from src.integrations.history import HistoryIntegration
+
+
+class HistoryTelegramHandler(TelegramHandler[HistoryIntegration]):
+    def __init__(self, logger: Logger, integration: HistoryIntegration):
+        self.logger = logger
+        self.integration = integration
+
+    async def command_history(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # optional argument: number of hours to summarize
+        try:
+            hours = int(context.args[0]) if context.args else 24  # type: ignore
+        except (ValueError, IndexError):
+            hours = 0
+        if hours <= 0:
+            await update.message.reply_text("Usage: /history [hours], e.g. /history 48")  # type: ignore
+            return
+        end = time.time()
+        start = end - hours * 60 * 60
+
+        lines: List[str] = []
+        for entity_id in sorted(self.integration.buffers.keys()):
+            aggregates = self.integration.aggregate(entity_id, start, end, 60 * 60)
+            if len(aggregates) == 0:
+                continue
+
+            count = aggregates.count.sum()
+            mean = (aggregates.mean * aggregates.count).sum() / count
+            lines.append(
+                f"📈 {entity_id}: {aggregates.last[-1]:.1f} "
+                f"(min {np.min(aggregates.min):.1f}, mean {mean:.1f}, max {np.max(aggregates.max):.1f})"
+            )
+
+        await update.message.reply_text(  # type: ignore
+            "\n".join([f"Last {hours} hours:"] + lines) if lines else "No history recorded yet!"
+        )
+
+    async def register_telegram_commands(self, application: Application) -> None:
+        application.add_handler(CommandHandler("history", self.command_history))
+        await super().register_telegram_commands(application=application)
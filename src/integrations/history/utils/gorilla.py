@@ -0,0 +1,174 @@
+"""
+Gorilla style compression of (timestamp, value) series, see "Gorilla: A Fast,
+Scalable, In-Memory Time Series Database" (Pelkonen et al., 2015).
+
+Timestamps are stored as milliseconds with delta-of-delta encoding, values as
+the XOR against the previous value, so regularly sampled and slowly changing
+series cost a few bits per sample.
+"""
+import struct
+from typing import Iterable, Iterator, Tuple
+
+_DOUBLE = struct.Struct(">d")
+_UINT64 = struct.Struct(">Q")
+
+# (prefix, prefix length, value bits) for the delta-of-delta ranges
+_DOD_RANGES = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+)
+_DOD_FALLBACK_PREFIX, _DOD_FALLBACK_PREFIX_BITS, _DOD_FALLBACK_BITS = 0b1111, 4, 64
+
+
+def _float_to_bits(value: float) -> int:
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_to_float(bits: int) -> float:
+    return _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+class BitWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+        self._current = 0
+        self._bits = 0
+
+    def write(self, value: int, count: int) -> None:
+        self._current = (self._current << count) | (value & ((1 << count) - 1))
+        self._bits += count
+        while self._bits >= 8:
+            self._bits -= 8
+            self.buffer.append((self._current >> self._bits) & 0xFF)
+        self._current &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._bits == 0:
+            return bytes(self.buffer)
+        return bytes(self.buffer) + bytes([(self._current << (8 - self._bits)) & 0xFF])
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self._position = 0
+        self._current = 0
+        self._bits = 0
+
+    def read(self, count: int) -> int:
+        while self._bits < count:
+            if self._position >= len(self.data):
+                raise EOFError("Unexpected end of compressed block")
+            self._current = (self._current << 8) | self.data[self._position]
+            self._position += 1
+            self._bits += 8
+
+        self._bits -= count
+        value = self._current >> self._bits
+        self._current &= (1 << self._bits) - 1
+        return value
+
+    def read_bit(self) -> int:
+        return self.read(1)
+
+
+def _to_signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def encode(timestamps: Iterable[float], values: Iterable[float]) -> Tuple[int, bytes]:
+    """
+    Compress a series sorted by time, returns the number of samples and the block.
+    """
+    writer = BitWriter()
+    count = 0
+
+    previous_timestamp = previous_delta = 0
+    previous_bits = previous_leading = previous_trailing = 0
+
+    for timestamp, value in zip(timestamps, values):
+        milliseconds = round(timestamp * 1000)
+        bits = _float_to_bits(value)
+
+        if count == 0:
+            writer.write(milliseconds, 64)
+            writer.write(bits, 64)
+            previous_timestamp, previous_bits = milliseconds, bits
+            # force a full leading/length header for the first non-zero XOR
+            previous_leading, previous_trailing = 64, 64
+            count = 1
+            continue
+
+        delta = milliseconds - previous_timestamp
+        delta_of_delta = delta - previous_delta
+        if delta_of_delta == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in _DOD_RANGES:
+                # two's complement range of value_bits, decoded by _to_signed
+                if -(1 << (value_bits - 1)) <= delta_of_delta < 1 << (value_bits - 1):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(delta_of_delta, value_bits)
+                    break
+            else:
+                writer.write(_DOD_FALLBACK_PREFIX, _DOD_FALLBACK_PREFIX_BITS)
+                writer.write(delta_of_delta, _DOD_FALLBACK_BITS)
+        previous_timestamp, previous_delta = milliseconds, delta
+
+        xor = bits ^ previous_bits
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if leading >= previous_leading and trailing >= previous_trailing:
+                # meaningful bits fit into the previous window
+                writer.write(0b10, 2)
+                writer.write(xor >> previous_trailing, 64 - previous_leading - previous_trailing)
+            else:
+                significant = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                # 64 significant bits do not fit into 6 bits and are stored as 0
+                writer.write(significant & 0x3F, 6)
+                writer.write(xor >> trailing, significant)
+                previous_leading, previous_trailing = leading, trailing
+        previous_bits = bits
+        count += 1
+
+    return count, writer.getvalue()
+
+
+def decode(count: int, data: bytes) -> Iterator[Tuple[float, float]]:
+    """
+    Lazily decompress a block created by `encode`, yielding (timestamp, value).
+    """
+    if count == 0:
+        return
+
+    reader = BitReader(data)
+    timestamp = reader.read(64)
+    bits = reader.read(64)
+    yield timestamp / 1000, _bits_to_float(bits)
+
+    delta = 0
+    leading = trailing = 0
+    for _ in range(count - 1):
+        if reader.read_bit():
+            for _, _, value_bits in _DOD_RANGES:
+                if not reader.read_bit():
+                    delta += _to_signed(reader.read(value_bits), value_bits)
+                    break
+            else:
+                delta += _to_signed(reader.read(_DOD_FALLBACK_BITS), _DOD_FALLBACK_BITS)
+        timestamp += delta
+
+        if reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                significant = reader.read(6) or 64
+                trailing = 64 - leading - significant
+            bits ^= reader.read(64 - leading - trailing) << trailing
+
+        yield timestamp / 1000, _bits_to_float(bits)
@@ -0,0 +1,119 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+Series = Tuple[np.ndarray, np.ndarray]
+
+RESAMPLE_METHODS = ("linear", "previous", "mean")
+WINDOW_FUNCTIONS = ("mean", "min", "max", "sum")
+
+
+def time_grid(start: float, end: float, step: float) -> np.ndarray:
+    """
+    Timestamps `start, start + step, ...` up to (excluding) `end`.
+    """
+    return start + np.arange(int(np.ceil((end - start) / step))) * step
+
+
+def resample(
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    grid: np.ndarray,
+    method: str = "linear",
+    max_gap: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Resample a series (sorted by time) onto `grid`. Grid points without data
+    are NaN.
+
+    - linear: interpolate between the surrounding samples
+    - previous: last sample at or before the grid point
+    - mean: mean of the samples in `[grid[i], grid[i + 1])`
+
+    With `max_gap`, linear and previous only use samples that are at most
+    `max_gap` seconds away from the grid point.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(grid), np.nan)
+    if len(timestamps) == 0 or len(grid) == 0:
+        return result
+
+    if method == "mean":
+        step = grid[1] - grid[0] if len(grid) > 1 else np.inf
+        index = np.searchsorted(grid, timestamps, side="right") - 1
+        inside = (index >= 0) & (timestamps < grid[-1] + step)
+        count = np.bincount(index[inside], minlength=len(grid))
+        total = np.bincount(index[inside], weights=values[inside], minlength=len(grid))
+        np.divide(total, count, out=result, where=count > 0)
+        return result
+
+    # index of the last sample at or before each grid point
+    previous = np.searchsorted(timestamps, grid, side="right") - 1
+    has_previous = previous >= 0
+
+    if method == "previous":
+        valid = has_previous
+        if max_gap is not None:
+            valid &= grid - timestamps[np.maximum(previous, 0)] <= max_gap
+        result[valid] = values[previous[valid]]
+        return result
+
+    if method == "linear":
+        following = np.minimum(previous + 1, len(timestamps) - 1)
+        valid = has_previous & (grid <= timestamps[-1])
+        if max_gap is not None:
+            valid &= timestamps[following] - timestamps[np.maximum(previous, 0)] <= max_gap
+        result[valid] = np.interp(grid[valid], timestamps, values)
+        return result
+
+    raise ValueError(f"Unknown resample method {method}, expected one of {RESAMPLE_METHODS}")
+
+
+def rolling(values: np.ndarray, window: int, function: str = "mean") -> np.ndarray:
+    """
+    Trailing window aggregation over a regularly sampled (grid) series,
+    ignoring NaN. The first `window - 1` entries are NaN.
+    """
+    result = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return result
+
+    if function in ("mean", "sum"):
+        # cumulative sums are O(n) regardless of the window size
+        finite = np.isfinite(values)
+        total = np.concatenate(([0.0], np.cumsum(np.where(finite, values, 0.0))))
+        count = np.concatenate(([0], np.cumsum(finite)))
+        window_total = total[window:] - total[:-window]
+        window_count = count[window:] - count[:-window]
+        if function == "sum":
+            result[window - 1 :] = np.where(window_count > 0, window_total, np.nan)
+        else:
+            np.divide(window_total, window_count, out=result[window - 1 :], where=window_count > 0)
+        return result
+
+    if function in ("min", "max"):
+        windows = sliding_window_view(values, window)
+        reduce = np.fmin.reduce if function == "min" else np.fmax.reduce
+        result[window - 1 :] = reduce(windows, axis=1)
+        return result
+
+    raise ValueError(f"Unknown window function {function}, expected one of {WINDOW_FUNCTIONS}")
+
+
+def join(
+    series: Dict[str, Series],
+    grid: np.ndarray,
+    method: str = "linear",
+    max_gap: Optional[float] = None,
+) -> Tuple[Sequence[str], np.ndarray]:
+    """
+    Align several series on a common grid. Returns the series names and a
+    `(len(grid), len(series))` matrix with one column per series.
+    """
+    names = list(series.keys())
+    matrix = np.empty((len(grid), len(names)))
+    for column, name in enumerate(names):
+        timestamps, values = series[name]
+        matrix[:, column] = resample(timestamps, values, grid, method=method, max_gap=max_gap)
+    return names, matrix
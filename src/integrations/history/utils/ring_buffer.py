@@ -0,0 +1,83 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed capacity buffer of (timestamp, value) samples backed by two
+    preallocated float64 arrays. Once full, the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, value: float) -> None:
+        head = self._head
+        self.timestamps[head] = timestamp
+        self.values[head] = value
+
+        head += 1
+        self._head = 0 if head == self.capacity else head
+        if self._size < self.capacity:
+            self._size += 1
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        count = len(timestamps)
+        if count >= self.capacity:
+            # only the newest samples fit
+            self.timestamps[:] = timestamps[-self.capacity :]
+            self.values[:] = values[-self.capacity :]
+            self._head = 0
+            self._size = self.capacity
+            return
+
+        first = min(count, self.capacity - self._head)
+        self.timestamps[self._head : self._head + first] = timestamps[:first]
+        self.values[self._head : self._head + first] = values[:first]
+        self.timestamps[: count - first] = timestamps[first:]
+        self.values[: count - first] = values[first:]
+
+        self._head = (self._head + count) % self.capacity
+        self._size = min(self.capacity, self._size + count)
+
+    def last(self) -> Optional[Tuple[float, float]]:
+        if self._size == 0:
+            return None
+
+        index = self._head - 1
+        return float(self.timestamps[index]), float(self.values[index])
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return copies of all samples, oldest first.
+        """
+        if self._size < self.capacity:
+            return self.timestamps[: self._size].copy(), self.values[: self._size].copy()
+
+        return (
+            np.concatenate((self.timestamps[self._head :], self.timestamps[: self._head])),
+            np.concatenate((self.values[self._head :], self.values[: self._head])),
+        )
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the samples with `start <= timestamp < end`, oldest first.
+        """
+        timestamps, values = self.ordered()
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps < end
+        return timestamps[mask], values[mask]
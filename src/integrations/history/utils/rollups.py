@@ -0,0 +1,213 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# resolution in seconds -> number of buckets kept
+DEFAULT_RESOLUTIONS: Dict[int, int] = {
+    60: 2 * 24 * 60,  # 1m for two days
+    15 * 60: 30 * 24 * 4,  # 15m for a month
+    60 * 60: 90 * 24,  # 1h for three months
+    24 * 60 * 60: 10 * 365,  # 1d for ten years
+}
+
+
+@dataclass
+class Aggregates:
+    # bucket start timestamps, buckets without samples are left out
+    start: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    count: np.ndarray
+    last: np.ndarray
+    resolution: int
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+
+class Rollup:
+    """
+    Streaming min/max/sum/count/last per time bucket of a single resolution.
+    Buckets live in preallocated arrays at slot `bucket number % capacity`, so
+    a sample is folded in with O(1) work and the oldest buckets are reused.
+    """
+
+    FIELDS = ("bucket", "min", "max", "sum", "count", "last", "last_timestamp")
+
+    def __init__(self, resolution: int, capacity: int):
+        self.resolution = resolution
+        self.capacity = capacity
+        # absolute bucket number held by each slot, -1 if unused
+        self.bucket = np.full(capacity, -1, dtype=np.int64)
+        self.min = np.zeros(capacity, dtype=np.float64)
+        self.max = np.zeros(capacity, dtype=np.float64)
+        self.sum = np.zeros(capacity, dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.last = np.zeros(capacity, dtype=np.float64)
+        self.last_timestamp = np.zeros(capacity, dtype=np.float64)
+
+    @property
+    def newest_bucket(self) -> Optional[int]:
+        newest = int(self.bucket.max())
+        return newest if newest >= 0 else None
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """
+        Start of the window of complete data. Slots without samples since a
+        gap can still hold buckets from before the window, they do not count.
+        """
+        used = self.bucket[self.bucket >= 0]
+        if len(used) == 0:
+            return None
+        return float(max(int(used.min()), int(used.max()) - self.capacity + 1) * self.resolution)
+
+    def add(self, timestamp: float, value: float) -> None:
+        bucket = int(timestamp // self.resolution)
+        slot = bucket % self.capacity
+        current = self.bucket[slot]
+
+        if current == bucket:
+            if value < self.min[slot]:
+                self.min[slot] = value
+            if value > self.max[slot]:
+                self.max[slot] = value
+            self.sum[slot] += value
+            self.count[slot] += 1
+            if timestamp >= self.last_timestamp[slot]:
+                self.last[slot] = value
+                self.last_timestamp[slot] = timestamp
+        elif current < bucket:
+            # a new bucket, overwrites one that fell out of the window
+            self.bucket[slot] = bucket
+            self.min[slot] = value
+            self.max[slot] = value
+            self.sum[slot] = value
+            self.count[slot] = 1
+            self.last[slot] = value
+            self.last_timestamp[slot] = timestamp
+        # else: sample is older than the window of this rollup
+
+    def covers(self, start: Optional[float]) -> bool:
+        oldest = self.oldest
+        return oldest is not None and start is not None and start >= oldest
+
+    def query(self, start: float, end: float) -> Aggregates:
+        first, last = int(start // self.resolution), int(np.ceil(end / self.resolution))
+        newest = self.newest_bucket
+        if newest is not None:
+            # only buckets of the window ending at the newest one, stale slots are skipped
+            first, last = max(first, newest - self.capacity + 1), min(last, newest + 1)
+        buckets = np.arange(first, max(first, last), dtype=np.int64)
+        slots = buckets % self.capacity
+        present = self.bucket[slots] == buckets
+        slots = slots[present]
+
+        count = self.count[slots]
+        return Aggregates(
+            start=(buckets[present] * self.resolution).astype(np.float64),
+            min=self.min[slots],
+            max=self.max[slots],
+            mean=self.sum[slots] / count,
+            count=count,
+            last=self.last[slots],
+            resolution=self.resolution,
+        )
+
+
+class Rollups:
+    """
+    A set of rollups of one entity at increasing resolutions.
+    """
+
+    def __init__(self, resolutions: Optional[Dict[int, int]] = None):
+        resolutions = resolutions if resolutions is not None else DEFAULT_RESOLUTIONS
+        self.rollups: Sequence[Rollup] = [
+            Rollup(resolution, capacity) for resolution, capacity in sorted(resolutions.items())
+        ]
+
+    def add(self, timestamp: float, value: float) -> None:
+        for rollup in self.rollups:
+            rollup.add(timestamp, value)
+
+    def select(self, start: float, resolution: int) -> Optional[Rollup]:
+        """
+        Pick the coarsest rollup that is at least as fine as `resolution` and
+        still holds data back to `start`.
+        """
+        for rollup in reversed(self.rollups):
+            if rollup.resolution <= resolution and resolution % rollup.resolution == 0 and rollup.covers(start):
+                return rollup
+        return None
+
+    def save(self, path: str) -> None:
+        arrays = {
+            f"{rollup.resolution}_{field}": getattr(rollup, field) for rollup in self.rollups for field in Rollup.FIELDS
+        }
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> None:
+        if not os.path.exists(path):
+            return
+
+        with np.load(path) as arrays:
+            for rollup in self.rollups:
+                for field in Rollup.FIELDS:
+                    key = f"{rollup.resolution}_{field}"
+                    # skip rollups whose capacity changed, they are rebuilt as samples arrive
+                    if key in arrays and arrays[key].shape == getattr(rollup, field).shape:
+                        setattr(rollup, field, arrays[key])
+
+
+def aggregate(timestamps: np.ndarray, values: np.ndarray, resolution: int) -> Aggregates:
+    """
+    Aggregate raw samples (sorted by time) into buckets of `resolution` seconds.
+    """
+    if len(timestamps) == 0:
+        empty = np.empty(0)
+        return Aggregates(empty, empty, empty, empty, np.empty(0, dtype=np.int64), empty, resolution)
+
+    values = np.asarray(values, dtype=np.float64)
+    buckets = (timestamps // resolution).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    count = np.diff(np.append(starts, len(buckets)))
+
+    return Aggregates(
+        start=(buckets[starts] * resolution).astype(np.float64),
+        min=np.minimum.reduceat(values, starts),
+        max=np.maximum.reduceat(values, starts),
+        mean=np.add.reduceat(values, starts) / count,
+        count=count,
+        last=values[ends],
+        resolution=resolution,
+    )
+
+
+def combine(aggregates: Aggregates, resolution: int) -> Aggregates:
+    """
+    Merge finer aggregates into buckets of `resolution` seconds, which must be
+    a multiple of their resolution.
+    """
+    if len(aggregates) == 0 or resolution == aggregates.resolution:
+        return aggregates
+
+    buckets = (aggregates.start // resolution).astype(np.int64)
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    count = np.add.reduceat(aggregates.count, starts)
+
+    return Aggregates(
+        start=(buckets[starts] * resolution).astype(np.float64),
+        min=np.minimum.reduceat(aggregates.min, starts),
+        max=np.maximum.reduceat(aggregates.max, starts),
+        mean=np.add.reduceat(aggregates.mean * aggregates.count, starts) / count,
+        count=count,
+        last=aggregates.last[ends],
+        resolution=resolution,
+    )
@@ -0,0 +1,222 @@
+import itertools
+import os
+import struct
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.integrations.history.utils import gorilla
+
+MAGIC = b"FSEG"
+COMPRESSED_MAGIC = b"FGOR"
+# magic, sample count, first timestamp, last timestamp
+HEADER = struct.Struct("<4sIdd")
+
+TIMESTAMP_DTYPE = np.dtype("<f8")
+VALUE_DTYPE = np.dtype("<f4")
+
+
+@dataclass
+class Segment:
+    path: str
+    count: int
+    start: float
+    end: float
+    compressed: bool = False
+
+    def overlaps(self, start: Optional[float], end: Optional[float]) -> bool:
+        return (start is None or self.end >= start) and (end is None or self.start < end)
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Memory-map both columns of the segment, nothing is read until accessed.
+        Compressed segments are decoded into memory instead.
+        """
+        if self.compressed:
+            samples = np.fromiter(
+                itertools.chain.from_iterable(self.samples()), dtype=np.float64, count=2 * self.count
+            ).reshape(self.count, 2)
+            return samples[:, 0].copy(), samples[:, 1].astype(VALUE_DTYPE)
+
+        timestamps = np.memmap(self.path, dtype=TIMESTAMP_DTYPE, mode="r", offset=HEADER.size, shape=(self.count,))
+        values = np.memmap(
+            self.path,
+            dtype=VALUE_DTYPE,
+            mode="r",
+            offset=HEADER.size + self.count * TIMESTAMP_DTYPE.itemsize,
+            shape=(self.count,),
+        )
+        return timestamps, values
+
+    def samples(self) -> Iterator[Tuple[float, float]]:
+        """
+        Stream (timestamp, value) pairs of the segment, oldest first.
+        """
+        if not self.compressed:
+            timestamps, values = self.columns()
+            yield from zip(timestamps.tolist(), values.tolist())
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            data = f.read()
+        yield from gorilla.decode(self.count, data)
+
+
+class EntitySegments:
+    """
+    Append-only, immutable segment files of a single entity. Each file holds a
+    float64 timestamp column and a float32 value column behind a small header
+    with the time range, which is all that is read to build the index.
+
+    Segments older than a cutoff can be rewritten with Gorilla compression
+    (`.gor` files), which trades the zero-copy reads for a few bits per sample.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments: List[Segment] = []
+        file_names = set(os.listdir(directory))
+        for file_name in sorted(file_names):
+            stem, extension = os.path.splitext(file_name)
+            if extension == ".seg" and stem + ".gor" in file_names:
+                # compression was interrupted after the atomic write of the .gor file, it has all samples
+                os.remove(os.path.join(directory, file_name))
+                continue
+            if extension in (".seg", ".gor"):
+                segment = self._read_header(os.path.join(directory, file_name))
+                if segment is not None:
+                    self.segments.append(segment)
+        self.segments.sort(key=lambda segment: segment.start)
+
+    @staticmethod
+    def _read_header(path: str) -> Optional[Segment]:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+
+        magic, count, start, end = HEADER.unpack(header)
+        if magic not in (MAGIC, COMPRESSED_MAGIC) or count == 0:
+            return None
+        return Segment(path=path, count=count, start=start, end=end, compressed=magic == COMPRESSED_MAGIC)
+
+    @property
+    def end(self) -> Optional[float]:
+        return self.segments[-1].end if self.segments else None
+
+    def append(self, timestamps: np.ndarray, values: np.ndarray) -> Optional[Segment]:
+        """
+        Seal the given samples (sorted by time) into a new segment file.
+        """
+        count = len(timestamps)
+        if count == 0:
+            return None
+
+        start, end = float(timestamps[0]), float(timestamps[-1])
+        path = os.path.join(self.directory, f"{int(start * 1000):016d}.seg")
+        self._write(
+            path,
+            HEADER.pack(MAGIC, count, start, end),
+            np.ascontiguousarray(timestamps, dtype=TIMESTAMP_DTYPE).tobytes(),
+            np.ascontiguousarray(values, dtype=VALUE_DTYPE).tobytes(),
+        )
+
+        segment = Segment(path=path, count=count, start=start, end=end)
+        self.segments.append(segment)
+        return segment
+
+    def compress(self, before: float) -> int:
+        """
+        Rewrite the raw segments that end before `before` with Gorilla
+        compression. Timestamps are kept at millisecond precision. Returns the
+        number of compressed segments.
+        """
+        compressed = 0
+        for index, segment in enumerate(self.segments):
+            if segment.compressed or segment.end >= before:
+                continue
+
+            timestamps, values = segment.columns()
+            count, data = gorilla.encode(timestamps.tolist(), values.tolist())
+            path = os.path.splitext(segment.path)[0] + ".gor"
+            self._write(path, HEADER.pack(COMPRESSED_MAGIC, count, segment.start, segment.end), data)
+            del timestamps, values
+
+            self.segments[index] = Segment(
+                path=path, count=count, start=segment.start, end=segment.end, compressed=True
+            )
+            os.remove(segment.path)
+            compressed += 1
+        return compressed
+
+    @staticmethod
+    def _write(path: str, *chunks: bytes) -> None:
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def iter_windows(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield zero-copy views of the samples with `start <= timestamp < end`,
+        one per overlapping segment, oldest first.
+        """
+        for segment in self.segments:
+            if not segment.overlaps(start, end):
+                continue
+
+            timestamps, values = segment.columns()
+            first = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+            last = segment.count if end is None else int(np.searchsorted(timestamps, end, side="left"))
+            if first < last:
+                yield timestamps[first:last], values[first:last]
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Float64 timestamps and float32 values, a view if a single segment overlaps.
+        """
+        windows = list(self.iter_windows(start, end))
+        if not windows:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+        if len(windows) == 1:
+            return windows[0]
+        return (
+            np.concatenate([timestamps for timestamps, _ in windows]),
+            np.concatenate([values for _, values in windows]),
+        )
+
+
+def directory_name(entity_id: str) -> str:
+    return entity_id.replace(os.sep, "_")
+
+
+class SegmentStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        # directory name (see `directory_name`) -> segments, the entity ids are not stored on disk
+        self.entities: Dict[str, EntitySegments] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if os.path.isdir(os.path.join(directory, name)):
+                self.entities[name] = EntitySegments(os.path.join(directory, name))
+
+    def get(self, entity_id: str) -> Optional[EntitySegments]:
+        return self.entities.get(directory_name(entity_id))
+
+    def entity(self, entity_id: str) -> EntitySegments:
+        name = directory_name(entity_id)
+        segments = self.entities.get(name)
+        if segments is None:
+            segments = EntitySegments(os.path.join(self.directory, name))
+            self.entities[name] = segments
+        return segments
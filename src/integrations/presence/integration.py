@@ -1,9 +1,9 @@
+import asyncio
 from dataclasses import dataclass
 from datetime import datetime
 from logging import Logger
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Set
 
-import asyncssh
 from apscheduler.schedulers.base import BaseScheduler
 from omegaconf import DictConfig, ListConfig
 from telegram import (
@@ -11,7 +11,14 @@ from telegram import (
 )
 
 from src.integrations.base import BaseIntegration, Integration, TelegramHandler
+from src.integrations.presence.utils.mca_dump import (
+    dump_loop_command,
+    iter_port_tables,
+    iter_station_events,
+    parse_port_table,
+)
 from src.utils.persistant_state import PersistentState
+from src.utils.ssh_connection import SSHConnectionManager, SSHConnectionUnavailable
 
 
 @dataclass
@@ -39,6 +46,10 @@ class PresenceIntegration(Integration):
         username: str,
         password: str,
         devices: ListConfig,
+        streaming: Optional[str] = None,
+        stream_command: Optional[str] = None,
+        stream_interval: float = 1.0,
+        stream_retry_interval: float = 5.0,
     ):
         super().__init__(
             config=config,
@@ -53,16 +64,29 @@ class PresenceIntegration(Integration):
         self.username = username
         self.password = password
         self.devices = devices
+        # None (poll every 60 seconds), "dump" (remote dump loop) or "events" (station event log)
+        self.streaming = streaming
+        self.stream_command = stream_command
+        self.stream_interval = stream_interval
+        self.stream_retry_interval = stream_retry_interval
+        self.ssh = SSHConnectionManager(
+            host=host, username=username, password=password, logger=logger
+        )
 
         self.bot: Optional[Bot] = None
+        # started at the end of `initialize`, the stream needs the state
+        self.stream_task: Optional[asyncio.Task] = None
 
         scheduler.add_job(self.initialize)
-        scheduler.add_job(
-            self.refresh,
-            "interval",
-            seconds=60,
-            next_run_time=datetime.now(scheduler.timezone),
-        )
+        if streaming is None:
+            scheduler.add_job(
+                self.refresh,
+                "interval",
+                seconds=60,
+                next_run_time=datetime.now(scheduler.timezone),
+            )
+        elif streaming not in ("dump", "events"):
+            raise ValueError(f"Unknown presence streaming mode: {streaming}")
         # scheduler.add_job(
         #     self.confirom_home_occupancy,
         #     "interval",
@@ -87,7 +111,7 @@ class PresenceIntegration(Integration):
 
     async def initialize(self):
         self.persistant_state: PersistentState[State] = PersistentState(
-            "presence", self.config.data_dir
+            "presence", self.config.data_dir, backend=self.config.get("state_backend"), logger=self.logger
         )
 
         # default values for heating state
@@ -107,31 +131,104 @@ class PresenceIntegration(Integration):
 
         self.logger.info(f"Initialized presence integration with state: {self.state}")
 
+        if self.streaming is not None:
+            self.stream_task = asyncio.create_task(self.stream())
+
     async def refresh(self):
-        async with asyncssh.connect(
-            self.host, username=self.username, password=self.password
-        ) as connection:
-            for device in self.devices:
-                result = await connection.run(
-                    f'mca-dump | jq ". | {"{port_table}"}" | grep -c "{device.mac}"',
-                    check=False,
-                )
-
-                # this is a hack, but it works
-                # a very insecure hack
-                device_present = eval(str(result.stdout)) >= 1
-                self.logger.info(
-                    f"{device.name} is present: {device_present} | with mac: {device.mac}"
-                )
-
-                # update state
-                for person in self.state.persons:
-                    if person.name == device.name:
-                        person.present = device_present
-                        person.last_seen = datetime.now(self.scheduler.timezone)
+        try:
+            # a single dump per refresh, independent of the number of devices
+            result = await self.ssh.run("mca-dump")
+        except SSHConnectionUnavailable as e:
+            self.logger.warning(f"Skipping presence refresh: {e}")
+            return
+        finally:
+            self.logger.debug(f"SSH connection stats for {self.host}: {self.ssh.stats}")
+
+        if result.exit_status != 0:
+            self.logger.error(f"mca-dump failed with exit status {result.exit_status}: {result.stderr}")
+            return
 
+        try:
+            port_table = parse_port_table(str(result.stdout))
+        except ValueError:
+            self.logger.exception("Failed to parse mca-dump output")
+            return
+
+        self.update_presence(port_table)
         await self.persistant_state.set(self.state)
 
+    def update_presence(self, port_table: Set[str]) -> bool:
+        changed = False
+        for device in self.devices:
+            device_present = str(device.mac).lower() in port_table
+            self.logger.info(
+                f"{device.name} is present: {device_present} | with mac: {device.mac}"
+            )
+            changed |= self.set_person_presence(device.name, device_present)
+
+        return changed
+
+    def set_person_presence(self, name: str, present: bool) -> bool:
+        for person in self.state.persons:
+            if person.name == name:
+                changed = person.present != present
+                person.present = present
+                person.last_seen = datetime.now(self.scheduler.timezone)
+                return changed
+
+        return False
+
+    async def stream(self):
+        if self.streaming == "events":
+            command = self.stream_command or "logread -f"
+        else:
+            command = self.stream_command or dump_loop_command(self.stream_interval)
+
+        while True:
+            try:
+                if self.streaming == "events":
+                    # the event log only reports transitions, seed the state with a full dump first
+                    await self.refresh()
+                    await self.consume_station_events(command)
+                else:
+                    await self.consume_port_tables(command)
+            except SSHConnectionUnavailable as e:
+                self.logger.warning(f"Presence stream interrupted: {e}")
+            except Exception:
+                self.logger.exception("Presence stream failed")
+
+            await asyncio.sleep(self.stream_retry_interval)
+
+    async def consume_port_tables(self, command: str):
+        tracked = {str(device.mac).lower(): device.name for device in self.devices}
+        present: Optional[Set[str]] = None
+
+        async for port_table in iter_port_tables(self.ssh.stream(command)):
+            now_present = {mac for mac in tracked if mac in port_table}
+            # only touch the persons whose presence actually changed
+            changes = tracked.keys() if present is None else now_present ^ present
+            present = now_present
+
+            changed = False
+            for mac in changes:
+                self.logger.info(f"{tracked[mac]} is present: {mac in now_present} | with mac: {mac}")
+                changed |= self.set_person_presence(tracked[mac], mac in now_present)
+
+            if changed:
+                await self.persistant_state.set(self.state)
+
+    async def consume_station_events(self, command: str):
+        tracked = {str(device.mac).lower(): device.name for device in self.devices}
+
+        async for mac, associated in iter_station_events(self.ssh.stream(command)):
+            name = tracked.get(mac)
+            if name is None:
+                continue
+
+            self.logger.info(f"{name} is present: {associated} | with mac: {mac}")
+            if self.set_person_presence(name, associated):
+                await self.persistant_state.set(self.state)
+
     # async def confirom_home_occupancy(self):
     #     # send a telegram message to a configured list of users
     #     # ask them to confirm that they left the house
@@ -149,4 +246,12 @@ class PresenceIntegration(Integration):
     #     return 0
 
     async def shutdown(self):
+        if self.stream_task is not None:
+            self.stream_task.cancel()
+            try:
+                await self.stream_task
+            except asyncio.CancelledError:
+                pass
+        await self.persistant_state.close()
+        await self.ssh.close()
         return await super().shutdown()
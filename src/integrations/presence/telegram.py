@@ -95,8 +95,9 @@ class PresenceTelegramHandler(TelegramHandler[PresenceIntegration]):
     ) -> int:
         query = update.callback_query
         await query.answer()  # type: ignore
-        self.integration.state.vacation_mode = not self.integration.state.vacation_mode
-        await self.integration.persistant_state.set(self.integration.state)
+        await self.integration.persistant_state.update(
+            vacation_mode=not self.integration.state.vacation_mode
+        )
 
         if self.integration.state.vacation_mode:
             await query.edit_message_text(  # type: ignore
@@ -0,0 +1,67 @@
+import re
+from typing import Any, AsyncIterable, AsyncIterator, List, Set, Tuple
+
+import ujson
+
+# printed by the remote dump loop after every dump, see `dump_loop_command`
+DUMP_SEPARATOR = "--- end of mca-dump ---"
+
+STATION_EVENT_PATTERN = re.compile(r"AP-STA-(CONNECTED|DISCONNECTED) ((?:[0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2})")
+
+
+def _collect_strings(node: Any, into: Set[str]) -> None:
+    if isinstance(node, dict):
+        for value in node.values():
+            _collect_strings(value, into)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_strings(value, into)
+    elif isinstance(node, str):
+        into.add(node.lower())
+
+
+def parse_port_table(output: str) -> Set[str]:
+    """
+    Parse the output of `mca-dump` and return an index of every string found
+    in its `port_table` (lowercased), so that a MAC address can be checked for
+    presence with a single set lookup instead of a remote `grep` per device.
+    """
+    dump = ujson.loads(output)
+    if not isinstance(dump, dict):
+        raise ValueError("Unexpected mca-dump output, expected a JSON object")
+
+    index: Set[str] = set()
+    _collect_strings(dump.get("port_table", []), index)
+    return index
+
+
+def dump_loop_command(interval: float) -> str:
+    return f'while true; do mca-dump; echo; echo "{DUMP_SEPARATOR}"; sleep {interval}; done'
+
+
+async def iter_port_tables(lines: AsyncIterable[str]) -> AsyncIterator[Set[str]]:
+    """
+    Incrementally split the output of `dump_loop_command` into single dumps and
+    yield the parsed port table index of each one as soon as it is complete.
+    """
+    buffer: List[str] = []
+    async for line in lines:
+        if line.strip() != DUMP_SEPARATOR:
+            buffer.append(line)
+            continue
+
+        output = "".join(buffer)
+        buffer = []
+        if output.strip():
+            yield parse_port_table(output)
+
+
+async def iter_station_events(lines: AsyncIterable[str]) -> AsyncIterator[Tuple[str, bool]]:
+    """
+    Yield `(mac, associated)` tuples from a hostapd style station event log,
+    e.g. `logread -f` on the access point.
+    """
+    async for line in lines:
+        match = STATION_EVENT_PATTERN.search(line)
+        if match is not None:
+            yield match.group(2).lower(), match.group(1) == "CONNECTED"
@@ -0,0 +1,64 @@
+import time
+from typing import Optional
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. After that a single trial call is let through
+    (half open), its outcome closes the breaker or opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise `CircuitOpen` if the call should not be attempted. Returns True
+        for the trial call of a half-open breaker, its outcome must be recorded
+        or the trial released.
+        """
+        state = self.state
+        if state == "closed":
+            return False
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+
+        remaining = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))  # type: ignore
+        raise CircuitOpen(f"{self.name} is unavailable, retrying in {remaining:.0f} seconds")
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def release_trial(self) -> None:
+        """
+        The trial call ended without an outcome (e.g. it was cancelled), let the next call try.
+        """
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self._trial_running or self.consecutive_failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._trial_running = False
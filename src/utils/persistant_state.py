@@ -1,44 +1,347 @@
-import io
+import asyncio
+import dataclasses
+import logging
 import os
 import pickle
-from typing import TypeVar, Generic
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from logging import Logger
+from typing import Any, Dict, Generic, List, Optional, Set, Tuple, TypeVar
 
 import aiofiles
+import ujson
+
+from src.utils.state_codec import VERSION_KEY, StateCodec, encode_value, read_document, write_document
 
 T = TypeVar("T")
 
+# schema version assumed for state files pickled before `StateCodec` was introduced
+LEGACY_PICKLE_VERSION = 1
+
+
+class StateBackend(ABC):
+    @abstractmethod
+    async def load(self, name: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Return the schema version and the field values of a state, or None if
+        nothing has been stored yet.
+        """
+        pass
+
+    @abstractmethod
+    async def save(self, name: str, version: int, values: Dict[str, Any], changed: Set[str]) -> None:
+        """
+        Persist a state. `values` contains every field value, `changed` the
+        ones that changed since the last save, backends that can store single
+        fields only need to write those.
+        """
+        pass
+
+    def needs_migration(self, name: str) -> bool:
+        """
+        Whether the last `load` of a state read an outdated storage format that
+        the next `save` replaces, regardless of the schema version.
+        """
+        return False
+
+    async def close(self) -> None:
+        pass
+
+
+class FileStateBackend(StateBackend):
+    """
+    One file per state. Writes go to a temporary file that is atomically
+    renamed over the old one, a crash mid-write keeps the old state.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # states loaded from a legacy pickle file, renamed once the new file is written
+        self._legacy: Set[str] = set()
+
+    def file_name(self, name: str) -> str:
+        return os.path.join(self.path, f"state_{name}.state")
+
+    def legacy_file_name(self, name: str) -> str:
+        return os.path.join(self.path, f"state_{name}.pckl")
+
+    async def load(self, name: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        if os.path.exists(self.file_name(name)):
+            async with aiofiles.open(self.file_name(name), "rb") as f:
+                return read_document(await f.read())
+
+        if os.path.exists(self.legacy_file_name(name)):
+            async with aiofiles.open(self.legacy_file_name(name), "rb") as f:
+                obj = pickle.loads(await f.read())
+            self._legacy.add(name)
+            return LEGACY_PICKLE_VERSION, {
+                field.name: encode_value(getattr(obj, field.name)) for field in dataclasses.fields(obj)
+            }
+
+        return None
+
+    async def save(self, name: str, version: int, values: Dict[str, Any], changed: Set[str]) -> None:
+        temp_file_name = self.file_name(name) + ".tmp"
+        async with aiofiles.open(temp_file_name, "wb") as f:
+            await f.write(write_document(version, values))
+            await f.flush()
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, f.fileno())
+        os.replace(temp_file_name, self.file_name(name))
+
+        if name in self._legacy:
+            # kept as a backup, but never read again
+            os.replace(self.legacy_file_name(name), self.legacy_file_name(name) + ".migrated")
+            self._legacy.discard(name)
+
+    def needs_migration(self, name: str) -> bool:
+        return name in self._legacy
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Stores the states of all integrations in a single SQLite database in WAL
+    mode, one row per top-level field. A single writer task batches the pending
+    updates of every integration into one transaction.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self._connection: Optional[sqlite3.Connection] = None
+        # sqlite3 connections must not be used by two threads at the same time
+        self._connection_lock = threading.Lock()
+        # (name, key) -> serialized value, later saves overwrite earlier ones
+        self._pending: Dict[Tuple[str, str], bytes] = {}
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (name, key)"
+                ") WITHOUT ROWID"
+            )
+            self._connection.commit()
+        return self._connection
+
+    def _read(self, name: str) -> Dict[str, bytes]:
+        with self._connection_lock:
+            rows = self._connect().execute("SELECT key, value FROM state WHERE name = ?", (name,))
+            return {key: value for key, value in rows}
+
+    def _write(self, pending: Dict[Tuple[str, str], bytes]) -> None:
+        with self._connection_lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO state (name, key, value) VALUES (?, ?, ?)",
+                    [(name, key, value) for (name, key), value in pending.items()],
+                )
+
+    async def load(self, name: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        rows = await asyncio.to_thread(self._read, name)
+        if not rows:
+            return None
+
+        values = {key: ujson.loads(value) for key, value in rows.items()}
+        return values.pop(VERSION_KEY), values
+
+    async def save(self, name: str, version: int, values: Dict[str, Any], changed: Set[str]) -> None:
+        self._pending[(name, VERSION_KEY)] = ujson.dumps(version).encode()
+        for key in changed:
+            self._pending[(name, key)] = ujson.dumps(values[key]).encode()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        self._wakeup.set()
+
+        await waiter
+
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            pending, self._pending = self._pending, {}
+            waiters, self._waiters = self._waiters, []
+            if not pending and not waiters:
+                continue
+
+            try:
+                await asyncio.to_thread(self._write, pending)
+            except Exception as e:
+                # keep the failed batch unless it has been superseded in the meantime
+                self._pending = {**pending, **self._pending}
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def close(self) -> None:
+        if self._writer is not None and not self._writer.done():
+            # wait for the batch in flight and everything still pending
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self._wakeup.set()
+            await waiter
+            self._writer.cancel()
+
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
 
 class PersistentState(Generic[T]):
-    def __init__(self, name: str, path: str) -> None:
+    """
+    In-memory state persisted through a `StateBackend`. `get` never touches the
+    backend, `set` and `update` only track which fields changed and schedule a
+    debounced save, so bursts of updates end up as a single write.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        flush_delay: float = 1.0,
+        backend: Optional[StateBackend] = None,
+        codec: Optional[StateCodec[T]] = None,
+        logger: Optional[Logger] = None,
+        max_flush_delay: float = 300.0,
+    ) -> None:
         self.name = name
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
         self.path = path
+        self.flush_delay = flush_delay
+        # failed saves are retried with a delay doubling up to this
+        self.max_flush_delay = max_flush_delay
+        self.backend = backend if backend is not None else FileStateBackend(path)
+        # generated from the type of the default state in `initialize` if not given
+        self.codec = codec
         self.initialized: bool = False
 
-    def file_name(self) -> str:
-        return os.path.join(self.path, f"state_{self.name}.pckl")
+        self._value: Optional[T] = None
+        # encoded field values as of the last `set`/`update`, used to detect changes
+        self._snapshot: Dict[str, Any] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        # consecutive failed saves of the delayed flush
+        self._failures = 0
+        self._write_lock = asyncio.Lock()
+
+    @property
+    def is_dirty(self) -> bool:
+        return len(self._dirty) > 0
 
     async def initialize(self, obj: T):
-        if not os.path.exists(self.file_name()):
-            # pickle to file_name
-            async with aiofiles.open(self.file_name(), "wb") as f:
-                await f.write(pickle.dumps(obj))
+        if self.codec is None:
+            self.codec = StateCodec(type(obj))
+
+        stored = await self.backend.load(self.name)
+        if stored is not None:
+            version, values = stored
+            self._value = self.codec.from_values(values, version, default=obj)
+        else:
+            self._value = obj
+        self._snapshot = self.codec.to_values(self._value)
+
+        if stored is None or version != self.codec.version or self.backend.needs_migration(self.name):
+            self._dirty = set(self._snapshot.keys())
+            await self.flush()
+
         self.initialized = True
 
     async def get(self) -> T:
         if not self.initialized:
             raise Exception("You must call `initialize` before using `PersistantState`")
 
-        async with aiofiles.open(self.file_name(), "rb") as f:
-            pickled_bytes = await f.read()
-
-            with io.BytesIO() as f:
-                f.write(pickled_bytes)
-                f.seek(0)
-                return pickle.load(f)
+        return self._value  # type: ignore
 
     async def set(self, obj: T):
         if not self.initialized:
             raise Exception("You must call `initialize` before using `PersistantState`")
 
-        async with aiofiles.open(self.file_name(), "wb") as f:
-            await f.write(pickle.dumps(obj))
+        self._value = obj
+        self._mark_changed(self.codec.to_values(obj))  # type: ignore
+
+    async def update(self, **values: Any):
+        """
+        Change single fields of the state, only these fields are encoded and
+        written by backends that support partial updates.
+        """
+        if not self.initialized:
+            raise Exception("You must call `initialize` before using `PersistantState`")
+
+        for key, value in values.items():
+            setattr(self._value, key, value)
+        self._mark_changed(self.codec.to_values(self._value, values.keys()))  # type: ignore
+
+    def _mark_changed(self, fields: Dict[str, Any]):
+        changed = {key for key, value in fields.items() if self._snapshot.get(key) != value}
+        if not changed:
+            return
+
+        self._snapshot.update(fields)
+        self._dirty |= changed
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # a running flush task may already be past its sleep, `_flush_done` picks up what it missed
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+            self._flush_task.add_done_callback(self._flush_done)
+
+    @property
+    def _next_flush_delay(self) -> float:
+        return min(self.flush_delay * 2**self._failures, self.max_flush_delay)
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self._next_flush_delay)
+        await self.flush()
+
+    def _flush_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self._failures += 1
+            # once per failure streak, e.g. a full disk would otherwise log every few seconds
+            if self._failures == 1:
+                self.logger.error(f"Failed to save state {self.name}, retrying with backoff: {error!r}")
+            else:
+                self.logger.debug(f"Failed to save state {self.name} again, retrying in {self._next_flush_delay}s")
+        elif self._failures > 0:
+            self.logger.info(f"Saved state {self.name} after {self._failures} failed attempts")
+            self._failures = 0
+        # changed while the save was running, or the save failed and the fields are dirty again
+        if self._dirty:
+            self._schedule_flush()
+
+    async def flush(self):
+        async with self._write_lock:
+            if not self._dirty:
+                return
+
+            keys, self._dirty = self._dirty, set()
+            try:
+                await self.backend.save(self.name, self.codec.version, dict(self._snapshot), keys)  # type: ignore
+            except BaseException:
+                self._dirty |= keys
+                raise
+
+    async def close(self):
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
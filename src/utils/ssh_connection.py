@@ -0,0 +1,170 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from logging import Logger
+from typing import AsyncIterator, Optional
+
+import asyncssh
+
+
+class SSHConnectionUnavailable(Exception):
+    pass
+
+
+@dataclass
+class SSHConnectionStats:
+    # number of successful connection attempts, including the first one
+    connects: int = 0
+    # number of connects that replaced a previously established connection
+    reconnects: int = 0
+    # number of commands that were run over an already established connection
+    reuses: int = 0
+    # number of failed connection attempts
+    failures: int = 0
+
+
+class _ConnectionObserver(asyncssh.SSHClient):
+    def __init__(self, manager: "SSHConnectionManager"):
+        self.manager = manager
+        self.connection: Optional[asyncssh.SSHClientConnection] = None
+
+    def connection_made(self, conn: asyncssh.SSHClientConnection) -> None:
+        self.connection = conn
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.manager._on_connection_lost(self.connection, exc)
+
+
+class SSHConnectionManager:
+    """
+    Keeps a single long-lived SSH connection to a host and multiplexes commands
+    over it as separate channels. The connection is kept alive with SSH
+    keepalives and re-established lazily with exponential backoff once it drops.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        username: str,
+        password: str,
+        logger: Logger,
+        keepalive_interval: int = 15,
+        keepalive_count_max: int = 3,
+        max_channels: int = 4,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 300.0,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.logger = logger
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count_max = keepalive_count_max
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+
+        self.stats = SSHConnectionStats()
+
+        self._connection: Optional[asyncssh.SSHClientConnection] = None
+        self._connect_lock = asyncio.Lock()
+        self._channels = asyncio.Semaphore(max_channels)
+        self._consecutive_failures = 0
+        self._next_attempt_at = 0.0
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connection is not None
+
+    def _on_connection_lost(
+        self, connection: Optional[asyncssh.SSHClientConnection], exc: Optional[Exception]
+    ) -> None:
+        if exc is not None:
+            self.logger.warning(f"SSH connection to {self.host} lost: {exc}")
+        if self._connection is connection:
+            self._connection = None
+
+    async def _connect(self) -> asyncssh.SSHClientConnection:
+        now = time.monotonic()
+        if now < self._next_attempt_at:
+            raise SSHConnectionUnavailable(
+                f"Not reconnecting to {self.host} for another {self._next_attempt_at - now:.1f} seconds"
+            )
+
+        try:
+            connection, _ = await asyncssh.create_connection(
+                lambda: _ConnectionObserver(self),
+                self.host,
+                username=self.username,
+                password=self.password,
+                keepalive_interval=self.keepalive_interval,
+                keepalive_count_max=self.keepalive_count_max,
+            )
+        except (OSError, asyncssh.Error) as e:
+            self.stats.failures += 1
+            self._consecutive_failures += 1
+            delay = min(
+                self.backoff_max,
+                self.backoff_initial * 2 ** (self._consecutive_failures - 1),
+            )
+            # add jitter so that several managers do not retry in lockstep
+            delay *= random.uniform(0.5, 1.0)
+            self._next_attempt_at = time.monotonic() + delay
+            raise SSHConnectionUnavailable(
+                f"Could not connect to {self.host}, retrying in {delay:.1f} seconds"
+            ) from e
+
+        if self.stats.connects > 0:
+            self.stats.reconnects += 1
+        self.stats.connects += 1
+        self._consecutive_failures = 0
+        self._next_attempt_at = 0.0
+        self.logger.info(f"Established SSH connection to {self.host} ({self.stats})")
+
+        return connection
+
+    async def connection(self) -> asyncssh.SSHClientConnection:
+        async with self._connect_lock:
+            if self._connection is not None:
+                self.stats.reuses += 1
+                return self._connection
+
+            self._connection = await self._connect()
+            return self._connection
+
+    async def run(self, command: str) -> asyncssh.SSHCompletedProcess:
+        connection = await self.connection()
+
+        async with self._channels:
+            try:
+                return await connection.run(command, check=False)
+            except (asyncssh.ChannelOpenError, asyncssh.ConnectionLost, asyncssh.DisconnectError) as e:
+                # the connection died between two commands, the next call reconnects
+                if self._connection is connection:
+                    self._connection = None
+                raise SSHConnectionUnavailable(f"SSH connection to {self.host} failed: {e}") from e
+
+    async def stream(self, command: str) -> AsyncIterator[str]:
+        """
+        Run a long-lived command and yield its stdout line by line. The command
+        occupies one channel until the consumer stops iterating.
+        """
+        connection = await self.connection()
+
+        async with self._channels:
+            try:
+                async with connection.create_process(command) as process:
+                    async for line in process.stdout:
+                        yield line
+            except (asyncssh.ChannelOpenError, asyncssh.ConnectionLost, asyncssh.DisconnectError) as e:
+                if self._connection is connection:
+                    self._connection = None
+                raise SSHConnectionUnavailable(f"SSH connection to {self.host} failed: {e}") from e
+
+    async def close(self):
+        async with self._connect_lock:
+            if self._connection is not None:
+                connection = self._connection
+                self._connection = None
+                connection.close()
+                await connection.wait_closed()
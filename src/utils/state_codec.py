@@ -0,0 +1,247 @@
+import dataclasses
+import functools
+import struct
+import types
+import typing
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+import ujson
+
+T = TypeVar("T")
+
+MAGIC = b"FTS"
+# magic, uint16 schema version
+HEADER = struct.Struct(f"<{len(MAGIC)}sH")
+# key used to store the schema version next to the fields (e.g. in the SQLite backend)
+VERSION_KEY = "__version__"
+
+Migration = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def encode_value(value: Any) -> Any:
+    """
+    Convert any value to the plain JSON types `StateCodec` produces, without
+    knowing its type up front. Nested dataclasses become lists of their fields.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return [encode_value(getattr(value, field.name)) for field in dataclasses.fields(value)]
+    if isinstance(value, datetime):
+        return _encode_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (list, tuple, set)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    return value
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _isoformat(value: Any) -> Any:
+    return value.isoformat()
+
+
+def _encode_datetime(value: datetime) -> List[Any]:
+    # [POSIX timestamp, UTC offset in seconds or None for naive datetimes], much cheaper than ISO 8601
+    offset = value.utcoffset()
+    return [value.timestamp(), None if offset is None else int(offset.total_seconds())]
+
+
+def _decode_datetime(value: List[Any]) -> datetime:
+    timestamp, offset = value
+    if offset is None:
+        return datetime.fromtimestamp(timestamp)
+    return datetime.fromtimestamp(timestamp, _timezone(offset))
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(offset: int) -> timezone:
+    return timezone(timedelta(seconds=offset))
+
+
+def _field_types(cls: type) -> List[Tuple[dataclasses.Field, Any]]:
+    hints = typing.get_type_hints(cls)
+    return [(field, hints.get(field.name, field.type)) for field in dataclasses.fields(cls)]
+
+
+def _default(field: dataclasses.Field, cls: type) -> Any:
+    if field.default is not dataclasses.MISSING:
+        return field.default
+    if field.default_factory is not dataclasses.MISSING:
+        return field.default_factory()
+    raise ValueError(f"Missing field {field.name} for {cls.__name__}")
+
+
+# `Optional[X]` and `X | None`
+UNION_TYPES = (typing.Union, types.UnionType)
+
+
+def _build_encoder(tp: Any) -> Callable[[Any], Any]:
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+
+    if origin in UNION_TYPES:
+        options = [arg for arg in args if arg is not type(None)]
+        encode = _build_encoder(options[0]) if len(options) == 1 else encode_value
+        if encode is _identity:
+            return _identity
+        return lambda value: None if value is None else encode(value)
+    if origin in (list, set, tuple):
+        encode_item = _build_encoder(args[0]) if args else encode_value
+        if encode_item is _identity:
+            return list
+        return lambda value: [encode_item(item) for item in value]
+    if origin is dict:
+        encode_item = _build_encoder(args[1]) if args else encode_value
+        return lambda value: {str(key): encode_item(item) for key, item in value.items()}
+    if tp in (bool, int, float, str):
+        return _identity
+    if tp is datetime:
+        return _encode_datetime
+    if tp is date:
+        return _isoformat
+    if dataclasses.is_dataclass(tp):
+        encoders = [(field.name, _build_encoder(hint)) for field, hint in _field_types(tp)]
+        return lambda value: [encode(getattr(value, name)) for name, encode in encoders]
+    return encode_value
+
+
+def _build_decoder(tp: Any) -> Callable[[Any], Any]:
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+
+    if origin in UNION_TYPES:
+        options = [arg for arg in args if arg is not type(None)]
+        decode = _build_decoder(options[0]) if len(options) == 1 else _identity
+        return lambda value: None if value is None else decode(value)
+    if origin in (list, set, tuple):
+        decode_item = _build_decoder(args[0]) if args else _identity
+        return lambda value: origin(decode_item(item) for item in value)
+    if origin is dict:
+        decode_item = _build_decoder(args[1]) if args else _identity
+        return lambda value: {key: decode_item(item) for key, item in value.items()}
+    if tp is float:
+        return float
+    if tp is datetime:
+        return _decode_datetime
+    if tp is date:
+        return date.fromisoformat
+    if dataclasses.is_dataclass(tp):
+        return _build_nested_decoder(tp)
+    return _identity
+
+
+def _build_nested_decoder(cls: type) -> Callable[[Any], Any]:
+    # nested dataclasses are stored positionally, trailing fields added later take their defaults
+    fields = [(field, _build_decoder(hint)) for field, hint in _field_types(cls)]
+
+    def decode(value: List[Any]) -> Any:
+        kwargs = {}
+        for index, (field, decode_field) in enumerate(fields):
+            kwargs[field.name] = decode_field(value[index]) if index < len(value) else _default(field, cls)
+        return cls(**kwargs)
+
+    return decode
+
+
+class StateCodec(typing.Generic[T]):
+    """
+    Versioned JSON codec generated from the fields of a state dataclass.
+
+    Top-level fields are encoded individually by name, so backends can store
+    single fields; nested dataclasses are encoded positionally to keep lists of
+    them compact. Stored data carries the schema version it was written with,
+    when loading older data the registered migrations upgrade it one version
+    at a time:
+
+        codec = StateCodec(State, version=2)
+
+        @codec.migration(1)
+        def rename_active(values):
+            values["heating_active"] = values.pop("active")
+            return values
+    """
+
+    def __init__(self, cls: Type[T], version: int = 1):
+        if not dataclasses.is_dataclass(cls):
+            raise TypeError(f"StateCodec requires a dataclass, got {cls}")
+
+        self.cls = cls
+        self.version = version
+        self.migrations: Dict[int, Migration] = {}
+
+        field_types = _field_types(cls)
+        self.fields = {field.name: field for field, _ in field_types}
+        self._encoders = {field.name: _build_encoder(hint) for field, hint in field_types}
+        self._decoders = {field.name: _build_decoder(hint) for field, hint in field_types}
+
+    def migration(self, from_version: int) -> Callable[[Migration], Migration]:
+        def register(migration: Migration) -> Migration:
+            self.migrations[from_version] = migration
+            return migration
+
+        return register
+
+    def to_values(self, obj: T, keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Convert the given (or all) fields of `obj` to plain JSON values.
+        """
+        encoders = self._encoders
+        if keys is None:
+            return {key: encode(getattr(obj, key)) for key, encode in encoders.items()}
+        return {key: encoders[key](getattr(obj, key)) for key in keys}
+
+    def from_values(self, values: Dict[str, Any], version: int, default: Optional[T] = None) -> T:
+        """
+        Build the dataclass from field values written with schema `version`.
+        Fields missing from `values` are taken from `default` or the dataclass defaults.
+        """
+        values = self.migrate({key: value for key, value in values.items() if key != VERSION_KEY}, version)
+
+        kwargs = {}
+        for key, field in self.fields.items():
+            if key in values:
+                kwargs[key] = self._decoders[key](values[key])
+            elif default is not None:
+                kwargs[key] = getattr(default, key)
+            else:
+                kwargs[key] = _default(field, self.cls)
+        return self.cls(**kwargs)
+
+    def migrate(self, values: Dict[str, Any], version: int) -> Dict[str, Any]:
+        if version > self.version:
+            raise ValueError(f"State was written by a newer schema (version {version} > {self.version})")
+
+        while version < self.version:
+            if version not in self.migrations:
+                raise ValueError(f"No migration registered from version {version} of {self.cls.__name__}")
+            values = self.migrations[version](values)
+            version += 1
+        return values
+
+    def encode(self, obj: T) -> bytes:
+        return write_document(self.version, self.to_values(obj))
+
+    def decode(self, data: bytes, default: Optional[T] = None) -> T:
+        version, values = read_document(data)
+        return self.from_values(values, version, default)
+
+
+def write_document(version: int, values: Dict[str, Any]) -> bytes:
+    return HEADER.pack(MAGIC, version) + ujson.dumps(values).encode()
+
+
+def read_document(data: bytes) -> Tuple[int, Dict[str, Any]]:
+    if not is_encoded(data):
+        raise ValueError("Not an encoded state")
+
+    _, version = HEADER.unpack_from(data)
+    return version, ujson.loads(data[HEADER.size :])
+
+
+def is_encoded(data: bytes) -> bool:
+    return data[: len(MAGIC)] == MAGIC
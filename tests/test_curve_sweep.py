@@ -0,0 +1,41 @@
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from src.integrations.heating.utils import curve_sweep
+
+
+def test_failing_pool_releases_shared_memory(monkeypatch):
+    created = []
+    SharedMemory = shared_memory.SharedMemory
+
+    def recording(*args, **kwargs):
+        shared = SharedMemory(*args, **kwargs)
+        created.append(shared.name)
+        return shared
+
+    monkeypatch.setattr(curve_sweep.shared_memory, "SharedMemory", recording)
+
+    candidates = curve_sweep.random_candidates(
+        {
+            "heating_curve_inclination": (0.8, 1.6),
+            "heating_curve_parallel_shift": (-3, 3),
+            "heating_curve_min_supply_temperature": (25, 30),
+            "heating_curve_max_supply_temperature": (45, 55),
+        },
+        8,
+    )
+    inputs = {
+        "timestamps": np.arange(48) * 3600.0,
+        "outside_temperature": np.linspace(-5, 10, 48),
+        "target_room_temperature": np.full(48, 20.0),
+    }
+    # lambdas cannot be sent to the workers, the real error must not be hidden by a BufferError
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        curve_sweep.sweep(candidates, inputs, objectives=[lambda supply, series: 0.0], workers=2, chunk_size=2)
+
+    assert len(created) == 1
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=created[0])
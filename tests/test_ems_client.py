@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+
+import pytest
+from aiohttp import web
+
+from benchmarks.ems_simulator import SimulatedGateway
+from src.integrations.heating import EmsClient, EmsUnavailable
+
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app, handle_signals=False, shutdown_timeout=0.1)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]  # type: ignore
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+def client(url: str) -> EmsClient:
+    return EmsClient(
+        url, "token", "boiler", logging.getLogger("test"), retries=0, failure_threshold=1, reset_timeout=0.05
+    )
+
+
+def test_invalid_json_counts_as_failure_and_half_open_trial_recovers():
+    responses = ["not json", "not json", '{"ok": true}']
+
+    async def handler(request):
+        return web.Response(text=responses.pop(0))
+
+    async def main():
+        runner, url = await serve(handler)
+        boiler = client(url)
+        try:
+            with pytest.raises(EmsUnavailable):
+                await boiler.request("GET", "/api/boiler/info")
+            assert boiler.breaker.state == "open"
+
+            await asyncio.sleep(0.06)
+            # the failing half-open trial opens the breaker again instead of blocking it
+            with pytest.raises(EmsUnavailable):
+                await boiler.request("GET", "/api/boiler/info")
+            await asyncio.sleep(0.06)
+            assert await boiler.request("GET", "/api/boiler/info") == {"ok": True}
+            assert boiler.breaker.state == "closed"
+        finally:
+            await boiler.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_cancelled_half_open_trial_is_released():
+    hang = asyncio.Event()
+
+    async def handler(request):
+        if not hang.is_set():
+            return web.Response(status=500)
+        await asyncio.sleep(3600)
+
+    async def main():
+        runner, url = await serve(handler)
+        boiler = client(url)
+        try:
+            with pytest.raises(EmsUnavailable):
+                await boiler.request("GET", "/api/boiler/info")
+            await asyncio.sleep(0.06)
+
+            hang.set()
+            trial = asyncio.create_task(boiler.request("GET", "/api/boiler/info"))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+            # the next call is let through as a new trial
+            hang.clear()
+            with pytest.raises(EmsUnavailable, match="failed after"):
+                await boiler.request("GET", "/api/boiler/info")
+        finally:
+            await boiler.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_trickling_response_times_out_within_the_limit():
+    async def main():
+        # each 16 byte chunk arrives well within read_timeout, the whole body would take seconds
+        gateway = SimulatedGateway(latency=0, jitter=0, trickle=0.05)
+        url = await gateway.start(port=0)
+        boiler = EmsClient(
+            url, "token", "boiler", logging.getLogger("test"), connect_timeout=0.2, read_timeout=0.3, retries=0
+        )
+        try:
+            start = time.perf_counter()
+            with pytest.raises(EmsUnavailable):
+                await boiler.info()
+            assert time.perf_counter() - start < 0.5 + 0.25
+        finally:
+            await boiler.close()
+            await gateway.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from benchmarks.mqtt_broker import Broker
+from src.integrations.heating import EmsClient, EmsMqttClient, HeatingIntegration
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_unexpected_error_reconnects():
+    async def main():
+        broker = Broker()
+        await broker.start(port=0)
+        port = broker._server.sockets[0].getsockname()[1]  # type: ignore
+        mqtt = EmsMqttClient("127.0.0.1", logging.getLogger("test"), port=port, reconnect_interval=0.01)
+
+        received = []
+        handle = mqtt.handle
+
+        def failing_once(device, payload):
+            if not received:
+                received.append(None)
+                raise RuntimeError("unexpected")
+            received.append(payload)
+            handle(device, payload)
+
+        mqtt.handle = failing_once  # type: ignore
+        mqtt.start()
+        try:
+            await wait_for(lambda: mqtt.is_connected and broker.subscriptions)
+            broker.publish("ems-esp/boiler_data", b"{}")
+            await wait_for(lambda: not mqtt.is_connected)
+
+            # the task survived and subscribed again
+            await wait_for(lambda: mqtt.is_connected and broker.subscriptions)
+            broker.publish("ems-esp/boiler_data", b"{}")
+            await wait_for(lambda: len(received) == 2)
+            assert not mqtt._task.done()  # type: ignore
+        finally:
+            await mqtt.close()
+            await broker.stop()
+
+    asyncio.run(main())
+
+
+def test_falls_back_to_polling_without_aiomqtt(monkeypatch, tmp_path):
+    monkeypatch.setattr(EmsMqttClient, "is_available", staticmethod(lambda: False))
+    logger = logging.getLogger("test")
+    scheduler = AsyncIOScheduler()
+    integration = HeatingIntegration(
+        OmegaConf.create({"data_dir": str(tmp_path)}),
+        scheduler,
+        [],
+        logger,
+        None,
+        EmsClient("http://127.0.0.1/", "token", "boiler", logger),
+        OmegaConf.create({}),
+        mqtt=EmsMqttClient("127.0.0.1", logger),
+    )
+
+    assert integration.mqtt is None
+    assert any(job.func == integration.refresh for job in scheduler.get_jobs())
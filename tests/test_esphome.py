@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from src.integrations.esphome.utils.device import ESPHomeDevice
+from src.integrations.esphome.utils.entity_table import EntityTable
+from src.integrations.esphome.utils.fanout import StateFanout
+
+
+def device(entities, **kwargs) -> ESPHomeDevice:
+    logger = logging.getLogger("test")
+    device = ESPHomeDevice(logger, "127.0.0.1", None, fanout=StateFanout(logger, tick=0.01), **kwargs)
+    for key, (entity_id, kind) in enumerate(entities):
+        row = device.entity_table.register(entity_id, kind)
+        device._rows[key], device._entity_ids[key], device._keys[entity_id] = row, entity_id, key
+    device.is_connected = True
+    return device
+
+
+def push(device: ESPHomeDevice, key: int, state):
+    device.handle_state_change(SimpleNamespace(key=key, state=state, missing_state=False))
+
+
+def test_held_back_change_is_published_after_silence():
+    async def main():
+        plug = device([("plug.power", "sensor"), ("plug.voltage", "sensor")], entity_table=EntityTable(max_hold=0.1))
+        plug.entity_table.set_filter(0, min_interval=0.05)
+        plug.entity_table.set_filter(1, deadband=5.0)
+        received = []
+        plug.fanout.listeners.append(lambda entity_id, value, timestamp: received.append((entity_id, value)))
+
+        push(plug, 0, 100.0)
+        push(plug, 1, 230.0)
+        # within min_interval and within the deadband, then the sensors stay quiet
+        push(plug, 0, 0.0)
+        push(plug, 1, 231.0)
+        await asyncio.sleep(0.03)
+        assert sorted(received) == [("plug.power", 100.0), ("plug.voltage", 230.0)]
+
+        await asyncio.sleep(0.1)
+        assert ("plug.power", 0.0) in received
+        await asyncio.sleep(0.1)
+        assert received[-1] == ("plug.voltage", 231.0)
+        assert len(received) == 4
+
+    asyncio.run(main())
+
+
+class FakeApiClient:
+    def __init__(self):
+        self.sent = []
+
+    def switch_command(self, key, state):
+        self.sent.append((key, state))
+
+
+def relay_device(**kwargs) -> ESPHomeDevice:
+    relay = device([("relay.switch", "switch")], **kwargs)
+    relay.api_client = FakeApiClient()  # type: ignore
+    push(relay, 0, False)
+    return relay
+
+
+def test_back_to_back_commands_are_confirmed_in_order():
+    async def main():
+        relay = relay_device()
+        relay.set_switch("relay.switch", True)
+        await asyncio.sleep(0)
+        relay.set_switch("relay.switch", False)
+        await asyncio.sleep(0)
+        assert relay.api_client.sent == [(0, True), (0, False)]  # type: ignore
+
+        # the confirmation of the first command keeps the state of the second one
+        push(relay, 0, True)
+        assert relay.entity_table.value("relay.switch") == 0.0
+        push(relay, 0, False)
+        assert relay.entity_table.value("relay.switch") == 0.0
+
+        stats = relay.command_stats
+        assert (stats.confirmed, stats.rejected, stats.timed_out) == (2, 0, 0)
+        assert not relay._commands
+
+    asyncio.run(main())
+
+
+def test_unrelated_push_before_the_confirmation_is_no_rejection():
+    async def main():
+        relay = relay_device(command_timeout=0.05)
+        relay.set_switch("relay.switch", True)
+        await asyncio.sleep(0)
+
+        # still the old state, the device has not processed the command yet
+        push(relay, 0, False)
+        assert relay.entity_table.value("relay.switch") == 1.0
+        push(relay, 0, True)
+        assert (relay.command_stats.confirmed, relay.command_stats.rejected) == (1, 0)
+
+        # a device that keeps the old state rejects the command once it times out
+        relay.set_switch("relay.switch", False)
+        await asyncio.sleep(0)
+        push(relay, 0, True)
+        await asyncio.sleep(0.1)
+        assert relay.command_stats.rejected == 1
+        assert relay.entity_table.value("relay.switch") == 1.0
+
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import asyncio
+import logging
+
+from src.integrations.esphome.utils.fanout import StateFanout
+
+
+def test_failing_update_does_not_skip_other_entities():
+    async def main():
+        fanout = StateFanout(logging.getLogger("test"))
+        received = []
+
+        def listener(entity_id, value, timestamp):
+            if entity_id == "sensor.a":
+                raise ValueError("bad value")
+            received.append(entity_id)
+
+        fanout.listeners.append(listener)
+        fanout.listeners.append(lambda entity_id, value, timestamp: received.append(f"second {entity_id}"))
+        for entity_id in ("sensor.a", "sensor.b", "sensor.c"):
+            fanout.publish(entity_id, 1.0, 0.0)
+        fanout.flush()
+
+        assert received == ["sensor.b", "sensor.c", "second sensor.a", "second sensor.b", "second sensor.c"]
+
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import math
+
+import pytest
+
+from src.integrations.history.utils import gorilla
+
+
+def round_trip(timestamps, values):
+    count, data = gorilla.encode(timestamps, values)
+    assert count == len(timestamps)
+    return list(gorilla.decode(count, data))
+
+
+# every delta-of-delta bucket boundary (7, 9 and 12 bit ranges and the 64 bit fallback), in milliseconds
+BOUNDARIES = [
+    delta_of_delta
+    for bits in (7, 9, 12)
+    for edge in (1 << (bits - 1), -(1 << (bits - 1)))
+    for delta_of_delta in (edge - 1, edge, edge + 1)
+] + [1 << 40, -(1 << 40)]
+
+
+@pytest.mark.parametrize("delta_of_delta", BOUNDARIES)
+def test_delta_of_delta_bucket_boundaries(delta_of_delta):
+    # a regular series, one jump by delta_of_delta, then regular again
+    milliseconds = [1_000_000, 1_010_000, 1_020_000]
+    milliseconds.append(milliseconds[-1] + 10_000 + delta_of_delta)
+    milliseconds += [milliseconds[-1] + 10_000 * step for step in range(1, 4)]
+    timestamps = [ms / 1000 for ms in milliseconds]
+    values = [float(index) for index in range(len(timestamps))]
+
+    assert round_trip(timestamps, values) == list(zip(timestamps, values))
+
+
+def test_special_values():
+    values = [1.5, 1.5, -0.0, 0.0, math.inf, -math.inf, 1e-300, 123456.789, math.nan]
+    timestamps = [1_700_000_000 + index * 10.0 for index in range(len(values))]
+    decoded = round_trip(timestamps, values)
+    assert decoded[:-1] == list(zip(timestamps, values[:-1]))
+    assert decoded[-1][0] == timestamps[-1] and math.isnan(decoded[-1][1])
+    assert math.copysign(1, decoded[2][1]) == -1
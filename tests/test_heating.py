@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from src.integrations.heating import HeatingIntegration
+from src.integrations.heating.integration import State
+
+
+class FakeBoiler:
+    device_name = "boiler"
+
+    def __init__(self):
+        self.writes = []
+        self.fail = False
+
+    def write(self, variable, value, observed=None):
+        future = asyncio.get_running_loop().create_future()
+        if observed == value:
+            future.set_result(None)
+            return future
+        self.writes.append(value)
+        # like the client, queued writes finish later
+        if self.fail:
+            asyncio.get_running_loop().call_soon(future.set_exception, OSError("gateway unreachable"))
+        else:
+            asyncio.get_running_loop().call_soon(future.set_result, {"message": "OK"})
+        return future
+
+
+def integration(tmp_path) -> HeatingIntegration:
+    heating = HeatingIntegration(
+        OmegaConf.create({"data_dir": str(tmp_path)}),
+        AsyncIOScheduler(),
+        [],
+        logging.getLogger("test"),
+        None,
+        FakeBoiler(),  # type: ignore
+        OmegaConf.create({}),
+    )
+    heating.state = State(True, 1.1, 0.0, 50, 30, 20.0, 20.0, 6, 0, 22, 0)
+    return heating
+
+
+def boiler_values(heating: HeatingIntegration, selected_flow_temperature: int):
+    heating.last_boiler_info = SimpleNamespace(  # type: ignore
+        outside_temperature=5.0, selected_flow_temperature=selected_flow_temperature
+    )
+
+
+def test_failed_write_is_retried(tmp_path):
+    async def main():
+        heating = integration(tmp_path)
+        heating.boiler.fail = True  # type: ignore
+        boiler_values(heating, 0)
+        heating.recalculate_if_changed()
+        await asyncio.sleep(0.01)
+        assert heating.last_calculated_for is None
+
+        heating.boiler.fail = False  # type: ignore
+        heating.recalculate_if_changed()
+        await asyncio.sleep(0.01)
+        target = heating.target_supply_temperature
+        assert heating.boiler.writes == [target, target]  # type: ignore
+        assert heating.last_calculated_for is not None
+
+    asyncio.run(main())
+
+
+def test_drifted_supply_temperature_is_written_again(tmp_path):
+    async def main():
+        heating = integration(tmp_path)
+        boiler_values(heating, 0)
+        heating.recalculate_if_changed()
+        await asyncio.sleep(0.01)
+        target = heating.target_supply_temperature
+
+        # same inputs and the boiler runs with the target, nothing to do
+        boiler_values(heating, target)
+        heating.recalculate_if_changed()
+        assert heating.boiler.writes == [target]  # type: ignore
+
+        boiler_values(heating, target - 5)
+        heating.recalculate_if_changed()
+        # not queued twice while the write is pending
+        heating.recalculate_if_changed()
+        assert heating.boiler.writes == [target, target]  # type: ignore
+
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from src.integrations.history import HistoryIntegration, HistoryTelegramHandler
+
+
+def test_window_of_segments_is_not_copied(tmp_path):
+    history = HistoryIntegration(
+        OmegaConf.create({"data_dir": str(tmp_path)}), AsyncIOScheduler(), [], logging.getLogger("test"), None
+    )
+    now = time.time()
+    for index in range(10):
+        history.record("sensor", 20.1 + index, now - 100 + index * 10)
+    asyncio.run(history.roll())
+    history.buffers.clear()
+
+    timestamps, values = history.window("sensor")
+    assert len(values) == 10
+    assert values.dtype == np.float32 and isinstance(values.base, np.memmap)
+
+    # query results are float64
+    _, resampled = history.resample("sensor", now - 100, now, 10, method="linear")
+    aggregates = history.aggregate("sensor", now - 100, now, 60)
+    assert resampled.dtype == np.float64 and aggregates.mean.dtype == np.float64
+
+
+class Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+def test_history_command_rejects_invalid_hours(tmp_path):
+    history = HistoryIntegration(
+        OmegaConf.create({"data_dir": str(tmp_path)}), AsyncIOScheduler(), [], logging.getLogger("test"), None
+    )
+    handler = HistoryTelegramHandler(logging.getLogger("test"), history)
+
+    def reply(args):
+        message = Message()
+        asyncio.run(handler.command_history(SimpleNamespace(message=message), SimpleNamespace(args=args)))
+        return message.replies[0]
+
+    assert reply(["abc"]).startswith("Usage")
+    assert reply(["-3"]).startswith("Usage")
+    assert reply(["2"]) == "No history recorded yet!"
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import pickle
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.utils.persistant_state import LEGACY_PICKLE_VERSION, PersistentState, StateBackend
+
+
+@dataclass
+class State:
+    a: int
+
+
+class SlowBackend(StateBackend):
+    def __init__(self, delay: float, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.saved: Optional[Dict[str, Any]] = None
+        self.saves: List[Dict[str, Any]] = []
+        self.attempts: List[float] = []
+
+    async def load(self, name: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        return None
+
+    async def save(self, name: str, version: int, values: Dict[str, Any], changed: Set[str]) -> None:
+        self.attempts.append(asyncio.get_running_loop().time())
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.saved = dict(values)
+        self.saves.append(self.saved)
+
+
+def test_change_during_save_is_flushed():
+    async def main():
+        backend = SlowBackend(delay=0.05)
+        state = PersistentState("test", "", flush_delay=0.01, backend=backend)
+        await state.initialize(State(a=0))
+
+        await state.set(State(a=1))
+        await asyncio.sleep(0.03)  # the delayed flush is inside backend.save now
+        await state.set(State(a=2))
+        await asyncio.sleep(0.2)
+
+        assert backend.saved == {"a": 2}
+        assert not state.is_dirty
+
+    asyncio.run(main())
+
+
+def test_failed_save_is_retried():
+    async def main():
+        backend = SlowBackend(delay=0)
+        state = PersistentState("test", "", flush_delay=0.01, backend=backend)
+        await state.initialize(State(a=0))
+
+        backend.failures = 1
+        await state.update(a=5)
+        await asyncio.sleep(0.1)
+
+        assert backend.saved == {"a": 5}
+        assert not state.is_dirty
+
+    asyncio.run(main())
+
+
+def test_legacy_pickle_is_migrated(tmp_path):
+    async def main():
+        with open(tmp_path / "state_test.pckl", "wb") as f:
+            pickle.dump(State(a=3), f)
+
+        state = PersistentState("test", str(tmp_path))
+        await state.initialize(State(a=0))
+        assert state.codec.version == LEGACY_PICKLE_VERSION  # type: ignore
+
+        assert (await state.get()).a == 3
+        assert (tmp_path / "state_test.state").exists()
+        assert not (tmp_path / "state_test.pckl").exists()
+
+        # read from the new file from now on
+        state = PersistentState("test", str(tmp_path))
+        await state.initialize(State(a=0))
+        assert (await state.get()).a == 3
+
+    asyncio.run(main())
+
+
+def test_failing_saves_back_off_and_log_once(caplog):
+    async def main():
+        backend = SlowBackend(delay=0)
+        state = PersistentState(
+            "test", "", flush_delay=0.01, max_flush_delay=0.04, backend=backend, logger=logging.getLogger("test")
+        )
+        await state.initialize(State(a=0))
+
+        backend.failures = 5
+        await state.update(a=5)
+        await asyncio.sleep(0.35)
+
+        assert backend.saved == {"a": 5}
+        gaps = [later - earlier for earlier, later in zip(backend.attempts[1:], backend.attempts[2:])]
+        # 0.02, 0.04 and then capped
+        assert gaps[0] >= 0.02 and all(gap >= 0.04 for gap in gaps[1:])
+        assert all(gap < 0.08 for gap in gaps)
+
+    with caplog.at_level(logging.INFO, logger="test"):
+        asyncio.run(main())
+    errors = [record for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert "after 5 failed attempts" in caplog.text
@@ -0,0 +1,43 @@
+import asyncio
+import logging
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from src.integrations.presence import PresenceIntegration
+
+
+def test_stream_starts_after_initialize_and_stops_on_shutdown(tmp_path):
+    async def main():
+        scheduler = AsyncIOScheduler()
+        presence = PresenceIntegration(
+            OmegaConf.create({"data_dir": str(tmp_path)}),
+            scheduler,
+            [],
+            logging.getLogger("test"),
+            None,
+            OmegaConf.create({}),
+            "127.0.0.1",
+            "root",
+            "password",
+            OmegaConf.create([{"name": "alice", "mac": "AA:BB:CC:DD:EE:FF"}]),
+            streaming="dump",
+        )
+        assert all(job.func != presence.stream for job in scheduler.get_jobs())
+
+        streamed = []
+
+        async def stream():
+            streamed.append(presence.persons)
+            await asyncio.sleep(3600)
+
+        presence.stream = stream  # type: ignore
+        await presence.initialize()
+        await asyncio.sleep(0)
+        assert [person.name for person in streamed[0]] == ["alice"]
+
+        stream_task = presence.stream_task
+        await presence.shutdown()
+        assert stream_task is not None and stream_task.cancelled()
+
+    asyncio.run(main())
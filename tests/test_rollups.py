@@ -0,0 +1,52 @@
+import logging
+
+import numpy as np
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from omegaconf import OmegaConf
+
+from src.integrations.history import HistoryIntegration
+from src.integrations.history.utils.rollups import Rollups, aggregate
+
+# one sample per minute for 20 minutes, a gap, then one more sample: with ten
+# 1m buckets the slots of minutes 10-14 still hold buckets from before the gap
+MINUTES = list(range(20)) + [25]
+
+
+def samples():
+    timestamps = np.array([minute * 60 + 30.0 for minute in MINUTES])
+    return timestamps, np.array(MINUTES, dtype=np.float64)
+
+
+def test_stale_buckets_do_not_count_as_covered():
+    rollups = Rollups({60: 10})
+    for timestamp, value in zip(*samples()):
+        rollups.add(timestamp, value)
+    rollup = rollups.rollups[0]
+
+    assert rollup.oldest == 16 * 60
+    assert rollups.select(10 * 60, 60) is None
+    assert rollups.select(16 * 60, 60) is rollup
+
+    # buckets before the window are skipped even if their slot was not reused
+    result = rollup.query(0, 26 * 60)
+    assert list(result.start // 60) == [16, 17, 18, 19, 25]
+    assert list(result.mean) == [16, 17, 18, 19, 25]
+
+
+def test_resample_mean_across_ring_wrap(tmp_path):
+    history = HistoryIntegration(
+        OmegaConf.create({"data_dir": str(tmp_path)}), AsyncIOScheduler(), [], logging.getLogger("test"), None
+    )
+    history.rollups["sensor"] = Rollups({60: 10, 300: 10})
+    for timestamp, value in zip(*samples()):
+        history.record("sensor", value, timestamp)
+
+    for start, step in ((10 * 60, 60), (0, 60), (0, 300)):
+        grid, values = history.resample("sensor", start, 26 * 60, step, method="mean")
+
+        timestamps, raw = samples()
+        expected = aggregate(timestamps, raw, step)
+        index = ((expected.start - start) // step).astype(np.int64)
+        inside = (index >= 0) & (index < len(grid))
+        assert np.array_equal(values[index[inside]], expected.mean[inside])
+        assert np.count_nonzero(~np.isnan(values)) == np.count_nonzero(inside)
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+from src.integrations.history.utils.segments import SegmentStore
+
+
+def test_entity_ids_with_separators_survive_a_restart(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    store.entity("boiler/outdoor").append(np.array([1.0, 2.0]), np.array([3.0, 4.0]))
+
+    restarted = SegmentStore(str(tmp_path))
+    segments = restarted.get("boiler/outdoor")
+    assert segments is not None and restarted.entity("boiler/outdoor") is segments
+    assert len(restarted.entities) == 1
+    assert list(segments.window()[1]) == [3.0, 4.0]
+
+
+def test_interrupted_compression_does_not_duplicate_samples(tmp_path):
+    segments = SegmentStore(str(tmp_path)).entity("sensor")
+    segment = segments.append(np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0]))
+    raw = open(segment.path, "rb").read()
+    segments.compress(before=10.0)
+
+    # as if the process died right before removing the raw segment
+    with open(segment.path, "wb") as f:
+        f.write(raw)
+
+    restarted = SegmentStore(str(tmp_path)).entity("sensor")
+    assert [loaded.compressed for loaded in restarted.segments] == [True]
+    assert list(restarted.window()[1]) == [4.0, 5.0, 6.0]
+    assert not os.path.exists(segment.path)
@@ -0,0 +1,29 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.utils.state_codec import StateCodec
+
+
+@dataclass
+class Person:
+    name: str
+    last_seen: datetime | None
+
+
+@dataclass
+class State:
+    seen: datetime | None
+    also_seen: Optional[datetime]
+    persons: List[Person] = field(default_factory=list)
+    nickname: str | None = None
+
+
+def test_pep_604_optional_fields_round_trip():
+    seen = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    state = State(seen=seen, also_seen=seen, persons=[Person("alice", seen), Person("bob", None)])
+    codec = StateCodec(State)
+
+    values = codec.to_values(state)
+    assert values["seen"] == values["also_seen"]
+    assert codec.from_values(values, codec.version) == state